@@ -0,0 +1,139 @@
+"""add db_changes notify triggers
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-18 09:12:41.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more. Rows only carry
+# ids and short columns, but names are unbounded text, so anything above
+# this size is sent as ids only and flagged as truncated.
+MAX_PAYLOAD_BYTES = 7900
+
+
+def upgrade() -> None:
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+        BEGIN
+            IF p_owner_id IS NULL THEN
+                RETURN;
+            END IF;
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'owner_id', p_owner_id,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'owner_id', p_owner_id,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_weights_change() RETURNS trigger AS $$
+        DECLARE
+            rec weights;
+            v_owner_id uuid;
+            ids jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := OLD;
+            ELSE
+                rec := NEW;
+            END IF;
+            SELECT owner_id INTO v_owner_id FROM animals WHERE id = rec.animal_id;
+            ids := jsonb_build_object('id', rec.id, 'animal_id', rec.animal_id);
+            IF TG_OP = 'DELETE' THEN
+                PERFORM notify_db_change(TG_TABLE_NAME, TG_OP, v_owner_id, ids, ids);
+            ELSE
+                PERFORM notify_db_change(
+                    TG_TABLE_NAME, TG_OP, v_owner_id,
+                    ids || jsonb_build_object(
+                        'weight', rec.weight,
+                        'date', rec.date,
+                        'created_at', rec.created_at,
+                        'updated_at', rec.updated_at
+                    ),
+                    ids
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_animals_change() RETURNS trigger AS $$
+        DECLARE
+            rec animals;
+            ids jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := OLD;
+            ELSE
+                rec := NEW;
+            END IF;
+            ids := jsonb_build_object('id', rec.id);
+            IF TG_OP = 'DELETE' THEN
+                PERFORM notify_db_change(TG_TABLE_NAME, TG_OP, rec.owner_id, ids, ids);
+            ELSE
+                PERFORM notify_db_change(
+                    TG_TABLE_NAME, TG_OP, rec.owner_id,
+                    ids || jsonb_build_object(
+                        'name', rec.name,
+                        'owner_id', rec.owner_id,
+                        'created_at', rec.created_at,
+                        'updated_at', rec.updated_at
+                    ),
+                    ids
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE TRIGGER weights_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON weights
+        FOR EACH ROW EXECUTE FUNCTION notify_weights_change();
+    """)
+    op.execute("""
+        CREATE TRIGGER animals_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON animals
+        FOR EACH ROW EXECUTE FUNCTION notify_animals_change();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS animals_notify_change ON animals")
+    op.execute("DROP TRIGGER IF EXISTS weights_notify_change ON weights")
+    op.execute("DROP FUNCTION IF EXISTS notify_animals_change()")
+    op.execute("DROP FUNCTION IF EXISTS notify_weights_change()")
+    op.execute(
+        "DROP FUNCTION IF EXISTS notify_db_change(text, text, uuid, jsonb, jsonb)")
@@ -0,0 +1,125 @@
+"""sequence and dedupe realtime events
+
+Revision ID: 8b4e61d0c2a7
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 11:40:03.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e61d0c2a7'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MAX_PAYLOAD_BYTES = 7900
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE IF NOT EXISTS realtime_event_seq")
+
+    # Every trigger-sourced event now carries a sequence number, and is
+    # skipped when the application already published the change itself in
+    # the same transaction (app/events.py sets app.events_published).
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+            v_seq bigint;
+        BEGIN
+            IF p_owner_id IS NULL
+               OR current_setting('app.events_published', true) = 'on' THEN
+                RETURN;
+            END IF;
+            v_seq := nextval('realtime_event_seq');
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'owner_id', p_owner_id,
+                'seq', v_seq,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'owner_id', p_owner_id,
+                    'seq', v_seq,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # Deferred so they run at commit time, after the application had the
+    # chance to flag the transaction as already published.
+    op.execute("DROP TRIGGER IF EXISTS weights_notify_change ON weights")
+    op.execute("DROP TRIGGER IF EXISTS animals_notify_change ON animals")
+    op.execute("""
+        CREATE CONSTRAINT TRIGGER weights_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON weights
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION notify_weights_change();
+    """)
+    op.execute("""
+        CREATE CONSTRAINT TRIGGER animals_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON animals
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION notify_animals_change();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS weights_notify_change ON weights")
+    op.execute("DROP TRIGGER IF EXISTS animals_notify_change ON animals")
+    op.execute("""
+        CREATE TRIGGER weights_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON weights
+        FOR EACH ROW EXECUTE FUNCTION notify_weights_change();
+    """)
+    op.execute("""
+        CREATE TRIGGER animals_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON animals
+        FOR EACH ROW EXECUTE FUNCTION notify_animals_change();
+    """)
+
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+        BEGIN
+            IF p_owner_id IS NULL THEN
+                RETURN;
+            END IF;
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'owner_id', p_owner_id,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'owner_id', p_owner_id,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    # realtime_event_seq is left in place: it is part of the ORM metadata
+    # and recreated by create_all anyway.
@@ -0,0 +1,73 @@
+"""add weight rollup regression sums
+
+Revision ID: a9e3c7d2b164
+Revises: f4b1d6c3e825
+Create Date: 2026-10-18 19:11:38.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9e3c7d2b164'
+down_revision: Union[str, None] = 'f4b1d6c3e825'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = ("sum_x", "sum_xx", "sum_xy", "sum_yy")
+
+
+def upgrade() -> None:
+    # The app's create_all may already have created the table with them
+    existing = {
+        column["name"]
+        for column in sa.inspect(op.get_bind()).get_columns("weight_rollups")
+    }
+    for name in COLUMNS:
+        if name not in existing:
+            op.add_column("weight_rollups", sa.Column(
+                name, sa.Numeric(), nullable=False, server_default="0"))
+
+    # Backfill every bucket from its readings; x is the reading's time in
+    # days since the Unix epoch, as in app/rollups.py
+    op.execute("""
+        UPDATE weight_rollups AS rollup
+        SET sum_x = sums.sum_x,
+            sum_xx = sums.sum_xx,
+            sum_xy = sums.sum_xy,
+            sum_yy = sums.sum_yy
+        FROM (
+            SELECT rollup.animal_id,
+                   rollup.granularity,
+                   rollup.bucket_start,
+                   sum(point.x) AS sum_x,
+                   sum(point.x * point.x) AS sum_xx,
+                   sum(point.x * weights.weight) AS sum_xy,
+                   sum(weights.weight * weights.weight) AS sum_yy
+            FROM weight_rollups AS rollup
+            JOIN weights
+              ON weights.animal_id = rollup.animal_id
+             AND weights.date >= rollup.bucket_start
+             AND weights.date < (rollup.bucket_start AT TIME ZONE 'UTC' + CASE rollup.granularity
+                     WHEN 'day' THEN interval '1 day'
+                     WHEN 'week' THEN interval '1 week'
+                     ELSE interval '1 month'
+                 END) AT TIME ZONE 'UTC'
+            CROSS JOIN LATERAL (
+                SELECT round(CAST(extract(epoch FROM weights.date) AS numeric) / 86400, 6) AS x
+            ) AS point
+            GROUP BY rollup.animal_id, rollup.granularity, rollup.bucket_start
+        ) AS sums
+        WHERE rollup.animal_id = sums.animal_id
+          AND rollup.granularity = sums.granularity
+          AND rollup.bucket_start = sums.bucket_start
+    """)
+
+
+def downgrade() -> None:
+    for name in reversed(COLUMNS):
+        op.drop_column("weight_rollups", name)
@@ -0,0 +1,160 @@
+"""partition weights by month
+
+Revision ID: b3d8f1a6c472
+Revises: a9e3c7d2b164
+Create Date: 2026-10-18 20:02:45.000000
+
+"""
+from datetime import UTC, date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8f1a6c472'
+down_revision: Union[str, None] = 'a9e3c7d2b164'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Partitions created up front beyond the current month; afterwards
+# app/partitions.py keeps them coming
+MONTHS_AHEAD = 3
+
+WHEN_UNPUBLISHED = (
+    "WHEN (current_setting('app.events_published', true) IS DISTINCT FROM 'on') ")
+
+COLUMNS = "id, animal_id, weight, date, created_at, updated_at"
+
+# Indexes of weights (see d7a3b1e9f264): name, definition
+INDEXES = [
+    ("ix_weights_animal_id_date", "(animal_id, date, id) INCLUDE (weight)"),
+]
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _notify_weights_change(table_name: str) -> None:
+    # Triggers fire on the partitions, whose names mustn't leak into events
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_weights_change() RETURNS trigger AS $$
+        DECLARE
+            rec weights;
+            v_owner_id uuid;
+            ids jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := OLD;
+            ELSE
+                rec := NEW;
+            END IF;
+            SELECT owner_id INTO v_owner_id FROM animals WHERE id = rec.animal_id;
+            ids := jsonb_build_object('id', rec.id, 'animal_id', rec.animal_id);
+            IF TG_OP = 'DELETE' THEN
+                PERFORM notify_db_change({table_name}, TG_OP, v_owner_id, ids, ids);
+            ELSE
+                PERFORM notify_db_change(
+                    {table_name}, TG_OP, v_owner_id,
+                    ids || jsonb_build_object(
+                        'weight', rec.weight,
+                        'date', rec.date,
+                        'created_at', rec.created_at,
+                        'updated_at', rec.updated_at
+                    ),
+                    ids
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def _create_trigger() -> None:
+    op.execute("DROP TRIGGER IF EXISTS weights_notify_change ON weights")
+    op.execute(f"""
+        CREATE CONSTRAINT TRIGGER weights_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON weights
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW {WHEN_UNPUBLISHED}EXECUTE FUNCTION notify_weights_change();
+    """)
+
+
+def _rename_to_old() -> None:
+    op.execute("DROP TRIGGER IF EXISTS weights_notify_change ON weights")
+    op.execute("ALTER TABLE weights RENAME TO weights_old")
+    op.execute("ALTER TABLE weights_old RENAME CONSTRAINT weights_pkey TO weights_old_pkey")
+    op.execute("ALTER INDEX IF EXISTS ix_weights_animal_id_date "
+               "RENAME TO ix_weights_old_animal_id_date")
+
+
+def _create_weights(primary_key: str, partition_by: str = "") -> None:
+    op.execute(f"""
+        CREATE TABLE weights (
+            id uuid NOT NULL,
+            animal_id uuid NOT NULL REFERENCES animals (id),
+            weight numeric(10, 2) NOT NULL,
+            date timestamptz NOT NULL,
+            created_at timestamptz DEFAULT now(),
+            updated_at timestamptz DEFAULT now(),
+            PRIMARY KEY ({primary_key})
+        ){partition_by}
+    """)
+
+
+def _copy_from_old() -> None:
+    op.execute(f"INSERT INTO weights ({COLUMNS}) SELECT {COLUMNS} FROM weights_old")
+    op.execute("DROP TABLE weights_old")
+
+
+def _create_indexes() -> None:
+    # Built on the parent, which cascades them to every partition. That
+    # can't be done CONCURRENTLY; the table is locked for the rebuild anyway
+    for name, definition in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+        op.execute(f"CREATE INDEX {name} ON weights {definition}")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    relkind = bind.scalar(sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('weights')"))
+    # Partitioned already if an earlier version of the app's create_all
+    # made the table
+    if relkind != "p":
+        _rename_to_old()
+        _create_weights("id, date", " PARTITION BY RANGE (date)")
+
+        # A partition for every month with readings and the next few
+        current = datetime.now(UTC).date().replace(day=1)
+        months = {_add_months(current, offset) for offset in range(MONTHS_AHEAD + 1)}
+        months.update(
+            month.date() for month in bind.scalars(sa.text("""
+                SELECT DISTINCT date_trunc('month', date AT TIME ZONE 'UTC')
+                FROM weights_old
+            """))
+        )
+        for month in sorted(months):
+            op.execute(
+                f"CREATE TABLE weights_p{month:%Y%m} PARTITION OF weights "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+                f"TO ('{_add_months(month, 1):%Y-%m-%d} 00:00:00+00')")
+        _copy_from_old()
+    op.execute("CREATE TABLE IF NOT EXISTS weights_default PARTITION OF weights DEFAULT")
+    _create_indexes()
+
+    _notify_weights_change("'weights'")
+    _create_trigger()
+
+
+def downgrade() -> None:
+    _rename_to_old()
+    _create_weights("id")
+    _copy_from_old()
+    _create_indexes()
+    _notify_weights_change("TG_TABLE_NAME")
+    _create_trigger()
@@ -0,0 +1,127 @@
+"""add realtime event log
+
+Revision ID: c5d9e2f4a813
+Revises: 8b4e61d0c2a7
+Create Date: 2026-10-18 14:05:27.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d9e2f4a813'
+down_revision: Union[str, None] = '8b4e61d0c2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MAX_PAYLOAD_BYTES = 7900
+
+
+def upgrade() -> None:
+    # The app's create_all may already have created the table
+    if not sa.inspect(op.get_bind()).has_table("realtime_events"):
+        op.create_table(
+            "realtime_events",
+            sa.Column("seq", sa.BigInteger(), autoincrement=False, nullable=False),
+            sa.Column("user_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("type", sa.String(length=50), nullable=False),
+            sa.Column("data", postgresql.JSONB(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True),
+                      server_default=sa.text("now()"), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("seq"),
+        )
+        op.create_index("ix_realtime_events_user_id_seq",
+                        "realtime_events", ["user_id", "seq"])
+        op.create_index("ix_realtime_events_created_at",
+                        "realtime_events", ["created_at"])
+
+    # Trigger-sourced events are logged for replay like published ones and
+    # carry their final event type
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+            v_seq bigint;
+            v_type text;
+        BEGIN
+            IF p_owner_id IS NULL
+               OR current_setting('app.events_published', true) = 'on' THEN
+                RETURN;
+            END IF;
+            v_type := upper(left(p_table, -1)) || '_' || CASE p_operation
+                WHEN 'INSERT' THEN 'CREATED'
+                WHEN 'UPDATE' THEN 'UPDATED'
+                ELSE 'DELETED'
+            END;
+            INSERT INTO realtime_events (seq, user_id, type, data)
+            VALUES (nextval('realtime_event_seq'), p_owner_id, v_type, p_data)
+            RETURNING seq INTO v_seq;
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'type', v_type,
+                'owner_id', p_owner_id,
+                'seq', v_seq,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'type', v_type,
+                    'owner_id', p_owner_id,
+                    'seq', v_seq,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade() -> None:
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+            v_seq bigint;
+        BEGIN
+            IF p_owner_id IS NULL
+               OR current_setting('app.events_published', true) = 'on' THEN
+                RETURN;
+            END IF;
+            v_seq := nextval('realtime_event_seq');
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'owner_id', p_owner_id,
+                'seq', v_seq,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'owner_id', p_owner_id,
+                    'seq', v_seq,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.drop_index("ix_realtime_events_created_at", table_name="realtime_events")
+    op.drop_index("ix_realtime_events_user_id_seq", table_name="realtime_events")
+    op.drop_table("realtime_events")
@@ -0,0 +1,51 @@
+"""rotate refresh tokens in sessions
+
+Revision ID: c7e4a2d9f318
+Revises: b3d8f1a6c472
+Create Date: 2026-10-18 21:05:12.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e4a2d9f318'
+down_revision: Union[str, None] = 'b3d8f1a6c472'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The app's create_all may already have created the new layout
+    existing = {
+        column["name"]
+        for column in sa.inspect(op.get_bind()).get_columns("sessions")
+    }
+    if "token_hash" in existing:
+        return
+    # Nothing ever wrote plain tokens to the table; any rows are useless
+    op.execute("DELETE FROM sessions")
+    op.drop_column("sessions", "token")
+    op.add_column("sessions", sa.Column(
+        "family_id", postgresql.UUID(as_uuid=True), nullable=False))
+    op.add_column("sessions", sa.Column("token_hash", sa.String(length=64), nullable=False))
+    op.add_column("sessions", sa.Column("used_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("sessions", sa.Column("revoked_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_unique_constraint("sessions_token_hash_key", "sessions", ["token_hash"])
+    op.create_index("ix_sessions_family_id", "sessions", ["family_id"])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM sessions")
+    op.drop_index("ix_sessions_family_id", table_name="sessions")
+    op.drop_constraint("sessions_token_hash_key", "sessions", type_="unique")
+    op.drop_column("sessions", "revoked_at")
+    op.drop_column("sessions", "used_at")
+    op.drop_column("sessions", "token_hash")
+    op.drop_column("sessions", "family_id")
+    op.add_column("sessions", sa.Column("token", sa.String(), nullable=False))
+    op.create_unique_constraint("sessions_token_key", "sessions", ["token"])
@@ -0,0 +1,36 @@
+"""add rate limit buckets
+
+Revision ID: d1f6b8e3a527
+Revises: c7e4a2d9f318
+Create Date: 2026-10-18 21:48:30.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1f6b8e3a527'
+down_revision: Union[str, None] = 'c7e4a2d9f318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The app's create_all may already have created the table
+    if not sa.inspect(op.get_bind()).has_table("rate_limit_buckets"):
+        op.create_table(
+            "rate_limit_buckets",
+            sa.Column("key", sa.Text(), nullable=False),
+            sa.Column("tokens", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.Float(), nullable=False),
+            sa.Column("full_at", sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint("key"),
+            prefixes=["UNLOGGED"],
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_buckets")
@@ -0,0 +1,63 @@
+"""add hot path indexes
+
+Revision ID: d7a3b1e9f264
+Revises: c5d9e2f4a813
+Create Date: 2026-10-18 16:20:44.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3b1e9f264'
+down_revision: Union[str, None] = 'c5d9e2f4a813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# name, table, columns, extra create_index keyword arguments
+INDEXES = [
+    # Weight history of an animal in (date, id) order; INCLUDE keeps chart
+    # reads index-only
+    ("ix_weights_animal_id_date", "weights", ["animal_id", "date", "id"],
+     {"postgresql_include": ["weight"]}),
+    ("ix_animals_owner_id", "animals", ["owner_id"], {}),
+    ("ix_media_filename", "media", ["filename"], {}),
+    # Only users with a pending verification or reset have a token
+    ("ix_users_reset_token", "users", ["reset_token"],
+     {"postgresql_where": sa.text("reset_token IS NOT NULL")}),
+    ("ix_sessions_user_id", "sessions", ["user_id"], {}),
+]
+
+
+def _drop_if_invalid(name: str) -> None:
+    # A failed concurrent build leaves an invalid index behind, which
+    # IF NOT EXISTS would otherwise keep
+    if op.get_context().as_sql:
+        return
+    invalid = op.get_bind().scalar(sa.text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": name})
+    if invalid:
+        op.drop_index(name, postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can't run inside a transaction; the app's create_all
+    # already builds these on a fresh database
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            _drop_if_invalid(name)
+            op.create_index(name, table, columns, if_not_exists=True,
+                            postgresql_concurrently=True, **kwargs)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True,
+                          postgresql_concurrently=True)
@@ -0,0 +1,49 @@
+"""skip change triggers for published writes
+
+Revision ID: e2c8f5a1b937
+Revises: d7a3b1e9f264
+Create Date: 2026-10-18 17:02:13.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c8f5a1b937'
+down_revision: Union[str, None] = 'd7a3b1e9f264'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRIGGERS = [
+    ("weights_notify_change", "weights", "notify_weights_change"),
+    ("animals_notify_change", "animals", "notify_animals_change"),
+]
+
+
+def _create_triggers(when: str) -> None:
+    for name, table, function in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        op.execute(f"""
+            CREATE CONSTRAINT TRIGGER {name}
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW {when}EXECUTE FUNCTION {function}();
+        """)
+
+
+def upgrade() -> None:
+    # WHEN is checked as each row changes: once a transaction has published
+    # its own event (app.events_published, see app/events.py) no trigger
+    # event is even queued, which keeps bulk imports through COPY cheap.
+    # Rows written before the flag is set are still skipped at commit time
+    # by notify_db_change.
+    _create_triggers(
+        "WHEN (current_setting('app.events_published', true) "
+        "IS DISTINCT FROM 'on') ")
+
+
+def downgrade() -> None:
+    _create_triggers("")
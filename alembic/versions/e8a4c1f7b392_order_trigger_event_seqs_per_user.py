@@ -0,0 +1,82 @@
+"""order trigger event seqs per user
+
+Revision ID: e8a4c1f7b392
+Revises: d1f6b8e3a527
+Create Date: 2026-10-19 10:12:44.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a4c1f7b392'
+down_revision: Union[str, None] = 'd1f6b8e3a527'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MAX_PAYLOAD_BYTES = 7900
+
+# Same namespace as app/events.py PUBLISH_LOCK_NAMESPACE
+PUBLISH_LOCK_NAMESPACE = 0x72746576
+
+
+def _create_notify_db_change(lock: str) -> None:
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_db_change(
+            p_table text, p_operation text, p_owner_id uuid, p_data jsonb, p_ids jsonb
+        ) RETURNS void AS $$
+        DECLARE
+            payload text;
+            v_seq bigint;
+            v_type text;
+        BEGIN
+            IF p_owner_id IS NULL
+               OR current_setting('app.events_published', true) = 'on' THEN
+                RETURN;
+            END IF;
+            v_type := upper(left(p_table, -1)) || '_' || CASE p_operation
+                WHEN 'INSERT' THEN 'CREATED'
+                WHEN 'UPDATE' THEN 'UPDATED'
+                ELSE 'DELETED'
+            END;{lock}
+            INSERT INTO realtime_events (seq, user_id, type, data)
+            VALUES (nextval('realtime_event_seq'), p_owner_id, v_type, p_data)
+            RETURNING seq INTO v_seq;
+            payload := json_build_object(
+                'table', p_table,
+                'operation', p_operation,
+                'type', v_type,
+                'owner_id', p_owner_id,
+                'seq', v_seq,
+                'data', p_data
+            )::text;
+            IF octet_length(payload) > {MAX_PAYLOAD_BYTES} THEN
+                payload := json_build_object(
+                    'table', p_table,
+                    'operation', p_operation,
+                    'type', v_type,
+                    'owner_id', p_owner_id,
+                    'seq', v_seq,
+                    'data', p_ids || '{{"truncated": true}}'::jsonb
+                )::text;
+            END IF;
+            PERFORM pg_notify('db_changes', payload);
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def upgrade() -> None:
+    # Trigger-sourced events draw their seq under the owner's publish lock
+    # like published ones (app/events.py), so a user's seqs commit in order
+    # whichever path they come from. The lock is held until commit.
+    _create_notify_db_change(f"""
+            PERFORM pg_advisory_xact_lock(
+                {PUBLISH_LOCK_NAMESPACE}, hashtext(p_owner_id::text));""")
+
+
+def downgrade() -> None:
+    _create_notify_db_change("")
@@ -0,0 +1,79 @@
+"""add weight rollups
+
+Revision ID: f4b1d6c3e825
+Revises: e2c8f5a1b937
+Create Date: 2026-10-18 18:24:51.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b1d6c3e825'
+down_revision: Union[str, None] = 'e2c8f5a1b937'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def upgrade() -> None:
+    # The app's create_all may already have created the table
+    if not sa.inspect(op.get_bind()).has_table("weight_rollups"):
+        op.create_table(
+            "weight_rollups",
+            sa.Column("animal_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("granularity", sa.String(length=5), nullable=False),
+            sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("min", sa.Numeric(10, 2), nullable=False),
+            sa.Column("max", sa.Numeric(10, 2), nullable=False),
+            sa.Column("sum", sa.Numeric(), nullable=False),
+            sa.Column("first_date", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("first_weight", sa.Numeric(10, 2), nullable=False),
+            sa.Column("last_date", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("last_weight", sa.Numeric(10, 2), nullable=False),
+            sa.ForeignKeyConstraint(["animal_id"], ["animals.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("animal_id", "granularity", "bucket_start"),
+        )
+
+    # Backfill from the existing history; buckets are UTC calendar periods,
+    # as computed by app/rollups.py
+    for granularity in GRANULARITIES:
+        op.execute(f"""
+            INSERT INTO weight_rollups (
+                animal_id, granularity, bucket_start, count, min, max, sum,
+                first_date, first_weight, last_date, last_weight
+            )
+            SELECT animal_id,
+                   '{granularity}',
+                   date_trunc('{granularity}', date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                   count(*),
+                   min(weight),
+                   max(weight),
+                   sum(weight),
+                   min(date),
+                   (array_agg(weight ORDER BY date, id))[1],
+                   max(date),
+                   (array_agg(weight ORDER BY date DESC, id DESC))[1]
+            FROM weights
+            GROUP BY 1, 2, 3
+            ON CONFLICT (animal_id, granularity, bucket_start) DO UPDATE SET
+                count = EXCLUDED.count,
+                min = EXCLUDED.min,
+                max = EXCLUDED.max,
+                sum = EXCLUDED.sum,
+                first_date = EXCLUDED.first_date,
+                first_weight = EXCLUDED.first_weight,
+                last_date = EXCLUDED.last_date,
+                last_weight = EXCLUDED.last_weight
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table("weight_rollups")
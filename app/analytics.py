@@ -0,0 +1,225 @@
+import math
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .animal_cache import AnimalCache
+from .websocket import manager
+
+# Fitted forecast lines per (animal, window), dropped on weight events
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "4096"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "900"))
+
+DEFAULT_HALFLIFE_DAYS = 7.0
+# Iglewicz and Hoaglin's cut-off for the modified z-score
+DEFAULT_Z_THRESHOLD = 3.5
+
+# Two-sided 95% quantiles of Student's t for 1 to 30 degrees of freedom;
+# the normal quantile is close enough beyond that
+_T_975 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+)
+_Z_975 = 1.96
+
+SECONDS_PER_DAY = 86400.0
+# Keeps exp() of the decay accumulated inside an EWMA block finite
+_MAX_STEP_DECAY = 200.0
+_BLOCK_DECAY = 250.0
+
+
+def ewma(days: np.ndarray, y: np.ndarray, halflife: float) -> np.ndarray:
+    """Exponentially weighted moving average of an irregular series.
+
+    days must be ascending. A reading's weight halves every `halflife`
+    days, so gaps between readings decay the average accordingly. The
+    recurrence s[i] = s[i-1] * (1 - a[i]) + y[i] * a[i] is unrolled into
+    cumulative sums; the series is cut into blocks whenever the decay
+    accumulated since the block start would overflow exp(), leaving a
+    loop over blocks rather than over readings.
+    """
+    n = len(y)
+    if n == 0:
+        return np.empty(0)
+    decay = np.empty(n)
+    decay[0] = 0.0
+    decay[1:] = np.minimum(np.diff(days) * (math.log(2) / halflife), _MAX_STEP_DECAY)
+    alpha = -np.expm1(-decay)
+    total = np.cumsum(decay)
+
+    smoothed = np.empty(n)
+    smoothed[0] = y[0]
+    blocks = np.floor(total / _BLOCK_DECAY).astype(np.intp)
+    starts = np.flatnonzero(np.diff(blocks, prepend=-1))
+    state = y[0]
+    for start, end in zip(starts, np.append(starts[1:], n)):
+        # Relative to the reading before the block, whose average is known
+        first = max(start, 1)
+        if first >= end:
+            continue
+        reference = total[first - 1]
+        offset = total[first:end] - reference
+        weighted = np.cumsum(alpha[first:end] * y[first:end] * np.exp(offset))
+        smoothed[first:end] = np.exp(-offset) * (state + weighted)
+        state = smoothed[end - 1]
+    return smoothed
+
+
+def robust_z(values: np.ndarray) -> np.ndarray:
+    """Modified z-scores based on the median absolute deviation."""
+    if len(values) == 0:
+        return np.empty(0)
+    deviations = values - np.median(values)
+    mad = np.median(np.abs(deviations))
+    if mad > 0:
+        return 0.6745 * deviations / mad
+    # More than half of the values are identical; scale by the mean
+    # absolute deviation instead
+    mean_ad = np.mean(np.abs(deviations))
+    if mean_ad > 0:
+        return deviations / (1.253314 * mean_ad)
+    return np.zeros(len(values))
+
+
+def analyze(
+    rows: Sequence[Tuple[datetime, Any]],
+    halflife: float = DEFAULT_HALFLIFE_DAYS,
+    threshold: float = DEFAULT_Z_THRESHOLD
+) -> Dict[str, Any]:
+    """Trend and outliers of (date, weight) rows in date order.
+
+    Each reading is compared with the smoothed weight before it; readings
+    whose error has a robust z-score beyond the threshold are reported as
+    sudden gains or losses. The rate of change is the slope of the
+    smoothed series over the last week of readings.
+    """
+    result: Dict[str, Any] = {
+        "count": len(rows),
+        "smoothed": None,
+        "rate_per_week": None,
+        "rate_percent_per_week": None,
+        "anomalies": []
+    }
+    if not rows:
+        return result
+    dates = [row[0] for row in rows]
+    days = np.fromiter(
+        (date.timestamp() for date in dates), dtype=np.float64, count=len(dates)
+    ) / SECONDS_PER_DAY
+    y = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(rows))
+
+    smoothed = ewma(days, y, halflife)
+    scores = np.zeros(0)
+    if len(y) >= 3:
+        # One-step-ahead errors: each reading against the average before
+        # it. Outliers would drag the average and make the readings after
+        # them look off too, so they are replaced by their expected value
+        # and the errors are scored again on the cleaned series.
+        scores = robust_z(y[1:] - smoothed[:-1])
+        outliers = np.abs(scores) > threshold
+        if outliers.any():
+            cleaned = y.copy()
+            cleaned[1:][outliers] = smoothed[:-1][outliers]
+            smoothed = ewma(days, cleaned, halflife)
+            scores = robust_z(y[1:] - smoothed[:-1])
+    result["smoothed"] = float(smoothed[-1])
+
+    # Slope of the smoothed series from the last reading a week or more
+    # before the latest one (or the first reading)
+    week_ago = max(int(np.searchsorted(days, days[-1] - 7.0, side="right")) - 1, 0)
+    span = days[-1] - days[week_ago]
+    if span > 0:
+        rate = (smoothed[-1] - smoothed[week_ago]) / span * 7.0
+        result["rate_per_week"] = float(rate)
+        if smoothed[week_ago] != 0:
+            result["rate_percent_per_week"] = float(rate / smoothed[week_ago] * 100.0)
+
+    for index in np.flatnonzero(np.abs(scores) > threshold):
+        error = y[index + 1] - smoothed[index]
+        result["anomalies"].append({
+            "date": dates[index + 1],
+            "weight": float(y[index + 1]),
+            "expected": float(smoothed[index]),
+            "z": float(scores[index]),
+            "direction": "gain" if error > 0 else "loss"
+        })
+    return result
+
+
+def analyze_many(
+    rows: Sequence[Tuple[Any, datetime, Any]],
+    halflife: float = DEFAULT_HALFLIFE_DAYS,
+    threshold: float = DEFAULT_Z_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """analyze() for (animal_id, date, weight) rows ordered by animal, date."""
+    return [
+        {"animal_id": animal_id, **analyze(
+            [(row[1], row[2]) for row in series], halflife, threshold)}
+        for animal_id, series in groupby(rows, key=itemgetter(0))
+    ]
+
+
+def fit_line(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Least-squares line through readings summarized by app/rollups.py.
+
+    Uses the count and the sums of x, y, x*x, x*y and y*y (x in days since
+    the Unix epoch), so a fit never needs the readings themselves. The
+    centred sums are formed in Decimal, where the large x values cancel
+    exactly. Fewer than three readings, or all at one time, give no fit.
+    """
+    count = summary["count"]
+    fit: Dict[str, Any] = {"count": count, "last_date": summary["last_date"], "slope": None}
+    if count < 3:
+        return fit
+    n = Decimal(count)
+    mean_x = summary["sum_x"] / n
+    mean_y = summary["sum"] / n
+    sxx = summary["sum_xx"] - summary["sum_x"] * mean_x
+    sxy = summary["sum_xy"] - summary["sum_x"] * mean_y
+    syy = summary["sum_yy"] - summary["sum"] * mean_y
+    if sxx <= 0:
+        return fit
+    slope = sxy / sxx
+    residual = max(syy - slope * sxy, Decimal(0))
+    fit.update({
+        "mean_x": float(mean_x),
+        "mean_y": float(mean_y),
+        "sxx": float(sxx),
+        "slope": float(slope),
+        "residual_std": math.sqrt(float(residual) / (count - 2))
+    })
+    return fit
+
+
+def forecast(fit: Dict[str, Any], weeks: int) -> List[Dict[str, Any]]:
+    """Weekly projections after the last reading with 95% prediction bands."""
+    if fit["slope"] is None:
+        return []
+    last_date: datetime = fit["last_date"]
+    last_x = last_date.timestamp() / SECONDS_PER_DAY
+    steps = np.arange(1, weeks + 1)
+    x = last_x + 7.0 * steps
+    predicted = fit["mean_y"] + fit["slope"] * (x - fit["mean_x"])
+    df = fit["count"] - 2
+    quantile = _T_975[df - 1] if df <= len(_T_975) else _Z_975
+    half_width = quantile * fit["residual_std"] * np.sqrt(
+        1 + 1 / fit["count"] + (x - fit["mean_x"]) ** 2 / fit["sxx"])
+    return [
+        {
+            "date": last_date + timedelta(weeks=int(step)),
+            "weight": float(value),
+            "lower": float(max(value - width, 0.0)),
+            "upper": float(value + width)
+        }
+        for step, value, width in zip(steps, predicted, half_width)
+    ]
+
+
+fit_cache = AnimalCache(FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL)
+manager.add_listener(fit_cache.on_event)
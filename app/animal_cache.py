@@ -0,0 +1,93 @@
+"""Per-worker caches of results computed from an animal's weights."""
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from .websocket import event_animal_ids
+
+
+class AnimalCache:
+    """LRU of per-animal results, invalidated per animal on weight events.
+
+    A result computed from rows read before an invalidation must not be
+    stored after it: callers take generation() before reading and hand it
+    to put(), which drops the result if the animal was invalidated since.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_animal: Dict[str, Set[Hashable]] = {}
+        # Counts invalidations; animal -> count at its latest one, for the
+        # most recently invalidated animals. Animals dropped from there
+        # count as invalidated at _floor.
+        self._generation = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._floor = 0
+
+    def generation(self) -> int:
+        """Token for put(), taken before reading what gets cached."""
+        return self._generation
+
+    def get(self, animal_id: uuid.UUID, *params: Hashable) -> Optional[Any]:
+        key = (str(animal_id),) + params
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(
+        self,
+        animal_id: uuid.UUID,
+        *params: Hashable,
+        value: Any,
+        generation: int
+    ) -> None:
+        key = (str(animal_id),) + params
+        if self._invalidated.get(key[0], self._floor) > generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._keys_by_animal.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, animal_id: str) -> None:
+        animal_id = str(animal_id)
+        self._generation += 1
+        self._invalidated[animal_id] = self._generation
+        self._invalidated.move_to_end(animal_id)
+        while len(self._invalidated) > self.max_entries:
+            _, self._floor = self._invalidated.popitem(last=False)
+        for key in self._keys_by_animal.pop(animal_id, ()):
+            self._entries.pop(key, None)
+
+    def invalidate_all(self) -> None:
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
+        self._entries.clear()
+        self._keys_by_animal.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_animal.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_animal[key[0]]
+
+    def on_event(self, user_id: str, message: Dict[str, Any]) -> None:
+        if str(message.get("type")).startswith(("WEIGHT", "ANIMAL_DELETED")):
+            animal_ids = event_animal_ids(message)
+            if animal_ids is None:
+                self.invalidate_all()
+                return
+            for animal_id in animal_ids:
+                self.invalidate(animal_id)
@@ -9,7 +9,8 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from . import models, schemas
-from .database import get_db, SessionLocal
+from .database import AnySession, async_session_scope, get_async_db
+from .principals import principal_cache
 
 load_dotenv()
 
@@ -38,7 +39,7 @@ def create_access_token(
 
 async def get_current_user(
     security_credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ) -> models.User:
     """Get the current authenticated user."""
     credentials_exception = HTTPException(
@@ -48,7 +49,7 @@ async def get_current_user(
     )
     try:
         token = security_credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = principal_cache.decode(token, SECRET_KEY, [ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -56,8 +57,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(
-        models.User.username == token_data.username).first()
+    user = await principal_cache.get_user(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -66,19 +66,14 @@ async def get_current_user(
 async def get_current_user_ws(token: str) -> Optional[models.User]:
     """Get the current authenticated user for WebSocket connections."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = principal_cache.decode(token, SECRET_KEY, [ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return None
 
         # Create a new database session
-        db = SessionLocal()
-        try:
-            user = db.query(models.User).filter(
-                models.User.username == username).first()
-            return user
-        finally:
-            db.close()
+        async with async_session_scope() as db:
+            return await principal_cache.get_user(db, username)
     except JWTError:
         return None
 
@@ -0,0 +1,70 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .animal_cache import AnimalCache
+from .websocket import manager
+
+# Downsampled series kept per (animal, range, resolution); entries also
+# expire after a while in case an invalidating event was missed
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "1024"))
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", "300"))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points Largest-Triangle-Three-Buckets keeps.
+
+    x must be ascending. The first and last points are always kept; the
+    others are split into threshold - 2 buckets and from each the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket is chosen. Every bucket is evaluated with
+    array operations, only the walk from bucket to bucket is a loop since
+    each choice depends on the previous one.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries over the points between the first and the last
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.intp)
+    # Averages of every bucket, with the last point as the final "bucket"
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[n - 1])
+    avg_y = np.append(sums_y / sizes, y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        # Twice the triangle areas; the constant factor doesn't change argmax
+        areas = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[bucket + 1] = a
+    return selected
+
+
+def downsample(rows: Sequence[Tuple[datetime, Any]], points: int) -> List[Dict[str, Any]]:
+    """Reduce (date, weight) rows in date order to at most `points` points."""
+    if not rows:
+        return []
+    dates = [row[0] for row in rows]
+    x = np.fromiter((date.timestamp() for date in dates), dtype=np.float64, count=len(dates))
+    y = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(rows))
+    return [
+        {"date": dates[index], "weight": float(y[index])}
+        for index in lttb(x, y, points)
+    ]
+
+
+chart_cache = AnimalCache(CHART_CACHE_SIZE, CHART_CACHE_TTL)
+manager.add_listener(chart_cache.on_event)
@@ -1,10 +1,16 @@
+import csv
+import io
 import os
-from typing import Generator
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Generator, Sequence, Tuple, Union
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
@@ -16,14 +22,157 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "pet_weight_db")
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+# Set USE_ASYNC_DB=false to run the routers on the blocking psycopg2 engine
+# (each call is pushed to the threadpool) while the async path is rolled out.
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "true").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
 # Database engine and session configuration
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+class SyncSessionAdapter:
+    """Expose a sync Session through the awaitable AsyncSession API.
+
+    Every database round-trip runs in the threadpool so the event loop is
+    never blocked, which lets the routers be written once against the
+    AsyncSession interface regardless of USE_ASYNC_DB.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @property
+    def info(self) -> dict:
+        return self.sync_session.info
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    def expunge(self, instance) -> None:
+        self.sync_session.expunge(instance)
+
+    async def execute(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kw)
+
+    async def scalar(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kw)
+
+    async def scalars(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kw)
+
+    async def stream(self, statement, params=None, **kw):
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kw)
+        return SyncStreamResult(result)
+
+    async def get(self, entity, ident, **kw):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kw)
+
+    async def merge(self, instance, load: bool = True, **kw):
+        return await run_in_threadpool(self.sync_session.merge, instance, load=load, **kw)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None) -> None:
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def run_sync(self, fn, *args, **kw):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kw)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+class SyncStreamResult:
+    """The part of AsyncResult used for streaming, over a sync Result.
+
+    Combined with the yield_per execution option psycopg2 reads through a
+    server-side cursor; each batch is fetched in the threadpool.
+    """
+
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size=None):
+        while True:
+            rows = await run_in_threadpool(self._result.fetchmany, size)
+            if not rows:
+                return
+            yield rows
+
+    async def close(self) -> None:
+        await run_in_threadpool(self._result.close)
+
+
+AnySession = Union[AsyncSession, SyncSessionAdapter]
+
+
+def copy_records(
+    session: Session,
+    table_name: str,
+    columns: Sequence[str],
+    records: Sequence[Tuple[Any, ...]]
+) -> None:
+    """Bulk load rows with COPY in the session's current transaction.
+
+    Meant for ``await db.run_sync(copy_records, ...)``, which works with
+    both session flavours: on asyncpg the binary COPY protocol is driven
+    from the run_sync greenlet, on psycopg2 the rows are streamed as CSV.
+    Other databases fall back to a multi-row INSERT.
+    """
+    connection = session.connection()
+    driver = connection.dialect.driver
+    if driver == "asyncpg":
+        raw = connection.connection.driver_connection
+        await_only(raw.copy_records_to_table(
+            table_name, records=records, columns=list(columns)))
+    elif driver == "psycopg2":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(records)
+        buffer.seek(0)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer)
+    else:
+        connection.execute(
+            insert(Base.metadata.tables[table_name]),
+            [dict(zip(columns, record)) for record in records])
+
+
 def get_db() -> Generator[Session, None, None]:
     """Dependency for getting database session."""
     db = SessionLocal()
@@ -31,3 +180,30 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AnySession, None]:
+    """Dependency for getting a non-blocking database session."""
+    if USE_ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SyncSessionAdapter(SessionLocal(expire_on_commit=False))
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+# Context-manager flavour of get_async_db for code running outside a request
+# (WebSocket handshakes, background tasks).
+async_session_scope = asynccontextmanager(get_async_db)
+
+
+def get_session_scope():
+    """Dependency for a session factory usable after the endpoint returns.
+
+    Streaming response bodies are produced after the request's own
+    dependencies have been closed, so they open their session from this.
+    """
+    return async_session_scope
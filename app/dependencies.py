@@ -1,12 +1,12 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from jose import JWTError
 from datetime import datetime, UTC
 import os
 from dotenv import load_dotenv
 
-from .database import get_db
+from .database import AnySession, get_async_db
+from .principals import principal_cache
 from . import models
 
 load_dotenv()
@@ -20,7 +20,7 @@ security = HTTPBearer()
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ) -> models.User:
     """Get the current authenticated user."""
     credentials_exception = HTTPException(
@@ -30,7 +30,7 @@ async def get_current_user(
     )
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = principal_cache.decode(token, SECRET_KEY, [ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -49,8 +49,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(
-        models.User.username == username).first()
+    user = await principal_cache.get_user(db, username)
     if user is None:
         raise credentials_exception
 
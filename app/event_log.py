@@ -0,0 +1,140 @@
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select, text
+
+from . import models
+from .database import async_session_scope
+
+logger = logging.getLogger(__name__)
+
+
+class _UserLog:
+    __slots__ = ("floor", "events")
+
+    def __init__(self, floor: int):
+        # Events with seq <= floor may be missing from this buffer
+        self.floor = floor
+        self.events: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+
+class EventLog:
+    """Recently published realtime events, kept per user.
+
+    The in-memory ring buffers answer most reconnects and double as the
+    de-duplication window; the realtime_events table covers everything
+    still inside the retention period.
+    """
+
+    def __init__(self, buffer_size: int, max_users: int):
+        self.buffer_size = buffer_size
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserLog]" = OrderedDict()
+        # Everything up to this seq may have been missed by this worker
+        # (before it started listening, or while the LISTEN link was down)
+        self._floor = 0
+
+    def raise_floor(self, seq: int) -> None:
+        self._floor = max(self._floor, seq)
+
+    def record(self, user_id: str, message: Dict[str, Any]) -> bool:
+        """Remember an event; return False if it was already recorded."""
+        seq = message.get("seq")
+        if seq is None:
+            return True
+
+        log = self._users.get(user_id)
+        if log is None:
+            log = self._users[user_id] = _UserLog(self._floor)
+            if len(self._users) > self.max_users:
+                _, evicted = self._users.popitem(last=False)
+                if evicted.events:
+                    self.raise_floor(max(evicted.events))
+        else:
+            self._users.move_to_end(user_id)
+
+        if seq in log.events:
+            return False
+        log.events[seq] = message
+        if len(log.events) > self.buffer_size:
+            dropped_seq, _ = log.events.popitem(last=False)
+            log.floor = max(log.floor, dropped_seq)
+        return True
+
+    def since(self, user_id: str, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """Events after last_seq from memory, or None if memory can't tell."""
+        log = self._users.get(user_id)
+        floor = max(self._floor, log.floor if log else 0)
+        if last_seq < floor:
+            return None
+        if log is None:
+            return []
+        return sorted(
+            (message for seq, message in log.events.items() if seq > last_seq),
+            key=lambda message: message["seq"]
+        )
+
+    async def load_since(
+        self,
+        user_id: str,
+        last_seq: int,
+        limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Events after last_seq from the database.
+
+        Returns None when some of them were already pruned or there are
+        more than ``limit``; the client then has to resync.
+        """
+        async with async_session_scope() as db:
+            horizon = await db.scalar(select(func.min(models.RealtimeEvent.seq)))
+            if horizon is None:
+                # Nothing retained: only fine if nothing happened since
+                last_value = await db.scalar(
+                    text("SELECT last_value FROM realtime_event_seq"))
+                return [] if last_seq >= last_value else None
+            if last_seq < horizon - 1:
+                return None
+
+            result = await db.execute(
+                select(
+                    models.RealtimeEvent.seq,
+                    models.RealtimeEvent.type,
+                    models.RealtimeEvent.data
+                ).filter(
+                    models.RealtimeEvent.user_id == uuid.UUID(user_id),
+                    models.RealtimeEvent.seq > last_seq
+                ).order_by(models.RealtimeEvent.seq).limit(limit + 1)
+            )
+            rows = result.all()
+
+        if len(rows) > limit:
+            return None
+        return [{"type": row.type, "seq": row.seq, "data": row.data} for row in rows]
+
+    async def load_data(self, seq: int) -> Optional[Dict[str, Any]]:
+        """Data of one logged event, or None if it is no longer retained."""
+        async with async_session_scope() as db:
+            return await db.scalar(
+                select(models.RealtimeEvent.data).filter(
+                    models.RealtimeEvent.seq == seq))
+
+    async def prune(self, retention_seconds: int) -> int:
+        """Drop events older than the retention period from the table."""
+        async with async_session_scope() as db:
+            # Delete a contiguous prefix by seq so min(seq) stays a valid
+            # retention horizon for load_since
+            expired_before = datetime.now(UTC) - timedelta(seconds=retention_seconds)
+            cutoff = await db.scalar(
+                select(func.max(models.RealtimeEvent.seq)).filter(
+                    models.RealtimeEvent.created_at < expired_before)
+            )
+            if cutoff is None:
+                return 0
+            result = await db.execute(
+                delete(models.RealtimeEvent).filter(
+                    models.RealtimeEvent.seq <= cutoff))
+            await db.commit()
+            return result.rowcount
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, Union
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .database import AnySession
+from .websocket import NOTIFY_CHANNEL, manager
+
+logger = logging.getLogger(__name__)
+
+# Session.info key holding events waiting for their transaction to commit
+PENDING_EVENTS_KEY = "realtime_pending_events"
+
+# Advisory lock namespace ("rtev") of the per-user publish locks; the two
+# key form keeps them apart from the single-key locks of app/rollups.py
+PUBLISH_LOCK_NAMESPACE = 0x72746576
+
+# Taken before a transaction's first event and held until it ends, so a
+# user's seqs are handed out in commit order: replay returns everything of
+# the user after the last seq a client saw, which would skip an event whose
+# lower seq committed after a higher one. notify_db_change takes the same
+# lock for trigger-sourced events.
+PUBLISH_LOCK_SQL = text("""
+    SELECT pg_advisory_xact_lock(
+        CAST(:namespace AS integer), hashtext(CAST(:owner_id AS text)))
+""")
+
+# Makes the db_changes triggers skip this transaction's rows without
+# publishing anything (yet)
+MUTE_TRIGGERS_SQL = text("SELECT set_config('app.events_published', 'on', true)")
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more, which would
+# abort the publishing transaction; keep the same margin as the triggers
+NOTIFY_MAX_PAYLOAD_BYTES = 7900
+
+# One round trip: append the event to the replay log under the next
+# sequence number, queue the NOTIFY for the other workers (Postgres only
+# delivers it on commit) and flag the transaction so the db_changes triggers
+# don't announce the same rows again. Events too large for a NOTIFY are
+# announced without their data and flagged truncated; listeners load it
+# from realtime_events by seq.
+PUBLISH_SQL = text("""
+    WITH next_event AS (
+        INSERT INTO realtime_events (seq, user_id, type, data)
+        VALUES (
+            nextval('realtime_event_seq'),
+            CAST(:owner_id AS uuid),
+            CAST(:type AS text),
+            CAST(:data AS jsonb)
+        )
+        RETURNING seq, user_id, type, data
+    )
+    SELECT next_event.seq,
+           pg_notify(CAST(:channel AS text), CASE
+               WHEN octet_length(payload.full_text) <= CAST(:max_payload_bytes AS integer)
+               THEN payload.full_text
+               ELSE payload.truncated_text
+           END),
+           set_config('app.events_published', 'on', true)
+    FROM next_event
+    CROSS JOIN LATERAL (
+        SELECT (envelope || jsonb_build_object('data', next_event.data))::text AS full_text,
+               (envelope || '{"truncated": true}'::jsonb)::text AS truncated_text
+        FROM jsonb_build_object(
+            'origin', CAST(:origin AS text),
+            'owner_id', next_event.user_id,
+            'type', next_event.type,
+            'seq', next_event.seq,
+            'published_at', CAST(:published_at AS double precision)
+        ) AS envelope
+    ) AS payload
+""")
+
+
+async def publish(
+    db: AnySession,
+    user_id: Union[str, uuid.UUID],
+    event_type: str,
+    data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Publish a realtime event as part of the current transaction.
+
+    Must be called before ``db.commit()``, and as close to it as possible:
+    from here on the user's other publishing transactions wait for this
+    one to commit. Sockets connected to this worker receive the event right
+    after the commit, every other worker gets it through LISTEN/NOTIFY;
+    nothing is sent if the transaction rolls back.
+    """
+    pending = db.info.get(PENDING_EVENTS_KEY, ())
+    if not any(owner_id == str(user_id) for _, owner_id, _, _ in pending):
+        await db.execute(PUBLISH_LOCK_SQL, {
+            "namespace": PUBLISH_LOCK_NAMESPACE,
+            "owner_id": str(user_id),
+        })
+    # Stamped here, right before the commit, to time delivery end to end
+    published_at = time.time()
+    result = await db.execute(PUBLISH_SQL, {
+        "channel": NOTIFY_CHANNEL,
+        "origin": manager.worker_id,
+        "owner_id": str(user_id),
+        "type": event_type,
+        "data": json.dumps(data),
+        "published_at": published_at,
+        "max_payload_bytes": NOTIFY_MAX_PAYLOAD_BYTES,
+    })
+    seq = result.scalar_one()
+    message = {"type": event_type, "seq": seq, "data": data}
+    db.info.setdefault(PENDING_EVENTS_KEY, []).append(
+        (asyncio.get_running_loop(), str(user_id), message, published_at))
+    return message
+
+
+async def mute_triggers(db: AnySession) -> None:
+    """Keep the change triggers quiet for writes publish() will announce.
+
+    For bulk writes that should not run under the user's publish lock.
+    """
+    await db.execute(MUTE_TRIGGERS_SQL)
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_committed_events(session: Session) -> None:
+    pending = session.info.pop(PENDING_EVENTS_KEY, None)
+    if not pending:
+        return
+    # With USE_ASYNC_DB=false the commit runs in a threadpool worker, so
+    # hand the events back to the event loop they were published from.
+    loop = pending[0][0]
+    loop.call_soon_threadsafe(
+        manager.deliver_soon,
+        [(user_id, message, published_at) for _, user_id, message, published_at in pending])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_events(session: Session) -> None:
+    if session.info.pop(PENDING_EVENTS_KEY, None):
+        logger.debug("Discarded realtime events of a rolled back transaction")
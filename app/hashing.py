@@ -0,0 +1,164 @@
+"""Password hashing off the event loop.
+
+A bcrypt call takes a few hundred milliseconds of CPU; run on the event
+loop it would stall every request and socket of the worker. The calls run
+on a small thread pool instead (bcrypt releases the GIL), and once as many
+are waiting as PASSWORD_HASH_QUEUE_SIZE allows, further ones are turned
+away with a 503 rather than queueing without bound.
+
+The bcrypt cost is calibrated at startup to the most this host can hash
+within BCRYPT_TARGET_SECONDS, unless BCRYPT_ROUNDS pins it. Logins rehash
+stored passwords whose cost differs, so changing either setting takes
+effect as users sign in. Pin BCRYPT_ROUNDS when workers run on unlike
+hosts, lest their calibrations disagree and rehash back and forth.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Tuple
+
+from fastapi import HTTPException, status
+
+from . import metrics
+from .utils import password
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_TARGET_SECONDS = float(os.getenv("BCRYPT_TARGET_SECONDS", "0.25"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+# Hashes timed during calibration; the fastest one counts
+CALIBRATION_SAMPLES = 3
+
+logger = logging.getLogger(__name__)
+
+HASH_DURATION = metrics.histogram(
+    "password_hash_duration_seconds",
+    "Time spent in bcrypt per password operation",
+    labels=("operation",)
+)
+HASH_WAIT = metrics.histogram(
+    "password_hash_wait_seconds",
+    "Time password operations waited for a hashing thread",
+    labels=("operation",)
+)
+REHASHES = metrics.counter(
+    "password_rehash_total",
+    "Stored passwords rehashed at login to the current bcrypt cost"
+)
+HASH_REJECTED = metrics.counter(
+    "password_hash_rejected_total",
+    "Password operations turned away because the hashing queue was full",
+    labels=("operation",)
+)
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> Tuple[float, float, Any]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return started, time.perf_counter(), result
+
+
+def calibrate_rounds(
+    target: float = BCRYPT_TARGET_SECONDS,
+    min_rounds: int = BCRYPT_MIN_ROUNDS,
+    max_rounds: int = BCRYPT_MAX_ROUNDS,
+    samples: int = CALIBRATION_SAMPLES
+) -> int:
+    """The highest bcrypt cost whose hash takes at most target seconds here.
+
+    Times min_rounds and extrapolates, since each round doubles the work;
+    never goes below min_rounds however slow the host.
+    """
+    timings = [_timed(password.hash_password, "calibration", min_rounds)
+               for _ in range(samples)]
+    elapsed = min(finished - started for started, finished, _ in timings)
+    if elapsed <= 0:
+        return max_rounds
+    rounds = min_rounds + math.floor(math.log2(target / elapsed))
+    return max(min_rounds, min(rounds, max_rounds))
+
+
+class HashingPool:
+    """Bounded thread pool for bcrypt calls."""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        # bcrypt cost of new hashes, until calibrate() runs
+        self.rounds = int(BCRYPT_ROUNDS or password.DEFAULT_ROUNDS)
+        # Submitted and not yet returned to the event loop
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash")
+
+    async def calibrate(self) -> int:
+        """Set the cost of new hashes, timing bcrypt unless it is pinned."""
+        if BCRYPT_ROUNDS:
+            self.rounds = int(BCRYPT_ROUNDS)
+        else:
+            self.rounds = await asyncio.wrap_future(
+                self._executor.submit(calibrate_rounds))
+            logger.info(
+                f"Calibrated bcrypt cost to {self.rounds} for {BCRYPT_TARGET_SECONDS}s hashes")
+        return self.rounds
+
+    def queue_depth(self) -> int:
+        return max(self.pending - self.workers, 0)
+
+    async def run(self, operation: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) on a hashing thread, or raise a 503 when full."""
+        if self.pending >= self.workers + self.queue_size:
+            HASH_REJECTED.inc(operation)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password requests in progress, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            # Cancelling the request drops the call if it hasn't started
+            started, finished, result = await asyncio.wrap_future(
+                self._executor.submit(_timed, fn, *args))
+        finally:
+            self.pending -= 1
+        HASH_WAIT.observe(started - submitted, operation)
+        HASH_DURATION.observe(finished - started, operation)
+        return result
+
+
+pool = HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
+
+metrics.gauge(
+    "password_hash_rounds",
+    "bcrypt cost factor of new password hashes",
+    callback=lambda: pool.rounds
+)
+metrics.gauge(
+    "password_hash_queue_depth",
+    "Password operations waiting for a hashing thread",
+    callback=pool.queue_depth
+)
+metrics.gauge(
+    "password_hash_in_flight",
+    "Password operations being hashed or waiting for a thread",
+    callback=lambda: pool.pending
+)
+
+
+async def hash_password(plain_password: str) -> str:
+    return await pool.run("hash", password.hash_password, plain_password, pool.rounds)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash has a cost other than the current one."""
+    return password.hash_rounds(hashed_password) != pool.rounds
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await pool.run("verify", password.verify_password, plain_password, hashed_password)
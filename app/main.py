@@ -1,14 +1,21 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Header, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from .routers import auth, users, animals, weights, media
-from .database import engine
+from .database import async_engine, engine
 from . import models
 from .websocket import manager
 from . import auth as auth_module
+from . import metrics
+from . import partitions
+from . import hashing
+from .middleware.rate_limit import rate_limit_middleware
+import asyncio
 import logging
 import os
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(
@@ -31,6 +38,10 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Registered before CORS, which therefore wraps it and still adds its
+# headers to 429 responses
+app.middleware("http")(rate_limit_middleware)
+
 if not os.getenv("DISABLE_FASTAPI_CORS", "").lower() == "true":
     app.add_middleware(
         CORSMiddleware,
@@ -38,6 +49,7 @@ if not os.getenv("DISABLE_FASTAPI_CORS", "").lower() == "true":
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Content-Disposition"],
     )
 
 # Mount media uploads directory
@@ -59,6 +71,8 @@ async def startup_event():
     logger.info("Starting application...")
     try:
         await manager.start()
+        await hashing.pool.calibrate()
+        app.state.partition_task = asyncio.create_task(partitions.maintain_partitions())
         logger.info("Application started successfully")
     except Exception as e:
         logger.error(f"Error during application startup: {e}")
@@ -70,7 +84,9 @@ async def shutdown_event():
     """Stop background tasks on application shutdown."""
     logger.info("Shutting down application...")
     try:
+        app.state.partition_task.cancel()
         await manager.stop()
+        await async_engine.dispose()
         logger.info("Application shutdown completed")
     except Exception as e:
         logger.error(f"Error during application shutdown: {e}")
@@ -82,8 +98,29 @@ async def root():
     return {"message": "Welcome to the Pet Weight Monitor API"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Metrics of this worker in the Prometheus text format.
+
+    Not found unless METRICS_TOKEN is set, then only for that bearer token.
+    """
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not metrics.scrape_authorized(authorization, metrics.METRICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(
+        metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
+    user = None
     try:
         # Verify token and get user
         user = await auth_module.get_current_user_ws(token)
@@ -92,21 +129,28 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
             await websocket.close(code=1008)  # Policy violation
             return
 
+        # Reconnecting clients pass the last seq they saw to catch up
+        last_seq = websocket.query_params.get("last_seq")
+        last_seq = int(last_seq) if last_seq and last_seq.isdigit() else None
+
         logger.info(f"WebSocket connection established for user {user.id}")
-        await manager.connect(websocket, str(user.id))
+        await manager.connect(websocket, str(user.id), last_seq=last_seq)
         try:
             while True:
-                # Wait for messages (can be used for ping/pong)
+                # Subscriptions and pings from the client
                 data = await websocket.receive_text()
+                manager.handle_message(websocket, str(user.id), data)
         except WebSocketDisconnect:
             logger.info(f"WebSocket disconnected for user {user.id}")
-            manager.disconnect(websocket, str(user.id))
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         try:
             await websocket.close(code=1011)  # Internal error
         except:
             pass
+    finally:
+        if user:
+            manager.disconnect(websocket, str(user.id))
 
 
 if __name__ == "__main__":
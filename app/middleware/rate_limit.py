@@ -1,43 +1,237 @@
-from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
-import time
-from collections import defaultdict
+"""Token-bucket rate limiting of the HTTP routes.
+
+A request is matched against POLICIES in order and charged one token from
+the bucket of its (policy, client) pair; the client is the user named by
+a valid access token for per-user policies, the IP address otherwise. A
+bucket holds up to `burst` tokens and regains burst / `seconds` of them
+per second, so a check is a constant-time update of two numbers.
+
+Buckets live in a backend, chosen by RATE_LIMIT_BACKEND:
+
+- local: this worker's memory, at most RATE_LIMIT_MAX_KEYS buckets; the
+  least recently used are evicted (their clients start over with a full
+  bucket). Each uvicorn worker enforces its limits on its own.
+- postgres: the unlogged rate_limit_buckets table, updated with one
+  upsert per request, so limits hold across workers. Buckets that have
+  refilled are purged every RATE_LIMIT_PURGE_INTERVAL seconds.
+
+Should the backend fail, requests are let through rather than refused.
+"""
+import logging
+import math
 import os
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
 from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from jose import JWTError
+from sqlalchemy import text
+
+from .. import metrics
+from ..auth import ALGORITHM, SECRET_KEY
+from ..database import async_session_scope
+from ..principals import principal_cache
 
 load_dotenv()
 
-# Rate limiting configuration
+logger = logging.getLogger(__name__)
+
+# Login attempts per IP: MAX_ATTEMPTS per RATE_LIMIT_WINDOW seconds
 RATE_LIMIT_WINDOW = int(
     os.getenv('RATE_LIMIT_WINDOW', 3600))  # 1 hour in seconds
 MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', 5))
 
-# Store login attempts in memory (consider using Redis in production)
-login_attempts = defaultdict(list)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_PURGE_INTERVAL = float(os.getenv("RATE_LIMIT_PURGE_INTERVAL", "300"))
+
+REJECTED = metrics.counter(
+    "rate_limit_rejected_total",
+    "Requests refused with a 429",
+    labels=("policy",)
+)
+BACKEND_ERRORS = metrics.counter(
+    "rate_limit_backend_errors_total",
+    "Rate limit checks that failed and let the request through"
+)
+
+
+class Policy:
+    """A limit of `burst` requests per `seconds` for matching routes.
+
+    RATE_LIMIT_<NAME>=<burst>/<seconds> overrides the default.
+    """
+    __slots__ = ("name", "prefix", "methods", "burst", "rate", "per_user", "detail")
+
+    def __init__(
+        self,
+        name: str,
+        prefix: str,
+        burst: int,
+        seconds: float,
+        methods: Optional[Iterable[str]] = None,
+        per_user: bool = True,
+        detail: str = "Too many requests. Please try again later."
+    ):
+        setting = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        if setting:
+            burst, seconds = setting.split("/")
+        self.name = name
+        self.prefix = prefix
+        self.methods = frozenset(methods) if methods else None
+        self.burst = int(burst)
+        self.rate = self.burst / float(seconds)
+        self.per_user = per_user
+        self.detail = detail
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.methods is None or method in self.methods) and path.startswith(self.prefix)
+
+
+# First match wins, so specific routes come before the prefixes they share
+POLICIES: List[Policy] = [
+    Policy("login", "/auth/login", MAX_ATTEMPTS, RATE_LIMIT_WINDOW, methods=["POST"],
+           per_user=False, detail="Too many login attempts. Please try again later."),
+    # Registration, password resets, token refreshes
+    Policy("auth", "/auth/", 60, 600, methods=["POST"], per_user=False),
+    Policy("weight_import", "/api/weights/import", 30, 3600, methods=["POST"]),
+    Policy("weight_export", "/api/weights/export", 60, 3600, methods=["GET"]),
+    Policy("api", "/api/", 300, 60),
+]
+
+
+def match_policy(method: str, path: str) -> Optional[Policy]:
+    for policy in POLICIES:
+        if policy.matches(method, path):
+            return policy
+    return None
+
+
+def client_key(request: Request, policy: Policy) -> str:
+    if policy.per_user:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                username = principal_cache.decode(token, SECRET_KEY, [ALGORITHM]).get("sub")
+            except JWTError:
+                username = None
+            if username:
+                return f"user:{username}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class LocalBackend:
+    """Buckets in this worker's memory, bounded by LRU eviction."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> [tokens, monotonic time of the last update]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, key: str, burst: int, rate: float) -> float:
+        """Take a token; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+        else:
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+# Tokens in a stored bucket once refilled for the time since its last update
+_REFILL = (
+    "LEAST(CAST(:burst AS double precision), bucket.tokens"
+    " + (EXCLUDED.updated_at - bucket.updated_at) * CAST(:rate AS double precision))"
+)
+
+# Takes a token, timed by the database clock that all workers share. With
+# less than a token left the WHERE clause skips the update and no row is
+# returned. full_at is when the bucket will be full again; from then on
+# the row says nothing an absent one wouldn't.
+TAKE_SQL = text(f"""
+    INSERT INTO rate_limit_buckets AS bucket (key, tokens, updated_at, full_at)
+    SELECT CAST(:key AS text),
+           CAST(:burst AS double precision) - 1,
+           clock.now,
+           clock.now + 1 / CAST(:rate AS double precision)
+    FROM (SELECT CAST(extract(epoch FROM clock_timestamp()) AS double precision) AS now) AS clock
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = {_REFILL} - 1,
+        updated_at = EXCLUDED.updated_at,
+        full_at = EXCLUDED.updated_at
+            + (CAST(:burst AS double precision) + 1 - {_REFILL}) / CAST(:rate AS double precision)
+    WHERE {_REFILL} >= 1
+    RETURNING bucket.tokens
+""")
+
+
+PURGE_SQL = text("""
+    DELETE FROM rate_limit_buckets
+    WHERE full_at < CAST(extract(epoch FROM clock_timestamp()) AS double precision)
+""")
+
+
+class PostgresBackend:
+    """Buckets in the rate_limit_buckets table, shared by all workers."""
+
+    def __init__(self, purge_interval: float):
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+
+    async def take(self, key: str, burst: int, rate: float) -> float:
+        async with async_session_scope() as db:
+            if time.monotonic() - self._purged_at > self.purge_interval:
+                self._purged_at = time.monotonic()
+                await db.execute(PURGE_SQL)
+            tokens = await db.scalar(TAKE_SQL, {"key": key, "burst": burst, "rate": rate})
+            await db.commit()
+        # A refused bucket holds less than one token
+        return 0.0 if tokens is not None else 1 / rate
+
+
+if RATE_LIMIT_BACKEND == "postgres":
+    backend = PostgresBackend(RATE_LIMIT_PURGE_INTERVAL)
+else:
+    backend = LocalBackend(RATE_LIMIT_MAX_KEYS)
+
+metrics.gauge(
+    "rate_limit_local_buckets",
+    "Buckets held in this worker's memory",
+    callback=lambda: len(backend) if isinstance(backend, LocalBackend) else 0
+)
 
 
 async def rate_limit_middleware(request: Request, call_next):
-    if request.url.path == "/auth/login":
-        client_ip = request.client.host
-        current_time = time.time()
-
-        # Clean up old attempts
-        login_attempts[client_ip] = [
-            attempt_time for attempt_time in login_attempts[client_ip]
-            if current_time - attempt_time < RATE_LIMIT_WINDOW
-        ]
-
-        # Check if too many attempts
-        if len(login_attempts[client_ip]) >= MAX_ATTEMPTS:
+    policy = match_policy(request.method, request.url.path)
+    if policy is not None:
+        key = f"{policy.name}:{client_key(request, policy)}"
+        try:
+            wait = await backend.take(key, policy.burst, policy.rate)
+        except Exception as e:
+            BACKEND_ERRORS.inc()
+            logger.error(f"Error checking rate limit: {e}")
+            wait = 0.0
+        if wait > 0:
+            REJECTED.inc(policy.name)
             return JSONResponse(
                 status_code=429,
-                content={
-                    "detail": "Too many login attempts. Please try again later."
-                }
+                content={"detail": policy.detail},
+                headers={"Retry-After": str(math.ceil(wait))}
             )
 
-        # Record this attempt
-        login_attempts[client_ip].append(current_time)
-
     response = await call_next(request)
     return response
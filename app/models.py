@@ -1,9 +1,12 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Numeric, func, Boolean, Integer, Text, Date
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Numeric, func, Boolean, Integer, Text, Date, Sequence, BigInteger, Index, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 import uuid
 from .database import Base
 
+# Orders realtime events across all workers (see app/events.py)
+realtime_event_seq = Sequence("realtime_event_seq", metadata=Base.metadata)
+
 
 class Media(Base):
     __tablename__ = "media"
@@ -16,6 +19,10 @@ class Media(Base):
     updated_at = Column(DateTime(timezone=True),
                         server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_media_filename", "filename"),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -36,19 +43,38 @@ class User(Base):
                         server_default=func.now(), onupdate=func.now())
 
     # Relationships
-    profile_picture = relationship("Media", uselist=False)
+    profile_picture = relationship("Media", uselist=False, lazy="selectin")
     animals = relationship("Animal", back_populates="owner")
 
+    __table_args__ = (
+        Index("ix_users_reset_token", "reset_token",
+              postgresql_where=reset_token.isnot(None)),
+    )
+
 
 class Session(Base):
+    """A refresh token, rotated by app/refresh_tokens.py.
+
+    Tokens are stored as SHA-256 hex digests. A used token stays behind,
+    with used_at set, so that replaying it can be detected.
+    """
     __tablename__ = "sessions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey(
         "users.id"), nullable=False)
-    token = Column(String, unique=True, nullable=False)
+    # Every token rotated from the same login
+    family_id = Column(UUID(as_uuid=True), nullable=False)
+    token_hash = Column(String(64), unique=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_sessions_user_id", "user_id"),
+        Index("ix_sessions_family_id", "family_id"),
+    )
 
 
 class Animal(Base):
@@ -70,22 +96,104 @@ class Animal(Base):
 
     # Relationships
     owner = relationship("User", back_populates="animals")
-    profile_picture = relationship("Media", uselist=False)
+    profile_picture = relationship("Media", uselist=False, lazy="selectin")
     weights = relationship(
         "Weight", back_populates="animal", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_animals_owner_id", "owner_id"),
+    )
+
 
 class Weight(Base):
+    """A reading; the table is range partitioned by month of date.
+
+    create_all makes a plain table, which the b3d8f1a6c472 migration
+    rebuilds as partitioned: the hot path index migration before it builds
+    its indexes CONCURRENTLY, which partitioned tables don't support.
+    Partitioned tables need the partition key in their primary key, hence
+    (id, date). See app/partitions.py for the partitions themselves.
+    """
     __tablename__ = "weights"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     animal_id = Column(UUID(as_uuid=True), ForeignKey(
         "animals.id"), nullable=False)
     weight = Column(Numeric(10, 2), nullable=False)
-    date = Column(DateTime(timezone=True), nullable=False)
+    date = Column(DateTime(timezone=True), primary_key=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True),
                         server_default=func.now(), onupdate=func.now())
 
     # Relationships
     animal = relationship("Animal", back_populates="weights")
+
+    __table_args__ = (
+        # Covers the (date, id) ordered history and chart reads
+        Index("ix_weights_animal_id_date", "animal_id", "date", "id",
+              postgresql_include=["weight"]),
+    )
+
+
+class WeightRollup(Base):
+    """Aggregates of an animal's readings per UTC day, week or month.
+
+    Maintained by app/rollups.py whenever weights change.
+    """
+    __tablename__ = "weight_rollups"
+
+    animal_id = Column(UUID(as_uuid=True), ForeignKey(
+        "animals.id", ondelete="CASCADE"), nullable=False)
+    granularity = Column(String(5), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    count = Column(Integer, nullable=False)
+    min = Column(Numeric(10, 2), nullable=False)
+    max = Column(Numeric(10, 2), nullable=False)
+    sum = Column(Numeric, nullable=False)
+    first_date = Column(DateTime(timezone=True), nullable=False)
+    first_weight = Column(Numeric(10, 2), nullable=False)
+    last_date = Column(DateTime(timezone=True), nullable=False)
+    last_weight = Column(Numeric(10, 2), nullable=False)
+    # Least-squares sums over x = days since the Unix epoch, y = weight
+    sum_x = Column(Numeric, nullable=False, server_default="0")
+    sum_xx = Column(Numeric, nullable=False, server_default="0")
+    sum_xy = Column(Numeric, nullable=False, server_default="0")
+    sum_yy = Column(Numeric, nullable=False, server_default="0")
+
+    __table_args__ = (
+        PrimaryKeyConstraint("animal_id", "granularity", "bucket_start"),
+    )
+
+
+class RealtimeEvent(Base):
+    __tablename__ = "realtime_events"
+
+    seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey(
+        "users.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String(50), nullable=False)
+    data = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_realtime_events_user_id_seq", "user_id", "seq"),
+        Index("ix_realtime_events_created_at", "created_at"),
+    )
+
+
+class RateLimitBucket(Base):
+    """A token bucket of the shared rate limiter (app/middleware/rate_limit.py).
+
+    Unlogged: losing the buckets in a crash merely resets the limits.
+    """
+    __tablename__ = "rate_limit_buckets"
+
+    # <policy>:user:<username> or <policy>:ip:<address>
+    key = Column(Text, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Epoch seconds on the database clock
+    updated_at = Column(Float, nullable=False)
+    full_at = Column(Float, nullable=False)
+
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
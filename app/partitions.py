@@ -0,0 +1,214 @@
+"""Monthly range partitions of the weights table.
+
+weights is partitioned by date (see models.Weight). A reading is stored in
+weights_pYYYYMM for its UTC month, or in weights_default while that month
+has no partition. ensure_partitions() creates the coming months ahead of
+time and gives months stranded in the default partition their own;
+detach_partitions() takes old months out of the table, keeping them as
+standalone tables (optionally in an archive schema) or dropping them.
+
+Besides the background task started by the app, both can be run by hand:
+
+    python -m app.partitions ensure --months-ahead 6
+    python -m app.partitions detach --before 2020-01 --archive-schema archive
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import UTC, date, datetime
+from typing import Callable, List, Optional, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT = "weights"
+DEFAULT_PARTITION = "weights_default"
+PARTITION_NAME = re.compile(r"^weights_p(\d{4})(\d{2})$")
+
+WEIGHT_PARTITION_MONTHS_AHEAD = int(os.getenv("WEIGHT_PARTITION_MONTHS_AHEAD", "3"))
+WEIGHT_PARTITION_CHECK_INTERVAL = float(os.getenv("WEIGHT_PARTITION_CHECK_INTERVAL", "3600"))
+
+# Serializes maintenance across workers
+MAINTENANCE_LOCK_KEY = 0x77656967687473  # "weights"
+
+T = TypeVar("T")
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month: date) -> str:
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return conn.dialect.name == "postgresql" and conn.scalar(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"
+    ), {"name": PARENT}) == "p"
+
+
+def managed_partitions(conn: Connection) -> List[date]:
+    """Months that currently have a partition attached, oldest first."""
+    names = conn.scalars(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:name)
+    """), {"name": PARENT})
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def _create_partition(conn: Connection, month: date) -> None:
+    name = partition_name(month)
+    bounds = f"FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+    params = {
+        "start": datetime(month.year, month.month, 1, tzinfo=UTC),
+        "end": datetime.combine(add_months(month, 1), datetime.min.time(), UTC)
+    }
+    stranded = conn.scalar(text(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end
+        )
+    """), params)
+    if not stranded:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}"))
+        return
+
+    # The default partition may not keep rows of a range that gets its own
+    # partition, so move them to a new table first and attach it. Moving a
+    # reading is not a change clients should hear about.
+    conn.execute(text("SET LOCAL app.events_published = 'on'"))
+    conn.execute(text(
+        f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE date >= :start AND date < :end
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), params)
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(
+    conn: Connection,
+    months_ahead: int = WEIGHT_PARTITION_MONTHS_AHEAD,
+    today: Optional[date] = None
+) -> List[date]:
+    """Create partitions up to months_ahead and for months stuck in default.
+
+    Returns the months created. Does nothing unless weights is a
+    partitioned PostgreSQL table.
+    """
+    if not _is_partitioned(conn):
+        return []
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+
+    current = (today or datetime.now(UTC).date()).replace(day=1)
+    wanted = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    wanted.update(
+        month.date() for month in conn.scalars(text(f"""
+            SELECT DISTINCT date_trunc('month', date AT TIME ZONE 'UTC')
+            FROM {DEFAULT_PARTITION}
+        """))
+    )
+    missing = sorted(wanted - set(managed_partitions(conn)))
+    for month in missing:
+        _create_partition(conn, month)
+        logger.info(f"Created weight partition {partition_name(month)}")
+    return missing
+
+
+def detach_partitions(
+    conn: Connection,
+    before: date,
+    archive_schema: Optional[str] = None,
+    drop: bool = False
+) -> List[date]:
+    """Detach the partitions of months ending on or before `before`.
+
+    Detached months are no longer visible to the API; their rollups are
+    kept. They stay behind as standalone tables, moved into
+    archive_schema when given, unless drop is set.
+    """
+    if not _is_partitioned(conn):
+        return []
+    if archive_schema is not None and not re.match(r"^[a-z_][a-z0-9_]*$", archive_schema):
+        raise ValueError(f"Invalid schema name {archive_schema!r}")
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+
+    cutoff = before.replace(day=1)
+    detached = [month for month in managed_partitions(conn) if add_months(month, 1) <= cutoff]
+    if detached and archive_schema is not None:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+    for month in detached:
+        name = partition_name(month)
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+        elif archive_schema is not None:
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+        logger.info(f"Detached weight partition {name}")
+    return detached
+
+
+def run_maintenance(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a maintenance function in a transaction of its own."""
+    with engine.begin() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def maintain_partitions(interval: float = WEIGHT_PARTITION_CHECK_INTERVAL) -> None:
+    """Keep future partitions in place for as long as the app runs."""
+    while True:
+        try:
+            await run_in_threadpool(run_maintenance, ensure_partitions)
+        except Exception as e:
+            logger.error(f"Error maintaining weight partitions: {e}")
+        await asyncio.sleep(interval)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create upcoming partitions")
+    ensure.add_argument("--months-ahead", type=int, default=WEIGHT_PARTITION_MONTHS_AHEAD)
+    detach = commands.add_parser("detach", help="detach old partitions")
+    detach.add_argument("--before", required=True,
+                        type=lambda value: datetime.strptime(value, "%Y-%m").date(),
+                        help="first month to keep, as YYYY-MM")
+    target = detach.add_mutually_exclusive_group()
+    target.add_argument("--archive-schema")
+    target.add_argument("--drop", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "ensure":
+        months = run_maintenance(ensure_partitions, args.months_ahead)
+    else:
+        months = run_maintenance(
+            detach_partitions, args.before, args.archive_schema, args.drop)
+    print(", ".join(partition_name(month) for month in months) or "nothing to do")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple, Union
+
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import events, models
+from .database import AnySession
+from .websocket import manager
+
+# Verified tokens and user rows behind the get_current_user dependencies
+# (per worker). The TTL bounds how long a change made outside app/routers
+# (a script, psql) goes unnoticed.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+USER_UPDATED = "USER_UPDATED"
+
+
+def _copy_columns(instance: Any) -> Any:
+    """A detached copy of the loaded columns of an ORM instance."""
+    mapper = inspect(instance).mapper
+    return mapper.class_(**{
+        attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs
+    })
+
+
+def snapshot_user(user: models.User) -> models.User:
+    """A detached copy of a user and its profile picture.
+
+    Session.merge(snapshot, load=False) turns it into a persistent user of
+    another session without a query, as if that session had loaded it.
+    """
+    copy = _copy_columns(user)
+    picture = user.profile_picture
+    copy.profile_picture = _copy_columns(picture) if picture is not None else None
+    if copy.profile_picture is not None:
+        make_transient_to_detached(copy.profile_picture)
+    make_transient_to_detached(copy)
+    return copy
+
+
+class PrincipalCache:
+    """LRU of verified token claims and of user snapshots by username."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._claims: "OrderedDict[Hashable, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._users: "OrderedDict[str, Tuple[float, models.User]]" = OrderedDict()
+
+    @staticmethod
+    def _lookup(entries: OrderedDict, key: Hashable) -> Optional[Any]:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, entries: OrderedDict, key: Hashable, value: Any, ttl: float) -> None:
+        entries[key] = (time.monotonic() + ttl, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def decode(self, token: str, key: str, algorithms: Sequence[str]) -> Dict[str, Any]:
+        """jwt.decode() that verifies each token's signature only once.
+
+        Raises JWTError like jwt.decode(), including for cached tokens that
+        have expired since.
+        """
+        cache_key = (token, key, tuple(algorithms))
+        claims = self._lookup(self._claims, cache_key)
+        if claims is None:
+            claims = jwt.decode(token, key, algorithms=list(algorithms))
+            exp = claims.get("exp")
+            # Never kept past the token's expiry
+            ttl = self.ttl if exp is None else min(self.ttl, exp - time.time())
+            if ttl > 0:
+                self._store(self._claims, cache_key, claims, ttl)
+        elif claims.get("exp") is not None and claims["exp"] < time.time():
+            self._claims.pop(cache_key, None)
+            raise ExpiredSignatureError("Signature has expired.")
+        return dict(claims)
+
+    async def get_user(self, db: AnySession, username: str) -> Optional[models.User]:
+        """The user with this username, as a persistent object of db."""
+        snapshot = self._lookup(self._users, username)
+        if snapshot is not None:
+            return await db.merge(snapshot, load=False)
+        user = await db.scalar(select(models.User).filter(
+            models.User.username == username))
+        if user is not None:
+            self._store(self._users, username, snapshot_user(user), self.ttl)
+        return user
+
+    def invalidate(self, user_id: Union[str, uuid.UUID]) -> None:
+        user_id = str(user_id)
+        for username, (_, snapshot) in list(self._users.items()):
+            if str(snapshot.id) == user_id:
+                del self._users[username]
+
+    def clear(self) -> None:
+        self._claims.clear()
+        self._users.clear()
+
+    def on_event(self, user_id: str, message: Dict[str, Any]) -> None:
+        if message.get("type") == USER_UPDATED:
+            self.invalidate(user_id)
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+manager.add_listener(principal_cache.on_event)
+
+
+async def user_changed(db: AnySession, user: models.User) -> None:
+    """Announce a change to a user's row; call before committing it.
+
+    Every worker drops its snapshot of the user once the change commits,
+    and the user's sockets learn about it.
+    """
+    principal_cache.invalidate(user.id)
+    await events.publish(db, user.id, USER_UPDATED, {"id": str(user.id)})
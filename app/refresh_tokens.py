@@ -0,0 +1,117 @@
+"""Rotating refresh tokens, stored in the sessions table.
+
+A login starts a token family. Each refresh marks the presented token used
+and issues its successor in the same family, so a renewal costs an indexed
+lookup rather than a bcrypt check. Only a SHA-256 of each token is stored.
+Presenting a token that was already used means it was copied; the whole
+family is revoked, logging out both the thief and the user. A token used
+again within REFRESH_TOKEN_REUSE_GRACE seconds is let through instead, as
+two tabs refreshing at once do exactly that.
+"""
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import UTC, datetime, timedelta
+from typing import Optional, Tuple, Union
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+
+from . import models
+from .database import AnySession
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+REFRESH_TOKEN_REUSE_GRACE = float(os.getenv("REFRESH_TOKEN_REUSE_GRACE", "10"))
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _invalid(detail: str = "Invalid refresh token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def issue(
+    db: AnySession,
+    user_id: Union[str, uuid.UUID],
+    family_id: Optional[uuid.UUID] = None
+) -> str:
+    """Add a refresh token for the user, starting a family unless given.
+
+    Returns the token; it is stored when the caller commits.
+    """
+    now = datetime.now(UTC)
+    # Rows past their expiry have no use left, not even reuse detection
+    await db.execute(delete(models.Session).where(
+        models.Session.user_id == user_id,
+        models.Session.expires_at < now
+    ))
+    token = secrets.token_urlsafe(32)
+    db.add(models.Session(
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4(),
+        token_hash=hash_token(token),
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+
+async def revoke_family(db: AnySession, family_id: uuid.UUID) -> None:
+    await db.execute(
+        update(models.Session)
+        .where(models.Session.family_id == family_id, models.Session.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(UTC))
+    )
+
+
+async def revoke_user(db: AnySession, user_id: Union[str, uuid.UUID]) -> None:
+    """Revoke every refresh token of a user, e.g. after a password change."""
+    await db.execute(
+        update(models.Session)
+        .where(models.Session.user_id == user_id, models.Session.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(UTC))
+    )
+
+
+async def revoke(db: AnySession, token: str) -> None:
+    """Revoke the family of a token (logout); unknown tokens are ignored."""
+    family_id = await db.scalar(select(models.Session.family_id).where(
+        models.Session.token_hash == hash_token(token)))
+    if family_id is not None:
+        await revoke_family(db, family_id)
+
+
+async def rotate(db: AnySession, token: str) -> Tuple[str, str]:
+    """Trade a refresh token for its successor.
+
+    Returns the username the token belongs to and the new token, or raises
+    a 401. A reused token has its family revoked and committed first.
+    """
+    row = (await db.execute(
+        select(models.Session, models.User.username)
+        .join(models.User, models.User.id == models.Session.user_id)
+        .where(models.Session.token_hash == hash_token(token))
+        # Concurrent refreshes with one token queue up here
+        .with_for_update(of=models.Session)
+    )).first()
+    if row is None:
+        raise _invalid()
+    session, username = row
+
+    now = datetime.now(UTC)
+    if session.revoked_at is not None or session.expires_at <= now:
+        raise _invalid()
+    if session.used_at is not None:
+        if now - session.used_at > timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE):
+            await revoke_family(db, session.family_id)
+            await db.commit()
+            raise _invalid("Refresh token was already used; please log in again")
+    else:
+        session.used_at = now
+    return username, await issue(db, session.user_id, session.family_id)
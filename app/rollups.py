@@ -0,0 +1,444 @@
+"""Per-animal daily, weekly and monthly weight rollups.
+
+weight_rollups holds count, min, max, sum and the first and last reading of
+every calendar bucket (UTC; weeks start on Monday) that has readings. Every
+write to weights is applied to the buckets it touched in the same
+transaction, so range statistics are answered from a handful of rollup
+rows instead of the raw history.
+"""
+import uuid
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import select, text
+
+from . import models
+from .database import AnySession
+
+GRANULARITIES = ("day", "week", "month")
+
+# (id, animal_id, weight, date) of a reading, in the column order of weights
+Reading = Tuple[uuid.UUID, uuid.UUID, Decimal, datetime]
+
+# Sums kept for least-squares fits (see app/analytics.py); x is the
+# reading's time in days since the Unix epoch, rounded to keep them exact
+REGRESSION_SUMS = ("sum_x", "sum_xx", "sum_xy", "sum_yy")
+_POINT = (
+    "LATERAL (SELECT round(CAST(extract(epoch FROM {date}) AS numeric) / 86400, 6)"
+    " AS x) AS point"
+)
+
+# Transaction-level lock per animal. Taken in its own statement so the
+# statements that follow see the rollups of any writer that held it before.
+LOCK_SQL = text("""
+    SELECT pg_advisory_xact_lock(key)
+    FROM (
+        SELECT DISTINCT hashtextextended(CAST(animal_id AS text), 0) AS key
+        FROM unnest(CAST(:animal_ids AS uuid[])) AS animal_id
+        ORDER BY key
+    ) AS keys
+""")
+
+# Readings being folded into or out of their buckets, and what they add up
+# to per bucket
+_DELTAS = f"""
+    changes AS (
+        SELECT *
+        FROM unnest(
+            CAST(:ids AS uuid[]),
+            CAST(:animal_ids AS uuid[]),
+            CAST(:weights AS numeric[]),
+            CAST(:dates AS timestamptz[])
+        ) AS change(id, animal_id, weight, date)
+    ),
+    deltas AS (
+        SELECT change.animal_id,
+               granularity,
+               date_trunc(granularity, change.date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+                   AS bucket_start,
+               count(*) AS count,
+               min(change.weight) AS min,
+               max(change.weight) AS max,
+               sum(change.weight) AS sum,
+               min(change.date) AS first_date,
+               (array_agg(change.weight ORDER BY change.date, change.id))[1] AS first_weight,
+               max(change.date) AS last_date,
+               (array_agg(change.weight ORDER BY change.date DESC, change.id DESC))[1]
+                   AS last_weight,
+               sum(point.x) AS sum_x,
+               sum(point.x * point.x) AS sum_xx,
+               sum(point.x * change.weight) AS sum_xy,
+               sum(change.weight * change.weight) AS sum_yy
+        FROM changes
+        CROSS JOIN unnest(CAST(:granularities AS text[])) AS granularity
+        CROSS JOIN {_POINT.format(date="change.date")}
+        GROUP BY 1, 2, 3
+    )
+"""
+
+# Adds readings to their buckets. Returns the buckets whose first or last
+# date an added reading ties: which of the two comes first depends on ids
+# the rollup doesn't keep.
+ADD_SQL = text(f"""
+    WITH {_DELTAS},
+    ties AS (
+        SELECT delta.animal_id, delta.granularity, delta.bucket_start
+        FROM deltas AS delta
+        JOIN weight_rollups AS rollup
+          ON rollup.animal_id = delta.animal_id
+         AND rollup.granularity = delta.granularity
+         AND rollup.bucket_start = delta.bucket_start
+        WHERE delta.first_date = rollup.first_date OR delta.last_date = rollup.last_date
+    ),
+    added AS (
+        INSERT INTO weight_rollups AS rollup (
+            animal_id, granularity, bucket_start, count, min, max, sum,
+            first_date, first_weight, last_date, last_weight,
+            sum_x, sum_xx, sum_xy, sum_yy
+        )
+        SELECT animal_id, granularity, bucket_start, count, min, max, sum,
+               first_date, first_weight, last_date, last_weight,
+               sum_x, sum_xx, sum_xy, sum_yy
+        FROM deltas
+        ON CONFLICT (animal_id, granularity, bucket_start) DO UPDATE SET
+            count = rollup.count + EXCLUDED.count,
+            min = LEAST(rollup.min, EXCLUDED.min),
+            max = GREATEST(rollup.max, EXCLUDED.max),
+            sum = rollup.sum + EXCLUDED.sum,
+            first_date = LEAST(rollup.first_date, EXCLUDED.first_date),
+            first_weight = CASE WHEN EXCLUDED.first_date < rollup.first_date
+                                THEN EXCLUDED.first_weight ELSE rollup.first_weight END,
+            last_date = GREATEST(rollup.last_date, EXCLUDED.last_date),
+            last_weight = CASE WHEN EXCLUDED.last_date > rollup.last_date
+                               THEN EXCLUDED.last_weight ELSE rollup.last_weight END,
+            sum_x = rollup.sum_x + EXCLUDED.sum_x,
+            sum_xx = rollup.sum_xx + EXCLUDED.sum_xx,
+            sum_xy = rollup.sum_xy + EXCLUDED.sum_xy,
+            sum_yy = rollup.sum_yy + EXCLUDED.sum_yy
+    )
+    SELECT animal_id, granularity, bucket_start FROM ties
+""")
+
+# Takes readings out of their buckets. Returns each bucket's new count and
+# whether a removed reading was its min, max, first or last, which then
+# have to be read again from the remaining readings.
+REMOVE_SQL = text(f"""
+    WITH {_DELTAS}
+    UPDATE weight_rollups AS rollup SET
+        count = rollup.count - delta.count,
+        sum = rollup.sum - delta.sum,
+        sum_x = rollup.sum_x - delta.sum_x,
+        sum_xx = rollup.sum_xx - delta.sum_xx,
+        sum_xy = rollup.sum_xy - delta.sum_xy,
+        sum_yy = rollup.sum_yy - delta.sum_yy
+    FROM deltas AS delta
+    WHERE rollup.animal_id = delta.animal_id
+      AND rollup.granularity = delta.granularity
+      AND rollup.bucket_start = delta.bucket_start
+    RETURNING rollup.animal_id, rollup.granularity, rollup.bucket_start, rollup.count,
+              delta.min <= rollup.min OR delta.max >= rollup.max
+                  OR delta.first_date <= rollup.first_date
+                  OR delta.last_date >= rollup.last_date AS stale
+""")
+
+# Stored buckets never have a count of 0, so these were just emptied
+DELETE_EMPTIED_SQL = text("""
+    DELETE FROM weight_rollups
+    WHERE animal_id = ANY(CAST(:animal_ids AS uuid[])) AND count = 0
+""")
+
+# Reads min, max, first and last of the given buckets again, through the
+# (animal_id, date) index that includes the weight
+EXTREMES_SQL = text("""
+    WITH buckets AS (
+        SELECT *
+        FROM unnest(
+            CAST(:animal_ids AS uuid[]),
+            CAST(:granularities AS text[]),
+            CAST(:starts AS timestamptz[]),
+            CAST(:ends AS timestamptz[])
+        ) AS bucket(animal_id, granularity, bucket_start, bucket_end)
+    ),
+    extremes AS (
+        SELECT bucket.animal_id,
+               bucket.granularity,
+               bucket.bucket_start,
+               min(weights.weight) AS min,
+               max(weights.weight) AS max,
+               min(weights.date) AS first_date,
+               (array_agg(weights.weight ORDER BY weights.date, weights.id))[1]
+                   AS first_weight,
+               max(weights.date) AS last_date,
+               (array_agg(weights.weight ORDER BY weights.date DESC, weights.id DESC))[1]
+                   AS last_weight
+        FROM buckets AS bucket
+        JOIN weights
+          ON weights.animal_id = bucket.animal_id
+         AND weights.date >= bucket.bucket_start
+         AND weights.date < bucket.bucket_end
+        GROUP BY bucket.animal_id, bucket.granularity, bucket.bucket_start
+    )
+    UPDATE weight_rollups AS rollup SET
+        min = extremes.min,
+        max = extremes.max,
+        first_date = extremes.first_date,
+        first_weight = extremes.first_weight,
+        last_date = extremes.last_date,
+        last_weight = extremes.last_weight
+    FROM extremes
+    WHERE rollup.animal_id = extremes.animal_id
+      AND rollup.granularity = extremes.granularity
+      AND rollup.bucket_start = extremes.bucket_start
+""")
+
+# Partial aggregates of one part of a range, see summarize()
+ROLLUP_PART_SQL = """
+    SELECT sum(count) AS count, min(min) AS min, max(max) AS max, sum(sum) AS sum,
+           min(first_date) AS first_date,
+           (array_agg(first_weight ORDER BY first_date))[1] AS first_weight,
+           max(last_date) AS last_date,
+           (array_agg(last_weight ORDER BY last_date DESC))[1] AS last_weight,
+           sum(sum_x) AS sum_x, sum(sum_xx) AS sum_xx,
+           sum(sum_xy) AS sum_xy, sum(sum_yy) AS sum_yy
+    FROM weight_rollups
+    WHERE animal_id = :animal_id AND granularity = :granularity_{index}{bounds}
+"""
+
+RAW_PART_SQL = f"""
+    SELECT count(*) AS count, min(weight) AS min, max(weight) AS max,
+           sum(weight) AS sum,
+           min(date) AS first_date,
+           (array_agg(weight ORDER BY date, id))[1] AS first_weight,
+           max(date) AS last_date,
+           (array_agg(weight ORDER BY date DESC, id DESC))[1] AS last_weight,
+           sum(point.x) AS sum_x, sum(point.x * point.x) AS sum_xx,
+           sum(point.x * weight) AS sum_xy, sum(weight * weight) AS sum_yy
+    FROM weights,
+         {_POINT.format(date="date")}
+    WHERE animal_id = :animal_id{{bounds}}
+"""
+
+
+def bucket_start(date: datetime, granularity: str) -> datetime:
+    """Start of the UTC calendar bucket containing date."""
+    day = date.astimezone(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity {granularity!r}")
+
+
+def bucket_end(start: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(weeks=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _utc(date: Optional[datetime]) -> Optional[datetime]:
+    if date is not None and date.tzinfo is None:
+        return date.replace(tzinfo=UTC)
+    return date
+
+
+def _ceil(date: datetime, granularity: str) -> datetime:
+    start = bucket_start(date, granularity)
+    return start if start == date else bucket_end(start, granularity)
+
+
+def _delta_params(readings: List[Reading]) -> Dict[str, Any]:
+    return {
+        "ids": [str(reading[0]) for reading in readings],
+        "animal_ids": [str(reading[1]) for reading in readings],
+        "weights": [reading[2] for reading in readings],
+        "dates": [_utc(reading[3]) for reading in readings],
+        "granularities": list(GRANULARITIES)
+    }
+
+
+async def lock(db: AnySession, animal_ids: Iterable[Union[str, uuid.UUID]]) -> None:
+    """Take the rollup locks of animals for the rest of the transaction.
+
+    apply() takes them itself; a transaction writing readings of many
+    animals in several steps takes all of them upfront, in the same order
+    as every other writer, so it can't deadlock with one.
+    """
+    await db.execute(LOCK_SQL, {
+        "animal_ids": sorted({str(animal_id) for animal_id in animal_ids})})
+
+
+async def apply(
+    db: AnySession,
+    added: Iterable[Reading] = (),
+    removed: Iterable[Reading] = ()
+) -> None:
+    """Fold written readings into the rollup buckets they belong to.
+
+    Call after the weights are written and before the commit, with the
+    readings a write removed and the ones it added; an update does both.
+    Counts and sums change by the readings' own contribution, so the cost
+    follows the number of readings written, not the history. A bucket's
+    min, max, first and last are only read again from its readings when a
+    removed reading was one of them.
+    """
+    added, removed = list(added), list(removed)
+    if not added and not removed:
+        return
+    animal_ids = sorted({str(reading[1]) for reading in added + removed})
+    await lock(db, animal_ids)
+
+    stale: Set[Tuple[uuid.UUID, str, datetime]] = set()
+    if removed:
+        rows = (await db.execute(REMOVE_SQL, _delta_params(removed))).mappings().all()
+        if any(row["count"] == 0 for row in rows):
+            await db.execute(DELETE_EMPTIED_SQL, {"animal_ids": animal_ids})
+        stale.update(
+            (row["animal_id"], row["granularity"], row["bucket_start"])
+            for row in rows if row["stale"] and row["count"] > 0)
+    if added:
+        rows = (await db.execute(ADD_SQL, _delta_params(added))).all()
+        stale.update(tuple(row) for row in rows)
+    if not stale:
+        return
+
+    ordered = sorted(stale, key=lambda bucket: (str(bucket[0]), bucket[1], bucket[2]))
+    await db.execute(EXTREMES_SQL, {
+        "animal_ids": [str(animal_id) for animal_id, _, _ in ordered],
+        "granularities": [granularity for _, granularity, _ in ordered],
+        "starts": [start for _, _, start in ordered],
+        "ends": [bucket_end(start, granularity) for _, granularity, start in ordered]
+    })
+
+
+def plan_range(
+    date_from: Optional[datetime], date_to: Optional[datetime]
+) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """Split [date_from, date_to) into month, day and raw parts.
+
+    Whole months come from the monthly rollups, the whole days around them
+    from the daily ones and only the partial days at either end are read
+    from weights. None leaves that side open.
+    """
+    if date_from is not None and date_to is not None and date_from >= date_to:
+        return []
+    day_from = _ceil(date_from, "day") if date_from is not None else None
+    day_to = bucket_start(date_to, "day") if date_to is not None else None
+    if day_from is not None and day_to is not None and day_from >= day_to:
+        return [("raw", date_from, date_to)]
+
+    parts: List[Tuple[str, Optional[datetime], Optional[datetime]]] = []
+    if day_from is not None and date_from < day_from:
+        parts.append(("raw", date_from, day_from))
+    if day_to is not None and day_to < date_to:
+        parts.append(("raw", day_to, date_to))
+
+    month_from = _ceil(day_from, "month") if day_from is not None else None
+    month_to = bucket_start(day_to, "month") if day_to is not None else None
+    if month_from is not None and month_to is not None and month_from >= month_to:
+        parts.append(("day", day_from, day_to))
+        return parts
+    if day_from is not None and day_from < month_from:
+        parts.append(("day", day_from, month_from))
+    if day_to is not None and month_to < day_to:
+        parts.append(("day", month_to, day_to))
+    parts.append(("month", month_from, month_to))
+    return parts
+
+
+def merge(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine partial aggregates of disjoint ranges into one summary."""
+    summary: Dict[str, Any] = {
+        "count": 0, "min": None, "max": None, "mean": None,
+        "first_date": None, "first": None, "last_date": None, "last": None,
+        "sum": Decimal(0), **{name: Decimal(0) for name in REGRESSION_SUMS}
+    }
+    for part in parts:
+        if not part["count"]:
+            continue
+        summary["count"] += int(part["count"])
+        for name in ("sum",) + REGRESSION_SUMS:
+            summary[name] += part[name]
+        if summary["min"] is None or part["min"] < summary["min"]:
+            summary["min"] = part["min"]
+        if summary["max"] is None or part["max"] > summary["max"]:
+            summary["max"] = part["max"]
+        if summary["first_date"] is None or part["first_date"] < summary["first_date"]:
+            summary["first_date"] = part["first_date"]
+            summary["first"] = part["first_weight"]
+        if summary["last_date"] is None or part["last_date"] > summary["last_date"]:
+            summary["last_date"] = part["last_date"]
+            summary["last"] = part["last_weight"]
+    if summary["count"]:
+        summary["mean"] = summary["sum"] / summary["count"]
+    return summary
+
+
+async def summarize(
+    db: AnySession,
+    animal_id: uuid.UUID,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime]
+) -> Dict[str, Any]:
+    """Exact statistics of the readings in [date_from, date_to)."""
+    selects = []
+    params: Dict[str, Any] = {"animal_id": animal_id}
+    for index, (source, start, end) in enumerate(
+            plan_range(_utc(date_from), _utc(date_to))):
+        column = "date" if source == "raw" else "bucket_start"
+        bounds = ""
+        if start is not None:
+            bounds += f" AND {column} >= :start_{index}"
+            params[f"start_{index}"] = start
+        if end is not None:
+            bounds += f" AND {column} < :end_{index}"
+            params[f"end_{index}"] = end
+        if source == "raw":
+            selects.append(RAW_PART_SQL.format(bounds=bounds))
+        else:
+            selects.append(ROLLUP_PART_SQL.format(index=index, bounds=bounds))
+            params[f"granularity_{index}"] = source
+    if not selects:
+        return merge([])
+    rows = (await db.execute(
+        text(" UNION ALL ".join(f"({select})" for select in selects)), params
+    )).mappings().all()
+    return merge(rows)
+
+
+async def buckets(
+    db: AnySession,
+    animal_id: uuid.UUID,
+    granularity: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime]
+) -> List[Dict[str, Any]]:
+    """Whole buckets overlapping [date_from, date_to), oldest first."""
+    query = select(models.WeightRollup).filter(
+        models.WeightRollup.animal_id == animal_id,
+        models.WeightRollup.granularity == granularity
+    )
+    if date_from is not None:
+        query = query.filter(
+            models.WeightRollup.bucket_start >= bucket_start(_utc(date_from), granularity))
+    if date_to is not None:
+        query = query.filter(models.WeightRollup.bucket_start < _utc(date_to))
+    rollups = (await db.scalars(query.order_by(models.WeightRollup.bucket_start))).all()
+    return [
+        {
+            "start": rollup.bucket_start,
+            "count": rollup.count,
+            "min": rollup.min,
+            "max": rollup.max,
+            "mean": rollup.sum / rollup.count,
+            "first": rollup.first_weight,
+            "last": rollup.last_weight
+        }
+        for rollup in rollups
+    ]
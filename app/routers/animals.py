@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, auth
-from ..database import get_db
-from ..websocket import manager
+from sqlalchemy import delete, select
+from .. import models, schemas, auth, events
+from ..database import AnySession, get_async_db
 import uuid
 from typing import List, Optional
 from datetime import date
@@ -16,15 +15,14 @@ router = APIRouter(
 @router.post("", response_model=schemas.AnimalResponse)
 async def create_animal(
     animal: schemas.AnimalCreate,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Create a new animal."""
 
     # Verify profile picture if provided
     if animal.profile_picture_id:
-        media = db.query(models.Media).filter(
-            models.Media.id == animal.profile_picture_id).first()
+        media = await db.get(models.Media, animal.profile_picture_id)
         if not media:
             raise HTTPException(
                 status_code=404, detail="Profile picture media not found")
@@ -40,46 +38,47 @@ async def create_animal(
         profile_picture_id=animal.profile_picture_id
     )
     db.add(db_animal)
-    db.commit()
-    db.refresh(db_animal)
-
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    await db.flush()
+    await db.refresh(db_animal)
+
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "ANIMAL_CREATED",
         {
-            "type": "ANIMAL_CREATED",
-            "data": {
-                "id": str(db_animal.id),
-                "name": db_animal.name,
-                "owner_id": str(db_animal.owner_id),
-                "created_at": db_animal.created_at.isoformat(),
-                "updated_at": db_animal.updated_at.isoformat()
-            }
+            "id": str(db_animal.id),
+            "name": db_animal.name,
+            "owner_id": str(db_animal.owner_id),
+            "created_at": db_animal.created_at.isoformat(),
+            "updated_at": db_animal.updated_at.isoformat()
         }
     )
+    await db.commit()
     return db_animal
 
 
 @router.get("", response_model=List[schemas.AnimalResponse])
 async def get_animals(
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Get all animals for the current user."""
-    return db.query(models.Animal).filter(models.Animal.owner_id == current_user.id).all()
+    result = await db.scalars(select(models.Animal).filter(models.Animal.owner_id == current_user.id))
+    return result.all()
 
 
 @router.get("/{animal_id}", response_model=schemas.AnimalResponse)
 async def get_animal(
     animal_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Get an animal by ID."""
-    animal = db.query(models.Animal).filter(
+    animal = await db.scalar(select(models.Animal).filter(
         models.Animal.id == animal_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
@@ -91,14 +90,14 @@ async def get_animal(
 async def update_animal(
     animal_id: uuid.UUID,
     animal_update: schemas.AnimalUpdate,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Update an animal."""
-    animal = db.query(models.Animal).filter(
+    animal = await db.scalar(select(models.Animal).filter(
         models.Animal.id == animal_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
@@ -107,8 +106,7 @@ async def update_animal(
     if animal_update.profile_picture_id is not None:
         # If not None (setting new picture)
         if animal_update.profile_picture_id:
-            media = db.query(models.Media).filter(
-                models.Media.id == animal_update.profile_picture_id).first()
+            media = await db.get(models.Media, animal_update.profile_picture_id)
             if not media:
                 raise HTTPException(
                     status_code=404, detail="Profile picture media not found")
@@ -128,57 +126,56 @@ async def update_animal(
     if animal_update.breed is not None:
         animal.breed = animal_update.breed
 
-    db.commit()
-    db.refresh(animal)
+    await db.flush()
+    await db.refresh(animal)
 
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "ANIMAL_UPDATED",
         {
-            "type": "ANIMAL_UPDATED",
-            "data": {
-                "id": str(animal.id),
-                "name": animal.name,
-                "owner_id": str(animal.owner_id),
-                "created_at": animal.created_at.isoformat(),
-                "updated_at": animal.updated_at.isoformat()
-            }
+            "id": str(animal.id),
+            "name": animal.name,
+            "owner_id": str(animal.owner_id),
+            "created_at": animal.created_at.isoformat(),
+            "updated_at": animal.updated_at.isoformat()
         }
     )
+    await db.commit()
     return animal
 
 
 @router.delete("/{animal_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_animal(
     animal_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Delete an animal."""
-    animal = db.query(models.Animal).filter(
+    animal = await db.scalar(select(models.Animal).filter(
         models.Animal.id == animal_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
 
     # First delete all associated weight entries
-    db.query(models.Weight).filter(
-        models.Weight.animal_id == animal_id).delete()
+    await db.execute(delete(models.Weight).filter(
+        models.Weight.animal_id == animal_id))
 
     # Then delete the animal
-    db.delete(animal)
-    db.commit()
+    await db.delete(animal)
 
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "ANIMAL_DELETED",
         {
-            "type": "ANIMAL_DELETED",
-            "data": {
-                "id": str(animal_id)
-            }
+            "id": str(animal_id)
         }
     )
+    await db.commit()
     return None
@@ -2,11 +2,13 @@ from datetime import datetime, timedelta, UTC
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Path
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from jose import JWTError, jwt
-from ..database import get_db
+from ..database import AnySession, get_async_db
 from .. import models, schemas
-from ..utils.password import hash_password, verify_password, generate_reset_token
+from ..principals import principal_cache, user_changed
+from .. import hashing, refresh_tokens
+from ..utils.password import generate_reset_token
 from ..utils.email import send_password_reset_email, send_verification_email
 import os
 from dotenv import load_dotenv
@@ -45,14 +47,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AnySession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = principal_cache.decode(token, SECRET_KEY, [ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -65,8 +67,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if token_data.exp and token_data.exp < datetime.now(UTC):
         raise credentials_exception
 
-    user = db.query(models.User).filter(
-        models.User.username == token_data.username).first()
+    user = await principal_cache.get_user(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -75,10 +76,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
 @router.post("/login", response_model=schemas.Token)
 async def login(
     credentials: schemas.LoginRequest,
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
-    user = db.query(models.User).filter(
-        models.User.username == credentials.username).first()
+    user = await db.scalar(select(models.User).filter(
+        models.User.username == credentials.username))
 
     if not user:
         raise HTTPException(
@@ -88,39 +89,61 @@ async def login(
         )
 
     # Verify password using bcrypt
-    if not verify_password(credentials.password, user.password_hash):
+    if not await hashing.verify_password(credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Bring the stored hash to the current bcrypt cost while the plain
+    # password is at hand; a busy hashing pool just leaves it for next time
+    rehashed = False
+    if hashing.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = await hashing.hash_password(credentials.password)
+            rehashed = True
+        except HTTPException:
+            pass
+
+    refresh_token = await refresh_tokens.issue(db, user.id)
+    if rehashed:
+        await user_changed(db, user)
+    await db.commit()
+    if rehashed:
+        hashing.REHASHES.inc()
+
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer", "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60}
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token
+    }
 
 
 @router.post("/register", response_model=schemas.Token)
-async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AnySession = Depends(get_async_db)):
     """Register a new user."""
     # Check if username exists
-    if db.query(models.User).filter(models.User.username == user.username).first():
+    if await db.scalar(select(models.User).filter(models.User.username == user.username)):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Username already registered"
         )
 
     # Check if email exists
-    if db.query(models.User).filter(models.User.email == user.email).first():
+    if await db.scalar(select(models.User).filter(models.User.email == user.email)):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Email already registered"
         )
 
     # Hash the password
-    password_hash = hash_password(user.password)
+    password_hash = await hashing.hash_password(user.password)
 
     # Generate verification token
     verification_token = generate_reset_token()
@@ -136,8 +159,10 @@ async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db))
         reset_token_expires=verification_token_expires
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    refresh_token = await refresh_tokens.issue(db, db_user.id)
+    await db.commit()
+    await db.refresh(db_user)
 
     # Send verification email
     try:
@@ -158,17 +183,44 @@ async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db))
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token
+    }
+
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(request: schemas.RefreshRequest, db: AnySession = Depends(get_async_db)):
+    """Trade a refresh token for a new access token and refresh token."""
+    username, refresh_token = await refresh_tokens.rotate(db, request.refresh_token)
+    await db.commit()
+
+    access_token = create_access_token(
+        data={"sub": username},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token
     }
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: schemas.RefreshRequest, db: AnySession = Depends(get_async_db)):
+    """Revoke a refresh token together with every token rotated from it."""
+    await refresh_tokens.revoke(db, request.refresh_token)
+    await db.commit()
+    return None
+
+
 @router.post("/verify-email/{token}")
-async def verify_email(token: str, db: Session = Depends(get_db)):
+async def verify_email(token: str, db: AnySession = Depends(get_async_db)):
     """Verify user's email address."""
-    user = db.query(models.User).filter(
+    user = await db.scalar(select(models.User).filter(
         models.User.reset_token == token,
         models.User.reset_token_expires > datetime.now(UTC)
-    ).first()
+    ))
 
     if not user:
         raise HTTPException(
@@ -179,13 +231,14 @@ async def verify_email(token: str, db: Session = Depends(get_db)):
     user.email_verified = True
     user.reset_token = None
     user.reset_token_expires = None
-    db.commit()
+    await user_changed(db, user)
+    await db.commit()
 
     return {"message": "Email verified successfully"}
 
 
 @router.post("/password-reset")
-async def request_password_reset(email: schemas.PasswordReset, db: Session = Depends(get_db)):
+async def request_password_reset(email: schemas.PasswordReset, db: AnySession = Depends(get_async_db)):
     """Request a password reset."""
     logger.info(f"Password reset requested for email: {email.email}")
 
@@ -194,8 +247,8 @@ async def request_password_reset(email: schemas.PasswordReset, db: Session = Dep
         "message": "If the email exists, a password reset link will be sent"
     }
 
-    user = db.query(models.User).filter(
-        models.User.email == email.email).first()
+    user = await db.scalar(select(models.User).filter(
+        models.User.email == email.email))
     if not user:
         logger.debug(f"No user found with email: {email.email}")
         return response
@@ -210,7 +263,7 @@ async def request_password_reset(email: schemas.PasswordReset, db: Session = Dep
         # Update user with reset token
         user.reset_token = reset_token
         user.reset_token_expires = reset_token_expires
-        db.commit()
+        await db.commit()
         logger.debug(
             f"Reset token generated and saved for user: {user.username}")
 
@@ -229,7 +282,7 @@ async def request_password_reset(email: schemas.PasswordReset, db: Session = Dep
         # Rollback the token update since email failed
         user.reset_token = None
         user.reset_token_expires = None
-        db.commit()
+        await db.commit()
         logger.debug("Reset token cleared due to email failure")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -240,9 +293,9 @@ async def request_password_reset(email: schemas.PasswordReset, db: Session = Dep
 
 
 @router.post("/reset-password")
-def reset_password(request: schemas.PasswordReset, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(
-        models.User.email == request.email).first()
+async def reset_password(request: schemas.PasswordReset, db: AnySession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).filter(
+        models.User.email == request.email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -255,22 +308,22 @@ def reset_password(request: schemas.PasswordReset, db: Session = Depends(get_db)
     # Store reset token in database
     user.reset_token = reset_token
     user.reset_token_expires = datetime.now(UTC) + timedelta(minutes=15)
-    db.commit()
+    await db.commit()
 
     # Send reset email
-    send_password_reset_email(user.email, reset_token)
+    await send_password_reset_email(user.email, reset_token, user.username)
     return {"message": "Password reset email sent"}
 
 
 @router.post("/reset-password/{token}/confirm")
-def reset_password_confirm(
+async def reset_password_confirm(
     token: str = Path(..., description="Reset token from email"),
     request: schemas.PasswordResetConfirm = None,
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
     # Find user by reset token
-    user = db.query(models.User).filter(
-        models.User.reset_token == token).first()
+    user = await db.scalar(select(models.User).filter(
+        models.User.reset_token == token))
     if not user:
         raise HTTPException(status_code=400, detail="Invalid reset token")
 
@@ -279,10 +332,12 @@ def reset_password_confirm(
         raise HTTPException(status_code=400, detail="Reset token has expired")
 
     # Hash and update password
-    user.password_hash = hash_password(request.password)
+    user.password_hash = await hashing.hash_password(request.password)
     user.reset_token = None
     user.reset_token_expires = None
-    db.commit()
+    await refresh_tokens.revoke_user(db, user.id)
+    await user_changed(db, user)
+    await db.commit()
 
     return {"message": "Password has been reset successfully"}
 
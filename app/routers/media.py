@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from typing import Optional
 import os
 import uuid
 import shutil
 from pathlib import Path
 
-from ..database import get_db
+from ..database import AnySession, get_async_db
 from ..models import Media, User
 from ..dependencies import get_current_user
 
@@ -32,7 +32,7 @@ MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 @router.post("")
 async def upload_media(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload a media file."""
@@ -71,8 +71,8 @@ async def upload_media(
         size=len(content)
     )
     db.add(media)
-    db.commit()
-    db.refresh(media)
+    await db.commit()
+    await db.refresh(media)
 
     return {
         "id": media.id,
@@ -87,7 +87,7 @@ async def upload_media(
 @router.get("/{filename}")
 async def get_media_file(
     filename: str,
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
     """Get media file by filename."""
     file_path = UPLOAD_DIR / filename
@@ -102,7 +102,7 @@ async def get_media_file(
             raise HTTPException(status_code=404, detail="Media file not found")
 
     # Get media record for content type
-    media = db.query(Media).filter(Media.filename == filename).first()
+    media = await db.scalar(select(Media).filter(Media.filename == filename))
     content_type = media.content_type if media else 'image/svg+xml'
 
     return Response(content=file_path.read_bytes(), media_type=content_type)
@@ -111,11 +111,11 @@ async def get_media_file(
 @router.delete("/{media_id}")
 async def delete_media(
     media_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete media file by ID."""
-    media = db.query(Media).filter(Media.id == media_id).first()
+    media = await db.get(Media, media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
 
@@ -125,7 +125,7 @@ async def delete_media(
         file_path.unlink()
 
     # Delete database record
-    db.delete(media)
-    db.commit()
+    await db.delete(media)
+    await db.commit()
 
     return {"message": "Media deleted successfully"}
@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from typing import Optional
 import uuid
 from fastapi import status
 
-from ..database import get_db
+from ..database import AnySession, get_async_db
 from ..models import User, Media
 from ..dependencies import get_current_user
+from ..principals import user_changed
 from ..schemas.users import UserProfile, UserProfileUpdate, PasswordUpdate
-from ..utils.password import verify_password, hash_password
+from .. import hashing, refresh_tokens
 
 router = APIRouter(
     prefix="/api/users",
@@ -44,17 +45,17 @@ async def get_current_user_profile(
 @router.patch("/me", response_model=UserProfile)
 async def update_current_user_profile(
     profile_update: UserProfileUpdate,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update current user's profile."""
 
     # Check for duplicate username if username is being updated
     if profile_update.username is not None:
-        existing_user = db.query(User).filter(
+        existing_user = await db.scalar(select(User).filter(
             User.username == profile_update.username,
             User.id != current_user.id
-        ).first()
+        ))
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -66,8 +67,7 @@ async def update_current_user_profile(
     if profile_update.profile_picture_id is not None:
         # If not None (setting new picture)
         if profile_update.profile_picture_id:
-            media = db.query(Media).filter(
-                Media.id == profile_update.profile_picture_id).first()
+            media = await db.get(Media, profile_update.profile_picture_id)
             if not media:
                 raise HTTPException(
                     status_code=404, detail="Profile picture media not found")
@@ -81,13 +81,15 @@ async def update_current_user_profile(
     if profile_update.last_name is not None:
         current_user.last_name = profile_update.last_name
 
-    db.commit()
-    db.refresh(current_user)
+    await user_changed(db, current_user)
+    await db.commit()
+    await db.refresh(current_user)
 
     return {
         "id": current_user.id,
         "username": current_user.username,
         "email": current_user.email,
+        "email_verified": current_user.email_verified,
         "first_name": current_user.first_name,
         "last_name": current_user.last_name,
         "profile_picture": {
@@ -106,21 +108,22 @@ async def update_current_user_profile(
 @router.post("/password", status_code=status.HTTP_204_NO_CONTENT)
 async def update_password(
     password_update: PasswordUpdate,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update user's password."""
     # Verify current password
-    if not verify_password(password_update.current_password, current_user.password_hash, current_user.salt):
+    if not await hashing.verify_password(password_update.current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
 
     # Hash new password
-    hashed_password, salt = hash_password(password_update.new_password)
-    current_user.password_hash = hashed_password
-    current_user.salt = salt
+    current_user.password_hash = await hashing.hash_password(password_update.new_password)
 
-    db.commit()
+    # Every device has to log in again with the new password
+    await refresh_tokens.revoke_user(db, current_user.id)
+    await user_changed(db, current_user)
+    await db.commit()
     return None
@@ -1,29 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, auth
-from ..database import get_db
-from ..websocket import manager
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+from starlette.concurrency import run_in_threadpool
+from .. import models, schemas, auth, analytics, charts, events, rollups
+from ..database import AnySession, copy_records, get_async_db, get_session_scope
+import base64
+import codecs
+import csv
+import io
+import json
+import os
+import tempfile
 import uuid
-from typing import List
-from datetime import UTC, datetime
+import zlib
+from collections import Counter, deque
+from decimal import Decimal
+from typing import IO, AsyncIterator, Deque, Dict, Iterator, List, Literal, Optional, Tuple
+from datetime import UTC, datetime, timedelta
+import orjson
 
 router = APIRouter(
     prefix="/api/weights",
     tags=["weights"]
 )
 
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Bulk import: rows per COPY, rows per import (one transaction), lines a
+# quoted CSV field may span and bytes of parsed rows kept in memory before
+# they are spooled to a temporary file
+IMPORT_BATCH_SIZE = int(os.getenv("WEIGHT_IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ROWS = int(os.getenv("WEIGHT_IMPORT_MAX_ROWS", "250000"))
+IMPORT_MAX_RECORD_LINES = 100
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+IMPORT_COLUMNS = ("animal_id", "weight", "date")
+# Animals listed in a WEIGHTS_IMPORTED event; beyond that the list is cut
+# and flagged truncated, and clients reload everything
+IMPORT_EVENT_MAX_ANIMALS = 100
+CSV_CONTENT_TYPES = {"text/csv"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-lines"}
+# weights.weight is NUMERIC(10, 2)
+MAX_WEIGHT = Decimal("100000000")
+
+# Export: rows fetched per round trip of the server-side cursor
+EXPORT_BATCH_SIZE = 2000
+EXPORT_COLUMNS = ("id", "animal_id", "animal_name", "weight", "date", "created_at", "updated_at")
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+DEFAULT_BATCH_LIMIT = 100
+MAX_BATCH_ANIMALS = 500
+
+DEFAULT_CHART_POINTS = 500
+MAX_CHART_POINTS = 5000
+
+DEFAULT_FORECAST_WEEKS = 8
+MAX_FORECAST_WEEKS = 104
+# Days of history before the latest reading the forecast line is fitted to
+DEFAULT_FORECAST_WINDOW = 90
+
+
+def encode_cursor(date: datetime, weight_id: uuid.UUID) -> str:
+    """Opaque cursor pointing just past the (date, id) of a weight."""
+    raw = json.dumps([date.isoformat(), str(weight_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, weight_id = json.loads(raw)
+        return datetime.fromisoformat(date), uuid.UUID(weight_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 @router.post("/", response_model=schemas.WeightResponse)
 async def create_weight(
     weight: schemas.WeightCreate,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
     # Verify the animal belongs to the current user
-    animal = db.query(models.Animal).filter(
+    animal = await db.scalar(select(models.Animal).filter(
         models.Animal.id == weight.animal_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
@@ -35,43 +98,628 @@ async def create_weight(
         date=weight.date
     )
     db.add(db_weight)
-    db.commit()
-    db.refresh(db_weight)
+    await db.flush()
+    await db.refresh(db_weight)
+    await rollups.apply(db, added=[
+        (db_weight.id, db_weight.animal_id, db_weight.weight, db_weight.date)])
 
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "WEIGHT_CREATED",
         {
-            "type": "WEIGHT_CREATED",
-            "data": {
-                "id": str(db_weight.id),
-                "animal_id": str(db_weight.animal_id),
-                "weight": float(db_weight.weight),
-                "date": db_weight.date.isoformat(),
-                "created_at": db_weight.created_at.isoformat(),
-                "updated_at": db_weight.updated_at.isoformat()
-            }
+            "id": str(db_weight.id),
+            "animal_id": str(db_weight.animal_id),
+            "weight": float(db_weight.weight),
+            "date": db_weight.date.isoformat(),
+            "created_at": db_weight.created_at.isoformat(),
+            "updated_at": db_weight.updated_at.isoformat()
         }
     )
+    await db.commit()
     return db_weight
 
 
+async def _read_lines(request: Request) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered lines of the request body as it streams in, with their ends."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    line_number = 0
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_number + 1, pending
+
+
+class _LineFeed:
+    """Input of a csv.reader, filled one complete record at a time."""
+
+    def __init__(self) -> None:
+        self.lines: Deque[str] = deque()
+
+    def __iter__(self) -> "_LineFeed":
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def _read_csv_rows(request: Request) -> AsyncIterator[Tuple[int, dict]]:
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    record_line = None
+    quotes = 0
+    async for line_number, line in _read_lines(request):
+        feed.lines.append(line)
+        record_line = record_line or line_number
+        # A quoted field may span lines; the record ends where its quotes
+        # pair up, and only then is it handed to the reader
+        quotes += line.count('"')
+        if quotes % 2:
+            if len(feed.lines) > IMPORT_MAX_RECORD_LINES:
+                break
+            continue
+        try:
+            fields = next(reader)
+        except csv.Error:
+            raise HTTPException(
+                status_code=422, detail=f"Invalid CSV on line {record_line}")
+        line_number, record_line, quotes = record_line, None, 0
+        if not any(field.strip() for field in fields):
+            continue
+        if header is None:
+            header = [field.strip() for field in fields]
+            missing = [name for name in IMPORT_COLUMNS if name not in header]
+            if missing:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"CSV header is missing {', '.join(missing)}")
+            continue
+        yield line_number, dict(zip(header, fields))
+    if feed.lines:
+        raise HTTPException(
+            status_code=422, detail=f"Unterminated quoted field on line {record_line}")
+
+
+async def _read_ndjson_rows(request: Request) -> AsyncIterator[Tuple[int, dict]]:
+    async for line_number, line in _read_lines(request):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        if not isinstance(row, dict):
+            raise HTTPException(
+                status_code=422, detail=f"Invalid JSON on line {line_number}")
+        yield line_number, row
+
+
+def _parse_import_row(row: dict, line_number: int) -> Tuple[uuid.UUID, Decimal, datetime]:
+    try:
+        animal_id = uuid.UUID(str(row["animal_id"]))
+        weight = Decimal(str(row["weight"]).strip())
+        date = datetime.fromisoformat(str(row["date"]).strip())
+    except (KeyError, ValueError, ArithmeticError):
+        raise HTTPException(
+            status_code=422, detail=f"Invalid row on line {line_number}")
+    if not weight.is_finite() or not 0 < weight < MAX_WEIGHT:
+        raise HTTPException(
+            status_code=422, detail=f"Invalid weight on line {line_number}")
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+    return animal_id, weight, date
+
+
+def _spooled_readings(spool: IO[str]) -> Iterator[List[rollups.Reading]]:
+    """Parsed rows back from the spool, in batches of IMPORT_BATCH_SIZE."""
+    spool.seek(0)
+    batch: List[rollups.Reading] = []
+    for line in spool:
+        animal_id, weight, date = line.rstrip("\n").split(",")
+        batch.append((
+            uuid.uuid4(), uuid.UUID(animal_id), Decimal(weight), datetime.fromisoformat(date)))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@router.post("/import", response_model=schemas.WeightImportResult)
+async def import_weights(
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Bulk load weights for the user's animals from CSV or NDJSON.
+
+    Each row has animal_id, weight and date (ISO 8601, UTC if no offset);
+    CSV needs a header line. The body is parsed as it streams in and the
+    rows are spooled; once every animal is known to be the user's and
+    locked, they are loaded with COPY in batches of IMPORT_BATCH_SIZE, all
+    in one transaction, and announced with a single WEIGHTS_IMPORTED event.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in CSV_CONTENT_TYPES | NDJSON_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson")
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        rows = _read_ndjson_rows(request)
+    else:
+        rows = _read_csv_rows(request)
+    imported = 0
+    counts: Dict[uuid.UUID, int] = Counter()
+    first_date = last_date = None
+
+    with tempfile.SpooledTemporaryFile(
+        max_size=IMPORT_SPOOL_BYTES, mode="w+", newline=""
+    ) as spool:
+        # Parse everything first: the animals of the whole import have to
+        # be known before any of them is written
+        async for line_number, row in rows:
+            if imported >= IMPORT_MAX_ROWS:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"At most {IMPORT_MAX_ROWS} rows per import")
+            animal_id, weight, date = _parse_import_row(row, line_number)
+            spool.write(f"{animal_id},{weight},{date.isoformat()}\n")
+            imported += 1
+            counts[animal_id] += 1
+            first_date = min(first_date or date, date)
+            last_date = max(last_date or date, date)
+        if not imported:
+            return {"imported": 0, "animals": {}}
+
+        owned = set((await db.scalars(select(models.Animal.id).filter(
+            models.Animal.id.in_(counts),
+            models.Animal.owner_id == current_user.id
+        ))).all())
+        if owned != set(counts):
+            raise HTTPException(status_code=404, detail="Animal not found")
+        # Every rollup lock upfront and in the shared order, so concurrent
+        # writes of the same animals can't deadlock with the batches below
+        await rollups.lock(db, counts)
+
+        # One summary event instead of one per row, so the change triggers
+        # are muted; clients reload the animals
+        await events.mute_triggers(db)
+        for batch in _spooled_readings(spool):
+            await db.run_sync(
+                copy_records, "weights", ("id", "animal_id", "weight", "date"), batch)
+            await rollups.apply(db, added=batch)
+
+    # Published last, so it doesn't hold up other publishers during the load
+    data = {
+        "animal_ids": [str(animal_id) for animal_id in counts][:IMPORT_EVENT_MAX_ANIMALS],
+        "count": imported,
+        "from": first_date.isoformat(),
+        "to": last_date.isoformat()
+    }
+    if len(counts) > IMPORT_EVENT_MAX_ANIMALS:
+        data["truncated"] = True
+    await events.publish(db, current_user.id, "WEIGHTS_IMPORTED", data)
+    await db.commit()
+    return {"imported": imported, "animals": counts}
+
+
 @router.get("/animal/{animal_id}", response_model=List[schemas.WeightResponse])
 async def get_animal_weights(
     animal_id: uuid.UUID,
+    response: Response,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
+    """Weights of an animal ordered by date, one page at a time.
+
+    ``from`` is inclusive and ``to`` exclusive. When more rows follow, the
+    cursor for the next page is returned in the X-Next-Cursor header.
+    """
     # Verify the animal belongs to the current user
-    animal = db.query(models.Animal).filter(
+    animal = await db.scalar(select(models.Animal).filter(
         models.Animal.id == animal_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
 
-    return db.query(models.Weight).filter(models.Weight.animal_id == animal_id).all()
+    query = select(
+        models.Weight.id,
+        models.Weight.animal_id,
+        models.Weight.weight,
+        models.Weight.date,
+        models.Weight.created_at,
+        models.Weight.updated_at
+    ).filter(models.Weight.animal_id == animal_id)
+    if date_from is not None:
+        query = query.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Weight.date < date_to)
+    if cursor is not None:
+        query = query.filter(
+            tuple_(models.Weight.date, models.Weight.id) > decode_cursor(cursor))
+    # One extra row tells whether there is a next page
+    query = query.order_by(models.Weight.date, models.Weight.id).limit(limit + 1)
+
+    rows = (await db.execute(query)).mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            rows[-1]["date"], rows[-1]["id"])
+    return rows
+
+
+async def _owned_animal_ids(
+    db: AnySession,
+    owner_id: uuid.UUID,
+    animal_ids: Optional[List[uuid.UUID]]
+) -> List[uuid.UUID]:
+    """The requested animals, or all of the owner's when None, in id order."""
+    if animal_ids is not None and len(set(animal_ids)) > MAX_BATCH_ANIMALS:
+        raise HTTPException(
+            status_code=422, detail=f"At most {MAX_BATCH_ANIMALS} animals per request")
+
+    # Verify the animals belong to the current user, all in one query
+    query = select(models.Animal.id).filter(models.Animal.owner_id == owner_id)
+    if animal_ids is not None:
+        query = query.filter(models.Animal.id.in_(set(animal_ids)))
+    owned = (await db.scalars(query.order_by(models.Animal.id))).all()
+    if animal_ids is not None and len(owned) != len(set(animal_ids)):
+        raise HTTPException(status_code=404, detail="Animal not found")
+    return owned
+
+
+@router.get("/batch", response_model=List[schemas.AnimalWeights])
+async def get_weights_batch(
+    animal_ids: Optional[List[uuid.UUID]] = Query(None, alias="animal_id"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_BATCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """The latest weights of several animals in one request.
+
+    Pass ``animal_id`` once per animal, or leave it out for all of the
+    user's animals. At most ``limit`` readings per animal are returned,
+    oldest first; ``from`` is inclusive and ``to`` exclusive.
+    """
+    owned = await _owned_animal_ids(db, current_user.id, animal_ids)
+
+    # Number each animal's readings from the latest; one row past the
+    # limit tells whether older ones were left out
+    ranked = select(
+        models.Weight.id,
+        models.Weight.animal_id,
+        models.Weight.weight,
+        models.Weight.date,
+        models.Weight.created_at,
+        models.Weight.updated_at,
+        func.row_number().over(
+            partition_by=models.Weight.animal_id,
+            order_by=(models.Weight.date.desc(), models.Weight.id.desc())
+        ).label("rank")
+    ).filter(models.Weight.animal_id.in_(owned))
+    if date_from is not None:
+        ranked = ranked.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        ranked = ranked.filter(models.Weight.date < date_to)
+    ranked = ranked.subquery()
+    rows = (await db.execute(
+        select(ranked).filter(ranked.c.rank <= limit + 1).order_by(
+            ranked.c.animal_id, ranked.c.date, ranked.c.id)
+    )).mappings().all() if owned else []
+
+    series = {animal_id: {"animal_id": animal_id, "weights": [], "has_more": False}
+              for animal_id in owned}
+    for row in rows:
+        entry = series[row["animal_id"]]
+        if row["rank"] > limit:
+            entry["has_more"] = True
+        else:
+            entry["weights"].append(row)
+    return list(series.values())
+
+
+def _export_chunk(rows, export_format: str) -> bytes:
+    if export_format == "ndjson":
+        return b"".join(
+            orjson.dumps(
+                dict(zip(EXPORT_COLUMNS, (*row[:3], float(row[3]), *row[4:]))),
+                option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (*row[:4], *(value.isoformat() for value in row[4:])) for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def _export_stream(
+    session_scope, query, export_format: str, compress: bool
+) -> AsyncIterator[bytes]:
+    """Serialized rows of the query, one chunk per batch of the cursor.
+
+    Only one batch of rows is held in memory at a time.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    def encode(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor is not None else chunk
+
+    if export_format == "csv":
+        yield encode((",".join(EXPORT_COLUMNS) + "\r\n").encode())
+    async with session_scope() as db:
+        result = await db.stream(query, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+        try:
+            async for rows in result.partitions():
+                chunk = encode(_export_chunk(rows, export_format))
+                if chunk:
+                    yield chunk
+        finally:
+            await result.close()
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@router.get("/export")
+async def export_weights(
+    request: Request,
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    animal_ids: Optional[List[uuid.UUID]] = Query(None, alias="animal_id"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db),
+    session_scope=Depends(get_session_scope)
+):
+    """Stream the weight history of some or all of the user's animals.
+
+    CSV (with a header line) or NDJSON, ordered by animal and date; the
+    columns include those POST /import expects. The body is gzipped when
+    the client accepts it.
+    """
+    owned = await _owned_animal_ids(db, current_user.id, animal_ids)
+
+    query = select(
+        models.Weight.id,
+        models.Weight.animal_id,
+        models.Animal.name,
+        models.Weight.weight,
+        models.Weight.date,
+        models.Weight.created_at,
+        models.Weight.updated_at
+    ).join(models.Animal).filter(models.Animal.owner_id == current_user.id)
+    if animal_ids is not None:
+        query = query.filter(models.Weight.animal_id.in_(owned))
+    if date_from is not None:
+        query = query.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Weight.date < date_to)
+    query = query.order_by(models.Weight.animal_id, models.Weight.date, models.Weight.id)
+
+    compress = "gzip" in request.headers.get("accept-encoding", "").lower()
+    filename = f"weights-{datetime.now(UTC):%Y%m%d}.{export_format}"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Vary": "Accept-Encoding"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _export_stream(session_scope, query, export_format, compress),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers=headers
+    )
+
+
+@router.get("/animal/{animal_id}/chart", response_model=schemas.WeightChart)
+async def get_animal_weight_chart(
+    animal_id: uuid.UUID,
+    points: int = Query(DEFAULT_CHART_POINTS, ge=3, le=MAX_CHART_POINTS),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Weight series of an animal downsampled to at most `points` points.
+
+    Uses Largest-Triangle-Three-Buckets, which keeps the peaks and dips a
+    chart needs. ``from`` is inclusive and ``to`` exclusive.
+    """
+    # Verify the animal belongs to the current user
+    animal = await db.scalar(select(models.Animal).filter(
+        models.Animal.id == animal_id,
+        models.Animal.owner_id == current_user.id
+    ))
+
+    if not animal:
+        raise HTTPException(status_code=404, detail="Animal not found")
+
+    cached = charts.chart_cache.get(animal_id, date_from, date_to, points)
+    if cached is not None:
+        return cached
+    generation = charts.chart_cache.generation()
+
+    query = select(models.Weight.date, models.Weight.weight).filter(
+        models.Weight.animal_id == animal_id)
+    if date_from is not None:
+        query = query.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Weight.date < date_to)
+    rows = (await db.execute(
+        query.order_by(models.Weight.date, models.Weight.id))).all()
+
+    chart = {
+        "total": len(rows),
+        "points": await run_in_threadpool(charts.downsample, rows, points)
+    }
+    charts.chart_cache.put(
+        animal_id, date_from, date_to, points, value=chart, generation=generation)
+    return chart
+
+
+@router.get("/animal/{animal_id}/stats", response_model=schemas.WeightStats)
+async def get_animal_weight_stats(
+    animal_id: uuid.UUID,
+    granularity: Literal["day", "week", "month"] = "day",
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Aggregates of an animal's weights served from the rollup tables.
+
+    The summary covers exactly ``from`` (inclusive) to ``to`` (exclusive);
+    buckets are whole UTC days, weeks or months overlapping that range.
+    """
+    # Verify the animal belongs to the current user
+    animal = await db.scalar(select(models.Animal).filter(
+        models.Animal.id == animal_id,
+        models.Animal.owner_id == current_user.id
+    ))
+
+    if not animal:
+        raise HTTPException(status_code=404, detail="Animal not found")
+
+    return {
+        "granularity": granularity,
+        "summary": await rollups.summarize(db, animal_id, date_from, date_to),
+        "buckets": await rollups.buckets(db, animal_id, granularity, date_from, date_to)
+    }
+
+
+@router.get("/animal/{animal_id}/trend", response_model=schemas.WeightTrend)
+async def get_animal_weight_trend(
+    animal_id: uuid.UUID,
+    halflife: float = Query(analytics.DEFAULT_HALFLIFE_DAYS, gt=0, le=365),
+    threshold: float = Query(analytics.DEFAULT_Z_THRESHOLD, gt=0),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Smoothed weight, weekly rate of change and sudden gains or losses.
+
+    ``halflife`` is in days; readings whose robust z-score exceeds
+    ``threshold`` are reported as anomalies.
+    """
+    # Verify the animal belongs to the current user
+    animal = await db.scalar(select(models.Animal).filter(
+        models.Animal.id == animal_id,
+        models.Animal.owner_id == current_user.id
+    ))
+
+    if not animal:
+        raise HTTPException(status_code=404, detail="Animal not found")
+
+    query = select(models.Weight.date, models.Weight.weight).filter(
+        models.Weight.animal_id == animal_id)
+    if date_from is not None:
+        query = query.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Weight.date < date_to)
+    rows = (await db.execute(
+        query.order_by(models.Weight.date, models.Weight.id))).all()
+
+    return await run_in_threadpool(analytics.analyze, rows, halflife, threshold)
+
+
+@router.get("/animal/{animal_id}/forecast", response_model=schemas.WeightForecast)
+async def get_animal_weight_forecast(
+    animal_id: uuid.UUID,
+    weeks: int = Query(DEFAULT_FORECAST_WEEKS, ge=1, le=MAX_FORECAST_WEEKS),
+    window: int = Query(DEFAULT_FORECAST_WINDOW, ge=7, le=3650),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Weekly weight projections with 95% prediction bands.
+
+    A straight line is fitted to the last ``window`` days of readings from
+    the least-squares sums kept in the rollups, and cached per animal
+    until its weights change.
+    """
+    # Verify the animal belongs to the current user
+    animal = await db.scalar(select(models.Animal).filter(
+        models.Animal.id == animal_id,
+        models.Animal.owner_id == current_user.id
+    ))
+
+    if not animal:
+        raise HTTPException(status_code=404, detail="Animal not found")
+
+    fit = analytics.fit_cache.get(animal_id, "forecast", window)
+    if fit is None:
+        generation = analytics.fit_cache.generation()
+        last_date = await db.scalar(select(func.max(models.WeightRollup.last_date)).filter(
+            models.WeightRollup.animal_id == animal_id,
+            models.WeightRollup.granularity == "month"
+        ))
+        summary = rollups.merge([])
+        if last_date is not None:
+            summary = await rollups.summarize(
+                db, animal_id, last_date - timedelta(days=window), None)
+        fit = analytics.fit_line(summary)
+        analytics.fit_cache.put(
+            animal_id, "forecast", window, value=fit, generation=generation)
+
+    return {
+        "count": fit["count"],
+        "slope_per_week": fit["slope"] * 7 if fit["slope"] is not None else None,
+        "residual_std": fit.get("residual_std"),
+        "points": analytics.forecast(fit, weeks)
+    }
+
+
+@router.get("/trends", response_model=List[schemas.AnimalWeightTrend])
+async def get_weight_trends(
+    halflife: float = Query(analytics.DEFAULT_HALFLIFE_DAYS, gt=0, le=365),
+    threshold: float = Query(analytics.DEFAULT_Z_THRESHOLD, gt=0),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_async_db)
+):
+    """Weight trends of all the user's animals, read in a single query."""
+    animal_ids = (await db.scalars(select(models.Animal.id).filter(
+        models.Animal.owner_id == current_user.id
+    ).order_by(models.Animal.id))).all()
+
+    query = select(
+        models.Weight.animal_id, models.Weight.date, models.Weight.weight
+    ).join(models.Animal).filter(models.Animal.owner_id == current_user.id)
+    if date_from is not None:
+        query = query.filter(models.Weight.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Weight.date < date_to)
+    rows = (await db.execute(query.order_by(
+        models.Weight.animal_id, models.Weight.date, models.Weight.id))).all()
+
+    trends = {
+        trend["animal_id"]: trend
+        for trend in await run_in_threadpool(
+            analytics.analyze_many, rows, halflife, threshold)
+    }
+    # Animals without readings in the range are listed as well
+    return [
+        trends.get(animal_id) or {"animal_id": animal_id, **analytics.analyze([])}
+        for animal_id in animal_ids
+    ]
 
 
 @router.put("/{weight_id}", response_model=schemas.WeightResponse)
@@ -79,37 +727,44 @@ async def update_weight(
     weight_id: uuid.UUID,
     weight: schemas.WeightUpdate,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
-    db_weight = db.query(models.Weight).join(models.Animal).filter(
+    db_weight = await db.scalar(select(models.Weight).join(models.Animal).filter(
         models.Weight.id == weight_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not db_weight:
         raise HTTPException(status_code=404, detail="Weight entry not found")
 
+    # Taken out of its buckets as it was, and put back as it is now
+    previous = (db_weight.id, db_weight.animal_id, db_weight.weight, db_weight.date)
     for key, value in weight.model_dump().items():
         setattr(db_weight, key, value)
 
-    db.commit()
-    db.refresh(db_weight)
+    await db.flush()
+    await db.refresh(db_weight)
+    await rollups.apply(
+        db,
+        added=[(db_weight.id, db_weight.animal_id, db_weight.weight, db_weight.date)],
+        removed=[previous]
+    )
 
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "WEIGHT_UPDATED",
         {
-            "type": "WEIGHT_UPDATED",
-            "data": {
-                "id": str(db_weight.id),
-                "animal_id": str(db_weight.animal_id),
-                "weight": float(db_weight.weight),
-                "date": db_weight.date.isoformat(),
-                "created_at": db_weight.created_at.isoformat(),
-                "updated_at": db_weight.updated_at.isoformat()
-            }
+            "id": str(db_weight.id),
+            "animal_id": str(db_weight.animal_id),
+            "weight": float(db_weight.weight),
+            "date": db_weight.date.isoformat(),
+            "created_at": db_weight.created_at.isoformat(),
+            "updated_at": db_weight.updated_at.isoformat()
         }
     )
+    await db.commit()
     return db_weight
 
 
@@ -117,29 +772,31 @@ async def update_weight(
 async def delete_weight(
     weight_id: uuid.UUID,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(get_async_db)
 ):
-    db_weight = db.query(models.Weight).join(models.Animal).filter(
+    db_weight = await db.scalar(select(models.Weight).join(models.Animal).filter(
         models.Weight.id == weight_id,
         models.Animal.owner_id == current_user.id
-    ).first()
+    ))
 
     if not db_weight:
         raise HTTPException(status_code=404, detail="Weight entry not found")
 
     animal_id = db_weight.animal_id
-    db.delete(db_weight)
-    db.commit()
+    removed = (db_weight.id, animal_id, db_weight.weight, db_weight.date)
+    await db.delete(db_weight)
+    await db.flush()
+    await rollups.apply(db, removed=[removed])
 
-    # Broadcast the change
-    await manager.broadcast_to_user(
-        str(current_user.id),
+    # Publish the change together with the commit
+    await events.publish(
+        db,
+        current_user.id,
+        "WEIGHT_DELETED",
         {
-            "type": "WEIGHT_DELETED",
-            "data": {
-                "id": str(weight_id),
-                "animal_id": str(animal_id)
-            }
+            "id": str(weight_id),
+            "animal_id": str(animal_id)
         }
     )
+    await db.commit()
     return None
@@ -10,6 +10,7 @@ from .users import (
     PasswordResetConfirm,
     Token,
     TokenData,
+    RefreshRequest,
     LoginRequest
 )
 
@@ -24,7 +25,19 @@ from .weights import (
     WeightBase,
     WeightCreate,
     WeightUpdate,
-    WeightResponse
+    WeightResponse,
+    WeightImportResult,
+    WeightChartPoint,
+    WeightChart,
+    WeightBucket,
+    WeightSummary,
+    WeightStats,
+    WeightAnomaly,
+    WeightTrend,
+    AnimalWeightTrend,
+    WeightForecastPoint,
+    WeightForecast,
+    AnimalWeights
 )
 
 from .media import MediaResponse
@@ -40,6 +53,7 @@ __all__ = [
     "PasswordResetConfirm",
     "Token",
     "TokenData",
+    "RefreshRequest",
     "LoginRequest",
 
     # Animals
@@ -53,6 +67,18 @@ __all__ = [
     "WeightCreate",
     "WeightUpdate",
     "WeightResponse",
+    "WeightImportResult",
+    "WeightChartPoint",
+    "WeightChart",
+    "WeightBucket",
+    "WeightSummary",
+    "WeightStats",
+    "WeightAnomaly",
+    "WeightTrend",
+    "AnimalWeightTrend",
+    "WeightForecastPoint",
+    "WeightForecast",
+    "AnimalWeights",
 
     # Media
     "MediaResponse"
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, UUID4
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict, List, Literal, Optional
 
 
 class WeightBase(BaseModel):
@@ -25,3 +26,96 @@ class WeightResponse(WeightBase):
 
     class Config:
         from_attributes = True
+
+
+class WeightImportResult(BaseModel):
+    imported: int
+    # Rows imported per animal
+    animals: Dict[UUID4, int]
+
+
+class WeightChartPoint(BaseModel):
+    date: datetime
+    weight: float
+
+
+class WeightChart(BaseModel):
+    # Readings in the requested range before downsampling
+    total: int
+    points: List[WeightChartPoint]
+
+
+class WeightBucket(BaseModel):
+    # Start of the UTC day, week (Monday) or month
+    start: datetime
+    count: int
+    min: Decimal
+    max: Decimal
+    mean: float
+    first: Decimal
+    last: Decimal
+
+
+class WeightSummary(BaseModel):
+    count: int
+    min: Optional[Decimal] = None
+    max: Optional[Decimal] = None
+    mean: Optional[float] = None
+    first_date: Optional[datetime] = None
+    first: Optional[Decimal] = None
+    last_date: Optional[datetime] = None
+    last: Optional[Decimal] = None
+
+
+class WeightStats(BaseModel):
+    granularity: Literal["day", "week", "month"]
+    # Exactly the readings in the requested range
+    summary: WeightSummary
+    # Whole buckets overlapping the range
+    buckets: List[WeightBucket]
+
+
+class WeightAnomaly(BaseModel):
+    date: datetime
+    weight: float
+    # Smoothed weight before this reading
+    expected: float
+    # Robust z-score of the difference
+    z: float
+    direction: Literal["gain", "loss"]
+
+
+class WeightTrend(BaseModel):
+    count: int
+    smoothed: Optional[float] = None
+    rate_per_week: Optional[float] = None
+    rate_percent_per_week: Optional[float] = None
+    anomalies: List[WeightAnomaly]
+
+
+class AnimalWeightTrend(WeightTrend):
+    animal_id: UUID4
+
+
+class WeightForecastPoint(BaseModel):
+    date: datetime
+    weight: float
+    # 95% prediction interval
+    lower: float
+    upper: float
+
+
+class WeightForecast(BaseModel):
+    # Readings the line was fitted to
+    count: int
+    slope_per_week: Optional[float] = None
+    residual_std: Optional[float] = None
+    points: List[WeightForecastPoint]
+
+
+class AnimalWeights(BaseModel):
+    animal_id: UUID4
+    # The latest readings in the range, oldest first
+    weights: List[WeightResponse]
+    # Whether older readings in the range were left out
+    has_more: bool
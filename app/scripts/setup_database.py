@@ -10,6 +10,8 @@ import psycopg2
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 import bcrypt
+from alembic import command
+from alembic.config import Config
 
 from app.models import Base, User, Animal, Weight, Media
 from app.database import engine
@@ -153,6 +155,13 @@ def create_weight_entries(animal: Animal, num_entries: int) -> List[Weight]:
     return weights
 
 
+def run_migrations():
+    """Apply the Alembic migrations (triggers, indexes) to the fresh tables."""
+    config = Config(str(Path(__file__).resolve().parents[2] / "alembic.ini"))
+    command.stamp(config, "base", purge=True)
+    command.upgrade(config, "head")
+
+
 def setup_database():
     """Set up the database and populate it with sample data."""
     try:
@@ -164,6 +173,9 @@ def setup_database():
         Base.metadata.create_all(engine)
         print("Created new tables")
 
+        run_migrations()
+        print("Applied migrations")
+
         # Create a session
         Session = sessionmaker(bind=engine)
         db = Session()
@@ -1,5 +1,6 @@
 import os
 import uuid
+from contextlib import asynccontextmanager
 from datetime import UTC, datetime, timedelta
 from typing import Generator, List
 
@@ -9,8 +10,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app import models
-from app.database import Base, get_db
+from app.database import Base, SyncSessionAdapter, get_async_db, get_db, get_session_scope
 from app.main import app
+from app.middleware import rate_limit
+from app.principals import principal_cache
 
 # Test database configuration
 SQLALCHEMY_DATABASE_URL = "postgresql://{}:{}@{}:{}/{}".format(
@@ -47,10 +50,21 @@ def client(db: Session) -> Generator[TestClient, None, None]:
         finally:
             db.close()
 
+    async def override_get_async_db():
+        yield SyncSessionAdapter(db)
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_session_scope] = lambda: asynccontextmanager(
+        override_get_async_db)
+    # Users of earlier tests had the same usernames and addresses
+    principal_cache.clear()
+    rate_limit.backend = rate_limit.LocalBackend(rate_limit.RATE_LIMIT_MAX_KEYS)
     client = TestClient(app)
     yield client
     del app.dependency_overrides[get_db]
+    del app.dependency_overrides[get_async_db]
+    del app.dependency_overrides[get_session_scope]
 
 
 @pytest.fixture(scope="function")
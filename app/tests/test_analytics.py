@@ -0,0 +1,95 @@
+import math
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from app.analytics import analyze, analyze_many, ewma, fit_line, forecast, robust_z
+
+
+def test_ewma_matches_the_recurrence() -> None:
+    """Test the vectorized EWMA against the step by step definition."""
+    rng = np.random.default_rng(0)
+    days = np.sort(rng.uniform(0, 3000, 2000))
+    y = rng.normal(10, 1, 2000)
+
+    smoothed = ewma(days, y, 0.5)
+
+    expected = [y[0]]
+    for i in range(1, len(y)):
+        alpha = 1 - math.exp(-min((days[i] - days[i - 1]) * math.log(2) / 0.5, 200))
+        expected.append(expected[-1] * (1 - alpha) + alpha * y[i])
+    assert np.allclose(smoothed, expected)
+
+
+def test_robust_z_handles_constant_series() -> None:
+    """Test that identical values score zero instead of dividing by zero."""
+    assert np.all(robust_z(np.full(5, 3.0)) == 0)
+
+
+def test_analyze_reports_a_single_spike() -> None:
+    """Test that only the outlier is flagged, not the readings after it."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    noise = np.random.default_rng(1).normal(0, 0.05, 60)
+    rows = [(start + timedelta(days=day), 10 + day / 100 + noise[day]) for day in range(60)]
+    rows[40] = (rows[40][0], 13.0)
+
+    result = analyze(rows)
+
+    assert [anomaly["date"] for anomaly in result["anomalies"]] == [rows[40][0]]
+    assert result["anomalies"][0]["direction"] == "gain"
+    assert math.isclose(result["rate_per_week"], 0.07, rel_tol=0.2)
+
+
+def test_analyze_many_splits_by_animal() -> None:
+    """Test that batch rows are evaluated per animal."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    rows = [("a", start, 5), ("a", start + timedelta(days=7), 6), ("b", start, 9)]
+
+    results = analyze_many(rows)
+
+    assert [(result["animal_id"], result["count"]) for result in results] == [("a", 2), ("b", 1)]
+    assert results[1]["rate_per_week"] is None
+
+
+def _summary(rows):
+    days = [Decimal(int(date.timestamp())) / 86400 for date, _ in rows]
+    weights = [Decimal(str(weight)) for _, weight in rows]
+    return {
+        "count": len(rows),
+        "last_date": rows[-1][0],
+        "sum": sum(weights),
+        "sum_x": sum(days),
+        "sum_xx": sum(x * x for x in days),
+        "sum_xy": sum(x * y for x, y in zip(days, weights)),
+        "sum_yy": sum(y * y for y in weights),
+    }
+
+
+def test_fit_line_matches_polyfit() -> None:
+    """Test that the fit from sums agrees with a fit of the readings."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    noise = np.random.default_rng(2).normal(0, 0.1, 40)
+    rows = [(start + timedelta(days=3 * i), round(10 + 0.1 * i + noise[i], 2)) for i in range(40)]
+
+    fit = fit_line(_summary(rows))
+
+    x = np.array([date.timestamp() / 86400 for date, _ in rows])
+    slope, _ = np.polyfit(x, [weight for _, weight in rows], 1)
+    assert math.isclose(fit["slope"], slope, rel_tol=1e-9)
+
+    points = forecast(fit, 4)
+    assert [point["date"] for point in points] == [
+        rows[-1][0] + timedelta(weeks=week) for week in range(1, 5)]
+    widths = [point["upper"] - point["lower"] for point in points]
+    assert all(point["lower"] < point["weight"] < point["upper"] for point in points)
+    assert widths == sorted(widths)
+
+
+def test_fit_line_needs_three_readings() -> None:
+    """Test that too little history gives no forecast."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    fit = fit_line(_summary([(start, 5), (start + timedelta(days=1), 6)]))
+
+    assert fit["slope"] is None
+    assert forecast(fit, 4) == []
@@ -0,0 +1,52 @@
+import uuid
+
+from app.animal_cache import AnimalCache
+
+
+def test_animal_cache_is_invalidated_by_weight_events() -> None:
+    """Test that a weight event drops only the cached results of its animal."""
+    cache = AnimalCache(max_entries=10, ttl=60)
+    animal, other = uuid.uuid4(), uuid.uuid4()
+    cache.put(animal, None, None, 500, value="fit", generation=cache.generation())
+    cache.put(other, None, None, 500, value="other fit", generation=cache.generation())
+
+    cache.on_event("user-1", {
+        "type": "WEIGHT_CREATED", "seq": 1, "data": {"animal_id": str(animal)}})
+
+    assert cache.get(animal, None, None, 500) is None
+    assert cache.get(other, None, None, 500) == "other fit"
+
+
+def test_animal_cache_is_cleared_by_truncated_imports() -> None:
+    """Test that an import not listing all its animals drops every result."""
+    cache = AnimalCache(max_entries=10, ttl=60)
+    animal = uuid.uuid4()
+    generation = cache.generation()
+    cache.put(animal, None, None, 500, value="fit", generation=generation)
+
+    cache.on_event("user-1", {
+        "type": "WEIGHTS_IMPORTED", "seq": 1,
+        "data": {"animal_ids": [], "count": 300, "truncated": True}})
+
+    assert cache.get(animal, None, None, 500) is None
+    cache.put(animal, None, None, 500, value="stale", generation=generation)
+    assert cache.get(animal, None, None, 500) is None
+
+
+def test_animal_cache_skips_results_read_before_an_invalidation() -> None:
+    """Test that a result computed across an invalidation is not stored."""
+    cache = AnimalCache(max_entries=1, ttl=60)
+    animal, other = uuid.uuid4(), uuid.uuid4()
+
+    generation = cache.generation()
+    cache.invalidate(str(animal))
+    cache.put(animal, None, None, 500, value="stale", generation=generation)
+    assert cache.get(animal, None, None, 500) is None
+
+    # Still refused once the animal's own stamp has been evicted
+    cache.invalidate(str(other))
+    cache.put(animal, None, None, 500, value="stale", generation=generation)
+    assert cache.get(animal, None, None, 500) is None
+
+    cache.put(animal, None, None, 500, value="fresh", generation=cache.generation())
+    assert cache.get(animal, None, None, 500) == "fresh"
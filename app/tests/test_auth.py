@@ -86,3 +86,68 @@ async def test_password_reset_confirm(client, test_user, db):
     )
     assert response.status_code == 400
     assert response.json()["detail"] == "Invalid or expired reset token"
+
+
+def test_username_change_invalidates_cached_user(authorized_client):
+    """Test that tokens for the old username stop working after a rename."""
+    response = authorized_client.get("/api/users/me")
+    assert response.status_code == 200
+    assert response.json()["email_verified"] is False
+
+    response = authorized_client.patch(
+        "/api/users/me", json={"username": "renameduser"})
+    assert response.status_code == 200
+    assert response.json()["username"] == "renameduser"
+    assert response.json()["email_verified"] is False
+
+    # The token still names the old username
+    response = authorized_client.get("/api/users/me")
+    assert response.status_code == 401
+
+
+def test_login_rehash_invalidates_cached_user(client, monkeypatch):
+    """Test that a login upgrading the password hash drops the cached user."""
+    from app import hashing
+    from app.principals import principal_cache
+    response = client.post("/auth/register", json={
+        "username": "rehasher", "email": "rehasher@example.com", "password": "Password123!"})
+    token = response.json()["access_token"]
+    assert client.get("/api/users/me", headers={
+        "Authorization": f"Bearer {token}"}).status_code == 200
+    assert principal_cache._lookup(principal_cache._users, "rehasher") is not None
+
+    monkeypatch.setattr(hashing, "needs_rehash", lambda hashed_password: True)
+    response = client.post("/auth/login", json={
+        "username": "rehasher", "password": "Password123!"})
+    assert response.status_code == 200
+
+    assert principal_cache._lookup(principal_cache._users, "rehasher") is None
+    assert client.get("/api/users/me", headers={
+        "Authorization": f"Bearer {response.json()['access_token']}"}).status_code == 200
+
+
+def test_refresh_tokens_rotate_and_detect_reuse(client, monkeypatch):
+    """Test refresh token rotation, reuse detection and logout."""
+    from app import refresh_tokens
+    monkeypatch.setattr(refresh_tokens, "REFRESH_TOKEN_REUSE_GRACE", -1)
+    response = client.post("/auth/register", json={
+        "username": "refresher", "email": "refresher@example.com", "password": "Password123!"})
+    assert response.status_code == 200
+    first = response.json()["refresh_token"]
+
+    response = client.post("/auth/refresh", json={"refresh_token": first})
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    assert client.get("/api/users/me", headers={
+        "Authorization": f"Bearer {response.json()['access_token']}"}).status_code == 200
+
+    # Replaying a rotated token revokes its whole family
+    assert client.post("/auth/refresh", json={"refresh_token": first}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": second}).status_code == 401
+
+    response = client.post("/auth/login", json={
+        "username": "refresher", "password": "Password123!"})
+    third = response.json()["refresh_token"]
+    assert client.post("/auth/logout", json={"refresh_token": third}).status_code == 204
+    assert client.post("/auth/refresh", json={"refresh_token": third}).status_code == 401
@@ -0,0 +1,30 @@
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+from app.charts import downsample, lttb
+
+
+def test_lttb_keeps_endpoints_and_spikes() -> None:
+    """Test that downsampling keeps the first, last and extreme points."""
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[500] = 10.0
+
+    selected = lttb(x, y, 20)
+
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_downsample_returns_all_points_below_threshold() -> None:
+    """Test that short series come back unchanged."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    rows = [(start + timedelta(days=day), 10 + day) for day in range(5)]
+
+    points = downsample(rows, 100)
+
+    assert [point["weight"] for point in points] == [10, 11, 12, 13, 14]
+    assert points[0]["date"] == start
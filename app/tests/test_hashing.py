@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.hashing import (
+    HASH_DURATION, HASH_REJECTED, HashingPool, calibrate_rounds, hash_password, needs_rehash,
+    pool, verify_password
+)
+from app.utils.password import hash_rounds
+
+
+def test_passwords_hash_off_the_event_loop() -> None:
+    """Test hashing and verification through the pool."""
+    async def roundtrip():
+        hashed = await hash_password("correct horse")
+        return (await verify_password("correct horse", hashed),
+                await verify_password("wrong horse", hashed))
+
+    before = HASH_DURATION.count("verify")
+    assert asyncio.run(roundtrip()) == (True, False)
+    assert HASH_DURATION.count("verify") == before + 2
+
+
+def test_full_queue_is_turned_away_with_503() -> None:
+    """Test that calls beyond the workers and queue fail fast."""
+    pool = HashingPool(workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def overload():
+        running = asyncio.ensure_future(pool.run("hash", release.wait))
+        queued = asyncio.ensure_future(pool.run("hash", release.wait))
+        await asyncio.sleep(0)
+        assert pool.queue_depth() == 1
+        rejected_before = HASH_REJECTED.value("hash")
+        with pytest.raises(HTTPException) as error:
+            await pool.run("hash", release.wait)
+        assert error.value.status_code == 503
+        assert HASH_REJECTED.value("hash") == rejected_before + 1
+        release.set()
+        await asyncio.gather(running, queued)
+        assert pool.pending == 0
+
+    asyncio.run(overload())
+
+
+def test_calibration_stays_within_bounds() -> None:
+    """Test that the calibrated cost is clamped to the configured range."""
+    assert calibrate_rounds(target=1e-9, min_rounds=4, max_rounds=8, samples=1) == 4
+    assert calibrate_rounds(target=1e9, min_rounds=4, max_rounds=8, samples=1) == 8
+
+
+def test_hashes_of_another_cost_need_rehashing(monkeypatch) -> None:
+    """Test that new hashes use the pool's cost and others are flagged."""
+    monkeypatch.setattr(pool, "rounds", 5)
+    hashed = asyncio.run(hash_password("correct horse"))
+
+    assert hash_rounds(hashed) == 5
+    assert not needs_rehash(hashed)
+    monkeypatch.setattr(pool, "rounds", 6)
+    assert needs_rehash(hashed)
+    assert hash_rounds("not a hash") is None
+    assert needs_rehash(None)
@@ -0,0 +1,40 @@
+from app.metrics import Counter, Gauge, Histogram, scrape_authorized
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """Test that histogram buckets are cumulative and labelled."""
+    histogram = Histogram("delivery_seconds", "Delivery time", labels=("path",),
+                          buckets=(0.1, 1.0))
+    histogram.observe(0.05, "local")
+    histogram.observe(0.1, "local")
+    histogram.observe(3.0, "local")
+
+    lines = histogram.render().splitlines()
+
+    assert 'delivery_seconds_bucket{path="local",le="0.1"} 2' in lines
+    assert 'delivery_seconds_bucket{path="local",le="1.0"} 2' in lines
+    assert 'delivery_seconds_bucket{path="local",le="+Inf"} 3' in lines
+    assert 'delivery_seconds_count{path="local"} 3' in lines
+    assert lines[1] == "# TYPE delivery_seconds histogram"
+
+
+def test_counter_and_gauge_samples() -> None:
+    """Test counter increments and callback gauges."""
+    counter = Counter("evictions_total", "Evictions")
+    counter.inc()
+    counter.inc(amount=2)
+    gauge = Gauge("queue_depth", "Queue depth", callback=lambda: 7)
+
+    assert counter.render().splitlines()[-1] == "evictions_total 3"
+    assert gauge.render().splitlines()[-1] == "queue_depth 7"
+
+
+def test_scrape_requires_the_configured_bearer_token() -> None:
+    """Test that /metrics only accepts the configured bearer token."""
+    assert scrape_authorized("Bearer s3cret", "s3cret")
+    assert scrape_authorized("bearer s3cret", "s3cret")
+    assert not scrape_authorized("Bearer wrong", "s3cret")
+    assert not scrape_authorized("Basic s3cret", "s3cret")
+    assert not scrape_authorized(None, "s3cret")
+    # No token configured: nothing is accepted
+    assert not scrape_authorized("Bearer ", "")
@@ -0,0 +1,25 @@
+from datetime import date
+
+from sqlalchemy import create_engine
+
+from app.partitions import (
+    PARTITION_NAME, add_months, detach_partitions, ensure_partitions, partition_name
+)
+
+
+def test_partitions_are_named_by_month() -> None:
+    """Test partition names and month arithmetic across year ends."""
+    assert partition_name(date(2024, 3, 1)) == "weights_p202403"
+    assert PARTITION_NAME.match("weights_p202403").groups() == ("2024", "03")
+    assert PARTITION_NAME.match("weights_default") is None
+
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert add_months(date(2024, 1, 1), 0) == date(2024, 1, 1)
+
+
+def test_maintenance_skips_unpartitioned_databases() -> None:
+    """Test that maintenance leaves databases without partitioning alone."""
+    with create_engine("sqlite://").begin() as conn:
+        assert ensure_partitions(conn, months_ahead=3) == []
+        assert detach_partitions(conn, date(2024, 1, 1), drop=True) == []
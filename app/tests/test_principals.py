@@ -0,0 +1,64 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.database import SyncSessionAdapter
+from app.principals import USER_UPDATED, PrincipalCache
+
+KEY = "test-key"
+
+
+def test_decode_verifies_a_token_once_until_it_expires(monkeypatch) -> None:
+    """Test that claims are cached but never outlive the token."""
+    cache = PrincipalCache(max_entries=10, ttl=60)
+    token = jwt.encode({"sub": "alice", "exp": int(time.time()) + 30}, KEY)
+    assert cache.decode(token, KEY, ["HS256"])["sub"] == "alice"
+
+    def fail(*args, **kwargs):
+        raise AssertionError("decoded again")
+
+    monkeypatch.setattr(jwt, "decode", fail)
+    assert cache.decode(token, KEY, ["HS256"])["sub"] == "alice"
+
+    monkeypatch.setattr(time, "time", lambda: 2e10)
+    with pytest.raises(ExpiredSignatureError):
+        cache.decode(token, KEY, ["HS256"])
+
+
+def test_users_are_served_from_snapshots_until_invalidated() -> None:
+    """Test that cached users attach to later sessions without a query."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Media.__table__.create(engine)
+    models.User.__table__.create(engine)
+    user_id = uuid.uuid4()
+    with Session(engine) as db:
+        db.add(models.User(id=user_id, username="alice", email_verified=True))
+        db.commit()
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    cache = PrincipalCache(max_entries=10, ttl=60)
+
+    async def get_user():
+        with Session(engine) as db:
+            user = await cache.get_user(SyncSessionAdapter(db), "alice")
+            assert db.is_modified(user) is False
+            return user.id, user.username, user.profile_picture
+
+    assert asyncio.run(get_user()) == (user_id, "alice", None)
+    assert len(queries) == 1
+    assert asyncio.run(get_user()) == (user_id, "alice", None)
+    assert len(queries) == 1
+
+    cache.on_event(str(user_id), {"type": USER_UPDATED, "data": {"id": str(user_id)}})
+    asyncio.run(get_user())
+    assert len(queries) == 2
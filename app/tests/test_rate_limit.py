@@ -0,0 +1,45 @@
+import asyncio
+
+from app.middleware.rate_limit import LocalBackend, Policy, match_policy
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch) -> None:
+    """Test that a bucket allows its burst, then one request per refill."""
+    now = [1000.0]
+    monkeypatch.setattr("app.middleware.rate_limit.time.monotonic", lambda: now[0])
+    backend = LocalBackend(max_keys=10)
+
+    async def take():
+        return await backend.take("login:ip:1.2.3.4", 3, 0.5)
+
+    assert [asyncio.run(take()) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert asyncio.run(take()) == 2.0
+    now[0] += 1.0
+    assert asyncio.run(take()) == 1.0
+    now[0] += 1.0
+    assert asyncio.run(take()) == 0.0
+
+
+def test_least_recently_used_buckets_are_evicted() -> None:
+    """Test that the local backend never holds more than max_keys buckets."""
+    backend = LocalBackend(max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        asyncio.run(backend.take(key, 1, 1.0))
+
+    assert len(backend) == 2
+    # "b" was evicted and starts over with a full bucket; "a" was not
+    assert asyncio.run(backend.take("b", 1, 1.0)) == 0.0
+    assert asyncio.run(backend.take("c", 1, 1.0)) > 0
+
+
+def test_routes_match_the_most_specific_policy(monkeypatch) -> None:
+    """Test policy matching and overrides from the environment."""
+    assert match_policy("POST", "/auth/login").name == "login"
+    assert match_policy("POST", "/auth/refresh").name == "auth"
+    assert match_policy("POST", "/api/weights/import").name == "weight_import"
+    assert match_policy("GET", "/api/weights/import").name == "api"
+    assert match_policy("GET", "/media/photo.jpg") is None
+
+    monkeypatch.setenv("RATE_LIMIT_API", "10/5")
+    policy = Policy("api", "/api/", 300, 60)
+    assert (policy.burst, policy.rate) == (10, 2.0)
@@ -0,0 +1,58 @@
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from app.rollups import REGRESSION_SUMS, bucket_end, bucket_start, merge, plan_range
+
+
+def test_bucket_boundaries_are_utc_calendar_periods() -> None:
+    """Test day, Monday-based week and month buckets."""
+    date = datetime(2024, 12, 19, 15, 30, tzinfo=UTC)
+
+    assert bucket_start(date, "day") == datetime(2024, 12, 19, tzinfo=UTC)
+    assert bucket_start(date, "week") == datetime(2024, 12, 16, tzinfo=UTC)
+    assert bucket_start(date, "month") == datetime(2024, 12, 1, tzinfo=UTC)
+    assert bucket_end(datetime(2024, 12, 1, tzinfo=UTC), "month") == datetime(2025, 1, 1, tzinfo=UTC)
+
+
+def test_plan_range_reads_raw_rows_only_at_the_edges() -> None:
+    """Test that a range splits into raw edges, whole days and whole months."""
+    parts = plan_range(
+        datetime(2024, 1, 30, 12, tzinfo=UTC), datetime(2024, 4, 2, 6, tzinfo=UTC))
+
+    assert parts == [
+        ("raw", datetime(2024, 1, 30, 12, tzinfo=UTC), datetime(2024, 1, 31, tzinfo=UTC)),
+        ("raw", datetime(2024, 4, 2, tzinfo=UTC), datetime(2024, 4, 2, 6, tzinfo=UTC)),
+        ("day", datetime(2024, 1, 31, tzinfo=UTC), datetime(2024, 2, 1, tzinfo=UTC)),
+        ("day", datetime(2024, 4, 1, tzinfo=UTC), datetime(2024, 4, 2, tzinfo=UTC)),
+        ("month", datetime(2024, 2, 1, tzinfo=UTC), datetime(2024, 4, 1, tzinfo=UTC)),
+    ]
+    assert plan_range(None, None) == [("month", None, None)]
+    same_day = (datetime(2024, 1, 1, 1, tzinfo=UTC), datetime(2024, 1, 1, 2, tzinfo=UTC))
+    assert plan_range(*same_day) == [("raw", *same_day)]
+
+
+def test_merge_combines_partial_aggregates() -> None:
+    """Test that disjoint parts merge into exact statistics."""
+    early = datetime(2024, 1, 1, tzinfo=UTC)
+    late = datetime(2024, 2, 1, tzinfo=UTC)
+    parts = [
+        {"count": 2, "min": Decimal(9), "max": Decimal(11), "sum": Decimal(20),
+         "first_date": late, "first_weight": Decimal(11),
+         "last_date": late, "last_weight": Decimal(9),
+         **{name: Decimal(1) for name in REGRESSION_SUMS}},
+        {"count": 0, "min": None, "max": None, "sum": None,
+         "first_date": None, "first_weight": None, "last_date": None, "last_weight": None},
+        {"count": 1, "min": Decimal(5), "max": Decimal(5), "sum": Decimal(5),
+         "first_date": early, "first_weight": Decimal(5),
+         "last_date": early, "last_weight": Decimal(5),
+         **{name: Decimal(2) for name in REGRESSION_SUMS}},
+    ]
+
+    summary = merge(parts)
+
+    assert summary["count"] == 3
+    assert summary["min"] == 5 and summary["max"] == 11
+    assert summary["mean"] == Decimal(25) / 3
+    assert (summary["first"], summary["last"]) == (5, 9)
+    assert all(summary[name] == 3 for name in REGRESSION_SUMS)
+    assert merge([])["count"] == 0
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import AsyncGenerator, List, Optional, Tuple
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.orm import Session
+
+from app import events, models, websocket
+from app.database import SyncSessionAdapter
+from app.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    """Minimal stand-in recording what the manager sends."""
+
+    def __init__(self) -> None:
+        self.sent: List[dict] = []
+        self.close_code: Optional[int] = None
+        # Set to make sends block until the test releases them
+        self.stalled: Optional[asyncio.Event] = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        if self.stalled is not None:
+            await self.stalled.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+
+
+async def flush() -> None:
+    """Let the connection writer tasks send what is queued."""
+    await asyncio.sleep(0.01)
+
+
+@pytest_asyncio.fixture
+async def manager() -> AsyncGenerator[ConnectionManager, None]:
+    manager = ConnectionManager()
+    yield manager
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_deliver_drops_duplicate_seq(manager: ConnectionManager) -> None:
+    """Test that an event reaching the worker twice is sent once."""
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+
+    message = {"type": "WEIGHT_CREATED", "seq": 7, "data": {"id": "w1"}}
+    await manager.deliver("user-1", message)
+    await manager.deliver("user-1", dict(message))
+
+    await flush()
+    assert [m["seq"] for m in socket.sent] == [7]
+
+
+@pytest.mark.asyncio
+async def test_own_notifications_are_ignored(manager: ConnectionManager) -> None:
+    """Test that NOTIFY echoes of locally published events are skipped."""
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+
+    await manager._handle_notification(json.dumps({
+        "origin": manager.worker_id,
+        "owner_id": "user-1",
+        "type": "WEIGHT_CREATED",
+        "seq": 1,
+        "data": {"id": "w1"}
+    }))
+    await manager._handle_notification(json.dumps({
+        "origin": "another-worker",
+        "owner_id": "user-1",
+        "type": "WEIGHT_CREATED",
+        "seq": 2,
+        "data": {"id": "w2"}
+    }))
+
+    await flush()
+    assert [m["seq"] for m in socket.sent] == [2]
+
+
+@pytest.mark.asyncio
+async def test_trigger_notifications_are_mapped(manager: ConnectionManager) -> None:
+    """Test that trigger payloads become the usual event types."""
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+
+    await manager._handle_notification(json.dumps({
+        "table": "weights",
+        "operation": "DELETE",
+        "owner_id": "user-1",
+        "seq": 3,
+        "data": {"id": "w1", "animal_id": "a1"}
+    }))
+
+    await flush()
+    assert socket.sent == [{
+        "type": "WEIGHT_DELETED",
+        "seq": 3,
+        "data": {"id": "w1", "animal_id": "a1"}
+    }]
+
+
+@pytest.mark.asyncio
+async def test_truncated_notifications_are_loaded_from_the_log(
+    manager: ConnectionManager,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that an event too large for NOTIFY is delivered with its data."""
+    data = {"ids": ["a%d" % i for i in range(2000)]}
+
+    async def load_data(seq: int) -> Optional[dict]:
+        return data if seq == 4 else None
+
+    monkeypatch.setattr(manager.event_log, "load_data", load_data)
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+
+    await manager._handle_notification(json.dumps({
+        "origin": "another-worker",
+        "owner_id": "user-1",
+        "type": "WEIGHTS_IMPORTED",
+        "seq": 4,
+        "truncated": True
+    }))
+
+    await flush()
+    assert socket.sent == [{"type": "WEIGHTS_IMPORTED", "seq": 4, "data": data}]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_events(manager: ConnectionManager) -> None:
+    """Test that a client reconnecting with last_seq only gets what it missed."""
+    for seq in (1, 2, 3):
+        await manager.deliver(
+            "user-1", {"type": "WEIGHT_CREATED", "seq": seq, "data": {}})
+
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1", last_seq=1)
+
+    await flush()
+    assert [m["seq"] for m in socket.sent] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_outside_retention_requires_resync(
+    manager: ConnectionManager,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a gap the log can no longer cover asks for a resync."""
+    async def pruned(user_id: str, last_seq: int, limit: int) -> None:
+        return None
+
+    monkeypatch.setattr(manager.event_log, "load_since", pruned)
+    manager.event_log.raise_floor(50)
+
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1", last_seq=10)
+
+    await flush()
+    assert socket.sent == [{"type": "RESYNC_REQUIRED"}]
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_resynced_then_evicted(
+    manager: ConnectionManager,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a stalled client doesn't hold up the other sockets."""
+    monkeypatch.setattr(websocket, "WS_SEND_QUEUE_SIZE", 2)
+    slow, fast = FakeWebSocket(), FakeWebSocket()
+    slow.stalled = asyncio.Event()
+    await manager.connect(slow, "user-1")
+    await manager.connect(fast, "user-1")
+
+    for seq in range(1, 5):
+        await manager.deliver(
+            "user-1", {"type": "WEIGHT_CREATED", "seq": seq, "data": {}})
+        await flush()
+
+    assert [m["seq"] for m in fast.sent] == [1, 2, 3, 4]
+    # The first overflow swaps the backlog for a resync request...
+    assert slow.close_code is None
+
+    for seq in range(5, 8):
+        await manager.deliver(
+            "user-1", {"type": "WEIGHT_CREATED", "seq": seq, "data": {}})
+        await flush()
+
+    # ...overflowing again before catching up drops the connection
+    assert slow.close_code == 1013
+    assert list(manager.active_connections["user-1"]) == [fast]
+    assert [m["seq"] for m in fast.sent] == list(range(1, 8))
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_encoded_once(
+    manager: ConnectionManager,
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that every tab of a user receives the same pre-encoded frame."""
+    frames = []
+
+    def encode(message: dict) -> str:
+        frames.append(message)
+        return json.dumps(message)
+
+    monkeypatch.setattr(websocket, "encode_frame", encode)
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for socket in sockets:
+        await manager.connect(socket, "user-1")
+
+    await manager.deliver(
+        "user-1", {"type": "WEIGHT_CREATED", "seq": 1, "data": {"id": "w1"}})
+    await flush()
+
+    assert len(frames) == 1
+    for socket in sockets:
+        assert socket.sent == [{"type": "WEIGHT_CREATED", "seq": 1, "data": {"id": "w1"}}]
+
+
+@pytest.mark.asyncio
+async def test_subscribed_socket_only_gets_matching_events(
+    manager: ConnectionManager
+) -> None:
+    """Test that SUBSCRIBE narrows a socket to its animals and event types."""
+    animal_id = "5f0c8a4e-2d1b-4c3a-9e8f-7a6b5c4d3e2f"
+    detail, overview = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(detail, "user-1")
+    await manager.connect(overview, "user-1")
+
+    manager.handle_message(detail, "user-1", json.dumps({
+        "type": "SUBSCRIBE",
+        "animal_ids": [animal_id],
+        "event_types": ["ANIMAL_DELETED"]
+    }))
+    manager.handle_message(detail, "user-1", json.dumps({"type": "PING"}))
+
+    await manager.deliver("user-1", {
+        "type": "WEIGHT_CREATED", "seq": 1, "data": {"animal_id": animal_id}})
+    await manager.deliver("user-1", {
+        "type": "WEIGHT_CREATED", "seq": 2, "data": {"animal_id": "other"}})
+    await manager.deliver("user-1", {
+        "type": "ANIMAL_DELETED", "seq": 3, "data": {"id": "other"}})
+    await flush()
+
+    assert detail.sent[0] == {"type": "PONG"}
+    assert [m["seq"] for m in detail.sent[1:]] == [1, 3]
+    assert [m["seq"] for m in overview.sent] == [1, 2, 3]
+
+    manager.handle_message(detail, "user-1", json.dumps({
+        "type": "UNSUBSCRIBE",
+        "animal_ids": [animal_id],
+        "event_types": ["ANIMAL_DELETED"]
+    }))
+    await manager.deliver("user-1", {
+        "type": "WEIGHT_CREATED", "seq": 4, "data": {"animal_id": "other"}})
+    await flush()
+
+    # Without subscriptions the socket is back to receiving everything
+    assert detail.sent[-1]["seq"] == 4
+
+
+@pytest.mark.asyncio
+async def test_truncated_import_reaches_every_socket_of_its_user(
+    manager: ConnectionManager
+) -> None:
+    """Test that an import whose animal list was cut reaches subscribed sockets."""
+    detail = FakeWebSocket()
+    await manager.connect(detail, "user-1")
+    manager.handle_message(detail, "user-1", json.dumps({
+        "type": "SUBSCRIBE",
+        "animal_ids": ["5f0c8a4e-2d1b-4c3a-9e8f-7a6b5c4d3e2f"]
+    }))
+
+    await manager.deliver("user-1", {
+        "type": "WEIGHTS_IMPORTED", "seq": 1,
+        "data": {"animal_ids": ["other"], "count": 300, "truncated": True}})
+    await manager.deliver("user-1", {
+        "type": "WEIGHTS_IMPORTED", "seq": 2,
+        "data": {"animal_ids": ["other"], "count": 1}})
+    await flush()
+
+    assert [m["seq"] for m in detail.sent] == [1]
+
+
+@pytest.mark.asyncio
+async def test_delivery_latency_is_recorded_per_path(manager: ConnectionManager) -> None:
+    """Test that sending a stamped event observes its latency by type and path."""
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+    before = websocket.DELIVERY_LATENCY.count("WEIGHT_CREATED", "notify")
+
+    await manager._handle_notification(json.dumps({
+        "origin": "another-worker",
+        "owner_id": "user-1",
+        "type": "WEIGHT_CREATED",
+        "seq": 1,
+        "published_at": time.time() - 0.05,
+        "data": {"id": "w1"}
+    }))
+    await flush()
+
+    assert socket.sent == [{"type": "WEIGHT_CREATED", "seq": 1, "data": {"id": "w1"}}]
+    assert websocket.DELIVERY_LATENCY.count("WEIGHT_CREATED", "notify") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_wrong_typed_subscribe_is_ignored(manager: ConnectionManager) -> None:
+    """Test that SUBSCRIBE with non-list fields leaves the socket as it was."""
+    socket = FakeWebSocket()
+    await manager.connect(socket, "user-1")
+
+    manager.handle_message(socket, "user-1", json.dumps({"type": "SUBSCRIBE", "animal_ids": 5}))
+    manager.handle_message(socket, "user-1", json.dumps({"type": "UNSUBSCRIBE", "event_types": 3}))
+    manager.handle_message(socket, "user-1", json.dumps([1, 2]))
+
+    await manager.deliver("user-1", {"type": "WEIGHT_CREATED", "seq": 1, "data": {}})
+    await flush()
+    assert [m["seq"] for m in socket.sent] == [1]
+
+
+class FakeResult:
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    def scalar_one(self) -> int:
+        return self.value
+
+
+class FakeSession:
+    """Records the statements publish() runs."""
+
+    def __init__(self) -> None:
+        self.info: dict = {}
+        self.statements: List[Tuple[str, dict]] = []
+
+    async def execute(self, statement, params=None) -> FakeResult:
+        self.statements.append((str(statement), params))
+        return FakeResult(len(self.statements))
+
+
+@pytest.mark.asyncio
+async def test_publish_takes_the_commit_order_lock_once_per_user() -> None:
+    """Test that a transaction's seqs are only drawn under its users' locks."""
+    db = FakeSession()
+    await events.publish(db, "user-1", "WEIGHT_CREATED", {"id": "w1"})
+    await events.publish(db, "user-1", "WEIGHT_CREATED", {"id": "w2"})
+    await events.publish(db, "user-2", "ANIMAL_CREATED", {"id": "a1"})
+
+    locks = [
+        params["owner_id"] for statement, params in db.statements
+        if "pg_advisory_xact_lock" in statement
+    ]
+    assert locks == ["user-1", "user-2"]
+    assert "pg_advisory_xact_lock" in db.statements[0][0]
+    db.info.clear()
+
+
+@pytest.mark.asyncio
+async def test_publish_oversized_event(db: Session, test_user: models.User) -> None:
+    """Test that an event larger than a NOTIFY payload still commits."""
+    data = {"ids": [str(uuid.uuid4()) for _ in range(500)]}
+    session = SyncSessionAdapter(db)
+    message = await events.publish(session, test_user.id, "WEIGHTS_IMPORTED", data)
+    await session.commit()
+
+    assert message["data"] == data
+    logged = db.get(models.RealtimeEvent, message["seq"])
+    assert logged.data == data
@@ -1,12 +1,15 @@
+import json
 import uuid
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 from decimal import Decimal
 from typing import List
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
 
 from app import models
+from app.routers import weights as weights_router
 
 
 def test_create_weight(authorized_client: TestClient, test_animals: List[models.Animal]) -> None:
@@ -68,6 +71,40 @@ def test_get_animal_weights(
     assert all(str(weight["animal_id"]) == animal_id for weight in data)
 
 
+def test_get_animal_weights_pages_by_date(
+    authorized_client: TestClient,
+    db: Session,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test paging through a date range with the X-Next-Cursor header."""
+    animal = test_animals[0]
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for day in range(5):
+        db.add(models.Weight(
+            id=uuid.uuid4(),
+            animal_id=animal.id,
+            weight=20 + day,
+            date=start + timedelta(days=4 - day)
+        ))
+    db.commit()
+
+    url = f"/api/weights/animal/{animal.id}"
+    params = {"from": "2024-01-01T00:00:00Z", "to": "2024-01-05T00:00:00Z", "limit": 3}
+    first = authorized_client.get(url, params=params)
+    assert first.status_code == 200
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = authorized_client.get(url, params={**params, "cursor": cursor})
+    assert second.status_code == 200
+    assert "X-Next-Cursor" not in second.headers
+
+    dates = [weight["date"][:10] for weight in first.json() + second.json()]
+    assert dates == ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+
+    invalid = authorized_client.get(url, params={"cursor": "not-a-cursor"})
+    assert invalid.status_code == 400
+
+
 def test_get_animal_weights_unauthorized(client: TestClient, test_animals: List[models.Animal]) -> None:
     """Test getting animal weights without authorization."""
     animal_id = str(test_animals[0].id)
@@ -134,3 +171,298 @@ def test_delete_nonexistent_weight(authorized_client: TestClient) -> None:
     fake_id = str(uuid.uuid4())
     response = authorized_client.delete(f"/weights/{fake_id}")
     assert response.status_code == 404
+
+
+def test_import_weights_csv(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test bulk importing weights for several animals from CSV."""
+    first, second = (str(animal.id) for animal in test_animals[:2])
+    body = "animal_id,weight,date\n" + "".join(
+        f"{first if i % 2 else second},{10 + i / 10:.1f},2024-02-{1 + i:02d}T08:00:00Z\n"
+        for i in range(20)
+    )
+
+    response = authorized_client.post(
+        "/api/weights/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json() == {"imported": 20, "animals": {first: 10, second: 10}}
+    weights = authorized_client.get(f"/api/weights/animal/{first}").json()
+    assert sum(weight["date"].startswith("2024-02") for weight in weights) == 10
+
+
+def test_import_weights_csv_with_multiline_fields(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal],
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that quoted fields may span lines and rows load in batches."""
+    monkeypatch.setattr(weights_router, "IMPORT_BATCH_SIZE", 2)
+    animal_id = str(test_animals[0].id)
+    body = (
+        "animal_id,weight,date,notes\r\n"
+        f'{animal_id},10.5,2024-05-01T08:00:00Z,"after the vet,\nweighed twice"\r\n'
+        f"{animal_id},10.7,2024-05-02T08:00:00Z,\r\n"
+        "\r\n"
+        f'{animal_id},10.9,2024-05-03T08:00:00Z,"said ""ok""\n\nthen left"'
+    )
+
+    response = authorized_client.post(
+        "/api/weights/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json() == {"imported": 3, "animals": {animal_id: 3}}
+
+    body = f'animal_id,weight,date,notes\n{animal_id},11,2024-05-04T08:00:00Z,"open\n'
+    response = authorized_client.post(
+        "/api/weights/import", content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 422
+
+
+def test_import_weights_for_many_animals(
+    authorized_client: TestClient,
+    db: Session,
+    test_user: models.User
+) -> None:
+    """Test that an import touching many animals announces a bounded event."""
+    animals = [
+        models.Animal(id=uuid.uuid4(), owner_id=test_user.id, name=f"Clinic Pet {i}")
+        for i in range(weights_router.IMPORT_EVENT_MAX_ANIMALS + 50)
+    ]
+    db.add_all(animals)
+    db.commit()
+    body = "animal_id,weight,date\n" + "".join(
+        f"{animal.id},12.5,2024-06-01T08:00:00Z\n" for animal in animals)
+
+    response = authorized_client.post(
+        "/api/weights/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json()["imported"] == len(animals)
+    event = db.query(models.RealtimeEvent).filter(
+        models.RealtimeEvent.type == "WEIGHTS_IMPORTED").one()
+    assert len(event.data["animal_ids"]) == weights_router.IMPORT_EVENT_MAX_ANIMALS
+    assert event.data["truncated"] is True
+    assert event.data["count"] == len(animals)
+
+
+def test_import_weights_rejects_foreign_animal(authorized_client: TestClient) -> None:
+    """Test that an import naming an animal the user doesn't own loads nothing."""
+    body = f'{{"animal_id": "{uuid.uuid4()}", "weight": 12.5, "date": "2024-02-01"}}\n'
+    response = authorized_client.post(
+        "/api/weights/import", content=body,
+        headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 404
+
+
+def test_import_weights_checks_every_animal_before_loading(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal],
+    monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a foreign animal late in an import stops it before any COPY."""
+    copied = []
+    monkeypatch.setattr(weights_router, "IMPORT_BATCH_SIZE", 1)
+    monkeypatch.setattr(
+        weights_router, "copy_records", lambda *args: copied.append(args))
+    body = (
+        "animal_id,weight,date\n"
+        f"{test_animals[0].id},12.5,2024-02-01T08:00:00Z\n"
+        f"{test_animals[1].id},11.5,2024-02-01T08:00:00Z\n"
+        f"{uuid.uuid4()},10.5,2024-02-01T08:00:00Z\n"
+    )
+
+    response = authorized_client.post(
+        "/api/weights/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 404
+    assert copied == []
+
+
+def test_weight_stats_follow_writes(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test that the rollup statistics track creates, updates and deletes."""
+    animal_id = str(test_animals[0].id)
+    created = [
+        authorized_client.post("/api/weights/", json={
+            "animal_id": animal_id, "weight": weight, "date": date
+        }).json()
+        for weight, date in [
+            (10, "2024-03-01T06:00:00Z"),
+            (14, "2024-03-01T18:00:00Z"),
+            (12, "2024-03-20T08:00:00Z"),
+            (16, "2024-04-02T08:00:00Z"),
+        ]
+    ]
+    authorized_client.put(f"/api/weights/{created[2]['id']}", json={
+        "weight": 13, "date": "2024-03-21T08:00:00Z"
+    })
+    authorized_client.delete(f"/api/weights/{created[3]['id']}")
+
+    url = f"/api/weights/animal/{animal_id}/stats"
+    response = authorized_client.get(url, params={
+        "granularity": "day", "from": "2024-03-01T12:00:00Z", "to": "2024-05-01T00:00:00Z"
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["summary"]["count"] == 2
+    assert Decimal(data["summary"]["min"]) == 13
+    assert Decimal(data["summary"]["first"]) == 14
+    assert Decimal(data["summary"]["last"]) == 13
+    assert [bucket["start"][:10] for bucket in data["buckets"]] == ["2024-03-01", "2024-03-21"]
+    assert data["buckets"][0]["count"] == 2
+    assert data["buckets"][0]["mean"] == 12
+
+    months = authorized_client.get(url, params={"granularity": "month"}).json()
+    assert [(bucket["start"][:7], bucket["count"]) for bucket in months["buckets"]] == [
+        ("2024-03", 3)]
+
+
+def test_weight_stats_reread_extremes_after_removal(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test that removing a bucket's max, first or last reading updates them."""
+    animal_id = str(test_animals[0].id)
+    created = [
+        authorized_client.post("/api/weights/", json={
+            "animal_id": animal_id, "weight": weight, "date": date
+        }).json()
+        for weight, date in [
+            (10, "2024-06-03T06:00:00Z"),
+            (18, "2024-06-03T12:00:00Z"),
+            (12, "2024-06-03T18:00:00Z"),
+        ]
+    ]
+    authorized_client.delete(f"/api/weights/{created[1]['id']}")
+    authorized_client.put(f"/api/weights/{created[2]['id']}", json={
+        "weight": 11, "date": "2024-06-02T18:00:00Z"
+    })
+
+    url = f"/api/weights/animal/{animal_id}/stats"
+    weeks = authorized_client.get(url, params={"granularity": "week"}).json()["buckets"]
+    days = authorized_client.get(url, params={"granularity": "day"}).json()["buckets"]
+
+    # 2024-06-02 is a Sunday, 2024-06-03 a Monday
+    assert [(bucket["start"][:10], bucket["count"]) for bucket in weeks] == [
+        ("2024-05-27", 1), ("2024-06-03", 1)]
+    assert [(bucket["start"][:10], Decimal(bucket["max"])) for bucket in days] == [
+        ("2024-06-02", 11), ("2024-06-03", 10)]
+    assert Decimal(days[1]["first"]) == Decimal(days[1]["last"]) == 10
+
+
+def test_weight_trends_flag_sudden_loss(
+    authorized_client: TestClient,
+    db: Session,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test that a sudden drop is reported for the animal and in the batch."""
+    animal = test_animals[0]
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for day in range(30):
+        db.add(models.Weight(
+            id=uuid.uuid4(),
+            animal_id=animal.id,
+            weight=Decimal("8.00") if day == 20 else Decimal("10.00") + Decimal(day % 3) / 10,
+            date=start + timedelta(days=day)
+        ))
+    db.commit()
+
+    params = {"from": "2024-01-01T00:00:00Z", "to": "2024-02-01T00:00:00Z"}
+    response = authorized_client.get(
+        f"/api/weights/animal/{animal.id}/trend", params=params)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 30
+    assert [anomaly["date"][:10] for anomaly in data["anomalies"]] == ["2024-01-21"]
+    assert data["anomalies"][0]["direction"] == "loss"
+
+    batch = authorized_client.get("/api/weights/trends", params=params).json()
+    by_animal = {trend["animal_id"]: trend for trend in batch}
+    assert by_animal[str(animal.id)]["anomalies"] == data["anomalies"]
+    assert len(by_animal) == len(test_animals)
+
+
+def test_weight_forecast_projects_the_trend(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test projecting a rising series a few weeks ahead."""
+    animal_id = str(test_animals[0].id)
+    for week in range(6):
+        authorized_client.post("/api/weights/", json={
+            "animal_id": animal_id,
+            "weight": 10 + week,
+            "date": (datetime(2024, 3, 1, 8, tzinfo=UTC) + timedelta(weeks=week)).isoformat()
+        })
+
+    url = f"/api/weights/animal/{animal_id}/forecast"
+    response = authorized_client.get(url, params={"weeks": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 6
+    assert data["slope_per_week"] > 0
+    assert len(data["points"]) == 2
+    assert data["points"][0]["lower"] <= data["points"][0]["weight"] <= data["points"][0]["upper"]
+
+
+def test_get_weights_batch(
+    authorized_client: TestClient,
+    db: Session,
+    test_animals: List[models.Animal]
+) -> None:
+    """Test loading the latest weights of several animals in one request."""
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for index, animal in enumerate(test_animals[:2]):
+        for day in range(2 + index * 3):
+            db.add(models.Weight(
+                id=uuid.uuid4(),
+                animal_id=animal.id,
+                weight=10 + day,
+                date=start + timedelta(days=day)
+            ))
+    db.commit()
+
+    ids = [str(animal.id) for animal in test_animals[:2]]
+    response = authorized_client.get(
+        "/api/weights/batch", params={"animal_id": ids, "limit": 3, "from": "2024-01-01T00:00:00Z"})
+    assert response.status_code == 200
+    series = {entry["animal_id"]: entry for entry in response.json()}
+    assert [Decimal(w["weight"]) for w in series[ids[0]]["weights"]] == [10, 11]
+    assert series[ids[0]]["has_more"] is False
+    assert [Decimal(w["weight"]) for w in series[ids[1]]["weights"]] == [12, 13, 14]
+    assert series[ids[1]]["has_more"] is True
+
+    foreign = authorized_client.get(
+        "/api/weights/batch", params={"animal_id": [ids[0], str(uuid.uuid4())]})
+    assert foreign.status_code == 404
+
+
+def test_export_weights_streams_csv_and_ndjson(
+    authorized_client: TestClient,
+    test_animals: List[models.Animal],
+    test_weights: List[models.Weight]
+) -> None:
+    """Test exporting all weights as CSV and one animal's as gzipped NDJSON."""
+    response = authorized_client.get(
+        "/api/weights/export", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "id,animal_id,animal_name,weight,date,created_at,updated_at"
+    assert len(lines) == len(test_weights) + 1
+
+    animal_id = str(test_animals[0].id)
+    response = authorized_client.get(
+        "/api/weights/export",
+        params={"format": "ndjson", "animal_id": animal_id},
+        headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows and all(row["animal_id"] == animal_id for row in rows)
+    assert [row["date"] for row in rows] == sorted(row["date"] for row in rows)
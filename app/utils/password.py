@@ -2,27 +2,48 @@ import bcrypt
 import secrets
 import string
 import logging
-from typing import Dict
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# bcrypt's own default cost
+DEFAULT_ROUNDS = 12
 
-def hash_password(password: str) -> str:
+
+def hash_password(password: str, rounds: int = DEFAULT_ROUNDS) -> str:
     """
     Hash a password using bcrypt.
 
     Args:
         password: The plain password to hash
+        rounds: The bcrypt cost factor; each step doubles the work
 
     Returns:
         str: The hashed password
     """
     # Hash the password with bcrypt (it handles salt internally)
     password_bytes = password.encode('utf-8')
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds))
     return hashed.decode('utf-8')
 
 
+def hash_rounds(hashed_password: Optional[str]) -> Optional[int]:
+    """
+    Read the cost factor of a stored bcrypt hash.
+
+    Args:
+        hashed_password: A hash as returned by hash_password
+
+    Returns:
+        The cost factor, or None if the value isn't a bcrypt hash
+    """
+    # $2b$<cost>$<salt and digest>
+    parts = (hashed_password or "").split("$")
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against a stored hash.
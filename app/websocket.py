@@ -1,34 +1,296 @@
 from fastapi import WebSocket
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 import json
 import asyncio
-from datetime import datetime
+import os
+import time
+import uuid
+import orjson
 import psycopg2
 import psycopg2.extensions
 from .database import SQLALCHEMY_DATABASE_URL
+from . import metrics
+from .event_log import EventLog
 import logging
 
 logger = logging.getLogger(__name__)
 
+NOTIFY_CHANNEL = "db_changes"
+
+# Event log sizing: recent events kept in memory per user (also the
+# de-duplication window), how many users are tracked, and how long the
+# realtime_events table keeps history for reconnecting clients
+EVENT_LOG_BUFFER_SIZE = int(os.getenv("EVENT_LOG_BUFFER_SIZE", "256"))
+EVENT_LOG_MAX_USERS = int(os.getenv("EVENT_LOG_MAX_USERS", "10000"))
+EVENT_LOG_RETENTION = int(os.getenv("EVENT_LOG_RETENTION", "86400"))
+EVENT_LOG_PRUNE_INTERVAL = int(os.getenv("EVENT_LOG_PRUNE_INTERVAL", "600"))
+# Reconnects that missed more events than this are told to resync instead
+EVENT_REPLAY_LIMIT = int(os.getenv("EVENT_REPLAY_LIMIT", "1000"))
+
+# Per-socket outbound queue: a client whose backlog reaches the high-water
+# mark is degraded to a resync, and evicted if it overflows again before
+# catching up or a single write stalls longer than WS_SEND_TIMEOUT seconds
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "1024"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_MESSAGE = {"type": "HEARTBEAT"}
+RESYNC_MESSAGE = {"type": "RESYNC_REQUIRED"}
+PONG_MESSAGE = {"type": "PONG"}
+
+# Most topics a single socket may subscribe to
+WS_MAX_TOPICS = int(os.getenv("WS_MAX_TOPICS", "1000"))
+# Sockets without subscriptions are indexed under this topic and receive
+# every event of their user
+ALL_TOPIC = "*"
+
+# (table, operation) pairs emitted by the db_changes triggers, mapped to the
+# event types the routers broadcast
+NOTIFY_EVENT_TYPES = {
+    ("weights", "INSERT"): "WEIGHT_CREATED",
+    ("weights", "UPDATE"): "WEIGHT_UPDATED",
+    ("weights", "DELETE"): "WEIGHT_DELETED",
+    ("animals", "INSERT"): "ANIMAL_CREATED",
+    ("animals", "UPDATE"): "ANIMAL_UPDATED",
+    ("animals", "DELETE"): "ANIMAL_DELETED",
+}
+
+
+def encode_frame(message: Dict[str, Any]) -> str:
+    """Serialize a message into the text frame sent to the clients."""
+    return orjson.dumps(message).decode()
+
+
+class Frame:
+    """An encoded message, shared by every connection it is queued on.
+
+    Events carry the time they were published (epoch seconds) so the
+    writer can measure publish-to-send latency.
+    """
+    __slots__ = ("text", "seq", "event_type", "path", "published_at")
+
+    def __init__(
+        self,
+        text: str,
+        seq: Optional[int] = None,
+        event_type: Optional[str] = None,
+        path: Optional[str] = None,
+        published_at: Optional[float] = None
+    ):
+        self.text = text
+        self.seq = seq
+        self.event_type = event_type
+        self.path = path
+        self.published_at = published_at
+
+
+# Constant frames are encoded once at import
+HEARTBEAT_FRAME = Frame(encode_frame(HEARTBEAT_MESSAGE))
+RESYNC_FRAME = Frame(encode_frame(RESYNC_MESSAGE))
+PONG_FRAME = Frame(encode_frame(PONG_MESSAGE))
+
+# Delivery paths: published by this worker and broadcast after commit, or
+# received through LISTEN/NOTIFY from another worker or a trigger
+PATH_LOCAL = "local"
+PATH_NOTIFY = "notify"
+
+DELIVERY_LATENCY = metrics.histogram(
+    "realtime_event_delivery_seconds",
+    "Time from publishing an event to writing it to a client socket",
+    labels=("type", "path")
+)
+SLOW_CONSUMER_RESYNCS = metrics.counter(
+    "realtime_slow_consumer_resyncs_total",
+    "Sockets whose send queue overflowed and were told to resync"
+)
+SLOW_CONSUMER_EVICTIONS = metrics.counter(
+    "realtime_slow_consumer_evictions_total",
+    "Sockets closed for falling behind or stalling on a send"
+)
+
+
+def event_animal_ids(message: Dict[str, Any]) -> Optional[List[str]]:
+    """The animal(s) an event is about.
+
+    None if its animal_ids list was truncated, so it may be about any of
+    its user's animals.
+    """
+    data = message.get("data") or {}
+    if "animal_ids" in data and data.get("truncated"):
+        return None
+    animal_ids = [str(animal_id) for animal_id in data.get("animal_ids") or []]
+    animal_id = data.get("animal_id")
+    if animal_id is None and str(message.get("type")).startswith("ANIMAL_"):
+        animal_id = data.get("id")
+    if animal_id is not None:
+        animal_ids.append(str(animal_id))
+    return animal_ids
+
+
+def event_topics(message: Dict[str, Any]) -> Optional[List[str]]:
+    """Topics an event is published under: its type and its animal(s).
+
+    None if it may be about any animal and so matches every topic.
+    """
+    animal_ids = event_animal_ids(message)
+    if animal_ids is None:
+        return None
+    return [f"type:{message.get('type')}"] + [
+        f"animal:{animal_id}" for animal_id in animal_ids]
+
+
+def requested_topics(message: Dict[str, Any]) -> Optional[List[str]]:
+    """Topics named by a SUBSCRIBE or UNSUBSCRIBE message.
+
+    None if animal_ids or event_types is there but not a list.
+    """
+    animal_ids = message.get("animal_ids") or []
+    event_types = message.get("event_types") or []
+    if not isinstance(animal_ids, list) or not isinstance(event_types, list):
+        return None
+    topics = []
+    for animal_id in animal_ids:
+        try:
+            topics.append(f"animal:{uuid.UUID(str(animal_id))}")
+        except ValueError:
+            continue
+    for event_type in event_types:
+        if isinstance(event_type, str) and event_type:
+            topics.append(f"type:{event_type}")
+    return topics
+
+
+class ClientConnection:
+    """A WebSocket with its own bounded send queue and writer task.
+
+    Producers only enqueue pre-encoded frames, so a slow or stalled client
+    delays nobody but itself and a broadcast is serialized once however
+    many sockets receive it.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, on_evict: Callable[["ClientConnection"], None]):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        # Live frames held back while the client catches up on a replay
+        self.held_back: Optional[List[Frame]] = None
+        self.degraded = False
+        self.closed = False
+        # Explicit subscriptions; empty means every event of the user
+        self.topics: Set[str] = set()
+        self._on_evict = on_evict
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, frame: Frame) -> bool:
+        """Queue a frame without waiting; False if it was not queued."""
+        if self.closed:
+            return False
+        if self.held_back is not None:
+            self.held_back.append(frame)
+            return True
+        return self._enqueue(frame)
+
+    def send_heartbeat(self):
+        # A client with a backlog is busy anyway, skip rather than degrade it
+        if not self.closed and not self.queue.full():
+            self.queue.put_nowait(HEARTBEAT_FRAME)
+
+    def _enqueue(self, frame: Frame) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.degraded:
+            self.evict("send queue overflowed again before the resync was sent")
+            return False
+        # Drop the backlog; the client reloads instead of replaying it
+        logger.warning(
+            f"Send queue full for user {self.user_id}, requesting a resync")
+        SLOW_CONSUMER_RESYNCS.inc()
+        self.degraded = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC_FRAME)
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                await asyncio.wait_for(
+                    self.websocket.send_text(frame.text), WS_SEND_TIMEOUT)
+                if frame.published_at is not None:
+                    DELIVERY_LATENCY.observe(
+                        time.time() - frame.published_at, frame.event_type, frame.path)
+                elif frame is RESYNC_FRAME:
+                    self.degraded = False
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.evict("send timed out")
+        except Exception as e:
+            self.evict(f"send failed: {e}")
+
+    def evict(self, reason: str):
+        """Drop the connection from the manager and close the socket."""
+        if self.closed:
+            return
+        logger.warning(f"Evicting WebSocket of user {self.user_id}: {reason}")
+        SLOW_CONSUMER_EVICTIONS.inc()
+        self.close()
+        self._on_evict(self)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    def close(self):
+        """Stop the writer task; queued messages are discarded."""
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+
 
 class ConnectionManager:
     def __init__(self):
         # Store connections with user_id as key
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # user_id -> topic -> subscribed connections, so a broadcast only
+        # touches the sockets interested in it
+        self.topic_index: Dict[str, Dict[str, Set[ClientConnection]]] = {}
         self.db_conn = None
         self.should_listen = False
         self._background_tasks = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._notifications: Optional[asyncio.Queue] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._delivery_tasks = set()
+        # Tags our own NOTIFY payloads so they are not delivered twice
+        self.worker_id = uuid.uuid4().hex
+        self.event_log = EventLog(EVENT_LOG_BUFFER_SIZE, EVENT_LOG_MAX_USERS)
+        # Called with (user_id, message) for every event this worker sees
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
 
     async def start(self):
         """Start background tasks."""
         logger.info("Starting WebSocket manager...")
         try:
             self.should_listen = True
+            self._loop = asyncio.get_running_loop()
+            self._notifications = asyncio.Queue()
             await self._init_db_connection()
             self._background_tasks = [
                 asyncio.create_task(self.heartbeat()),
-                # Add fast notification polling
-                asyncio.create_task(self.poll_notifications())
+                asyncio.create_task(self.dispatch_notifications()),
+                asyncio.create_task(self.prune_event_log())
             ]
             logger.info("WebSocket manager started successfully")
         except Exception as e:
@@ -54,35 +316,51 @@ class ConnectionManager:
             conn_params["host"] = host_port[0]
             conn_params["port"] = host_port[1]
 
-            self.db_conn = psycopg2.connect(**conn_params)
+            self.db_conn = await self._loop.run_in_executor(
+                None, lambda: psycopg2.connect(**conn_params))
             self.db_conn.set_isolation_level(
                 psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
             cursor = self.db_conn.cursor()
-            cursor.execute("LISTEN db_changes;")
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+            # Anything published before this point was not seen live
+            cursor.execute("SELECT last_value FROM realtime_event_seq;")
+            self.event_log.raise_floor(cursor.fetchone()[0])
+            # Wake up only when the server actually sends something
+            self._loop.add_reader(self.db_conn.fileno(), self._on_db_readable)
             logger.info("Database connection initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize database connection: {e}")
-            if self.db_conn:
-                try:
-                    self.db_conn.close()
-                except:
-                    pass
-                self.db_conn = None
+            self._close_db_connection()
             raise
 
+    def _close_db_connection(self):
+        """Detach the LISTEN connection from the event loop and close it."""
+        if not self.db_conn:
+            return
+        try:
+            if self._loop and not self.db_conn.closed:
+                self._loop.remove_reader(self.db_conn.fileno())
+        except Exception as e:
+            logger.error(f"Error removing database reader: {e}")
+        try:
+            self.db_conn.close()
+        except Exception as e:
+            logger.error(f"Error closing database connection: {e}")
+        self.db_conn = None
+
     async def stop(self):
         """Stop background tasks and cleanup resources."""
         logger.info("Stopping WebSocket manager...")
         self.should_listen = False
         if self.db_conn:
-            try:
-                self.db_conn.close()
-                logger.info("Database connection closed")
-            except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
-            self.db_conn = None
+            self._close_db_connection()
+            logger.info("Database connection closed")
 
-        for task in self._background_tasks:
+        tasks = list(self._background_tasks)
+        if self._reconnect_task:
+            tasks.append(self._reconnect_task)
+            self._reconnect_task = None
+        for task in tasks:
             try:
                 task.cancel()
                 await task
@@ -91,98 +369,349 @@ class ConnectionManager:
             except Exception as e:
                 logger.error(f"Error canceling task: {e}")
         self._background_tasks.clear()
+
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections.values()):
+                connection.close()
+        self.active_connections.clear()
+        self.topic_index.clear()
         logger.info("WebSocket manager stopped")
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str, last_seq: Optional[int] = None):
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        connection = ClientConnection(websocket, user_id, self._unregister)
+        if last_seq is not None:
+            connection.held_back = []
+        self.active_connections.setdefault(user_id, {})[websocket] = connection
+        self._index(connection, [ALL_TOPIC])
+        connection.start()
+        if last_seq is not None:
+            await self._replay(connection, last_seq)
 
     def disconnect(self, websocket: WebSocket, user_id: str):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-
-    async def broadcast_to_user(self, user_id: str, message: dict):
-        if user_id in self.active_connections:
-            dead_connections = []
-            for connection in self.active_connections[user_id]:
+        connection = self.active_connections.get(user_id, {}).get(websocket)
+        if connection:
+            connection.close()
+            self._unregister(connection)
+
+    def _unregister(self, connection: ClientConnection):
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None:
+            return
+        if connections.pop(connection.websocket, None) is None:
+            return
+        if not connections:
+            del self.active_connections[connection.user_id]
+        self._unindex(connection, list(connection.topics) + [ALL_TOPIC])
+
+    def _index(self, connection: ClientConnection, topics: Iterable[str]):
+        index = self.topic_index.setdefault(connection.user_id, {})
+        for topic in topics:
+            index.setdefault(topic, set()).add(connection)
+
+    def _unindex(self, connection: ClientConnection, topics: Iterable[str]):
+        index = self.topic_index.get(connection.user_id)
+        if index is None:
+            return
+        for topic in topics:
+            subscribers = index.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(connection)
+            if not subscribers:
+                del index[topic]
+        if not index:
+            del self.topic_index[connection.user_id]
+
+    def subscribe(self, connection: ClientConnection, topics: Iterable[str]):
+        """Narrow a socket to the given topics (on top of earlier ones)."""
+        new_topics = [topic for topic in topics if topic not in connection.topics]
+        room = WS_MAX_TOPICS - len(connection.topics)
+        if len(new_topics) > room:
+            logger.warning(
+                f"Topic limit reached for a socket of user {connection.user_id}")
+            new_topics = new_topics[:max(room, 0)]
+        if not new_topics:
+            return
+        if not connection.topics:
+            self._unindex(connection, [ALL_TOPIC])
+        connection.topics.update(new_topics)
+        self._index(connection, new_topics)
+
+    def unsubscribe(self, connection: ClientConnection, topics: Iterable[str]):
+        """Drop topics; a socket left without any gets every event again."""
+        removed = [topic for topic in topics if topic in connection.topics]
+        if not removed:
+            return
+        connection.topics.difference_update(removed)
+        self._unindex(connection, removed)
+        if not connection.topics:
+            self._index(connection, [ALL_TOPIC])
+
+    def handle_message(self, websocket: WebSocket, user_id: str, data: str):
+        """Apply a client message: SUBSCRIBE, UNSUBSCRIBE, PING or HEARTBEAT.
+
+        SUBSCRIBE and UNSUBSCRIBE take ``animal_ids`` and/or ``event_types``
+        lists; an event is sent to a subscribed socket if it matches any of
+        its topics.
+        """
+        connection = self.active_connections.get(user_id, {}).get(websocket)
+        if connection is None:
+            return
+        try:
+            message = orjson.loads(data)
+            message_type = message.get("type")
+        except (orjson.JSONDecodeError, AttributeError):
+            logger.debug(f"Ignoring malformed WebSocket message from user {user_id}")
+            return
+
+        if message_type in ("SUBSCRIBE", "UNSUBSCRIBE"):
+            topics = requested_topics(message)
+            if topics is None:
+                logger.debug(f"Ignoring malformed {message_type} from user {user_id}")
+            elif message_type == "SUBSCRIBE":
+                self.subscribe(connection, topics)
+            else:
+                self.unsubscribe(connection, topics)
+        elif message_type == "PING":
+            connection.send(PONG_FRAME)
+        elif message_type != "HEARTBEAT":
+            logger.debug(
+                f"Ignoring WebSocket message of type {message_type} from user {user_id}")
+
+    async def _replay(self, connection: ClientConnection, last_seq: int):
+        """Queue the events a reconnecting client missed, then go live."""
+        missed = None
+        try:
+            missed = self.event_log.since(connection.user_id, last_seq)
+            if missed is None:
+                missed = await self.event_log.load_since(
+                    connection.user_id, last_seq, EVENT_REPLAY_LIMIT)
+        except Exception as e:
+            logger.error(
+                f"Error replaying events for user {connection.user_id}: {e}")
+
+        # No awaits from here on, so nothing can slip in between the
+        # replayed events and the live ones held back meanwhile
+        held_back, connection.held_back = connection.held_back or [], None
+        if missed is None:
+            connection.send(RESYNC_FRAME)
+            missed = []
+        replayed = {message["seq"] for message in missed}
+        for message in missed:
+            connection.send(Frame(encode_frame(message), message["seq"]))
+        for frame in held_back:
+            if frame.seq is not None and (frame.seq <= last_seq or frame.seq in replayed):
+                continue
+            connection.send(frame)
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """Get told about every event, whether or not its user is connected.
+
+        Listeners see each event this worker delivers, published locally or
+        relayed from another worker through NOTIFY, and are called as
+        listener(user_id, message) on the event loop, so they must not block.
+        Used by caches that must drop data an event made stale.
+        """
+        self._listeners.append(listener)
+
+    async def deliver(
+        self,
+        user_id: str,
+        message: Dict[str, Any],
+        path: str = PATH_LOCAL,
+        published_at: Optional[float] = None
+    ):
+        """Send an event to the user's sockets exactly once per worker."""
+        if not self.event_log.record(user_id, message):
+            return
+        for listener in self._listeners:
+            try:
+                listener(user_id, message)
+            except Exception as e:
+                logger.error(f"Error in event listener: {e}")
+        if user_id not in self.active_connections:
+            return
+        await self.broadcast_to_user(user_id, message, path, published_at)
+
+    def deliver_soon(self, events: List[Tuple[str, Dict[str, Any], Optional[float]]]):
+        """Schedule delivery of committed events, keeping their order."""
+        async def _deliver_all():
+            for user_id, message, published_at in events:
                 try:
-                    await connection.send_json(message)
-                except:
-                    dead_connections.append(connection)
+                    await self.deliver(
+                        user_id, message, PATH_LOCAL, published_at)
+                except Exception as e:
+                    logger.error(f"Error delivering event: {e}")
+
+        task = asyncio.create_task(_deliver_all())
+        self._delivery_tasks.add(task)
+        task.add_done_callback(self._delivery_tasks.discard)
+
+    async def broadcast_to_user(
+        self,
+        user_id: str,
+        message: dict,
+        path: Optional[str] = None,
+        published_at: Optional[float] = None
+    ):
+        """Queue a message on the user's interested sockets without waiting."""
+        index = self.topic_index.get(user_id)
+        if not index:
+            return
+        topics = event_topics(message)
+        if topics is None:
+            recipients = set().union(*index.values())
+        else:
+            recipients = set(index.get(ALL_TOPIC, ()))
+            for topic in topics:
+                recipients.update(index.get(topic, ()))
+        if not recipients:
+            return
+        frame = Frame(
+            encode_frame(message),
+            message.get("seq"),
+            message.get("type"),
+            path,
+            published_at
+        )
+        for connection in recipients:
+            connection.send(frame)
+
+    def _on_db_readable(self):
+        """Drain pending notifications when the LISTEN socket is readable."""
+        try:
+            self.db_conn.poll()
+        except Exception as e:
+            logger.error(f"Error reading notifications: {e}")
+            self._close_db_connection()
+            if self.should_listen and not self._reconnect_task:
+                self._reconnect_task = asyncio.create_task(self._reconnect())
+            return
 
-            # Clean up dead connections
-            for dead_connection in dead_connections:
-                self.active_connections[user_id].remove(dead_connection)
+        # notifies is filled in arrival order; hand it over FIFO
+        for notify in self.db_conn.notifies:
+            self._notifications.put_nowait(notify.payload)
+        self.db_conn.notifies.clear()
 
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+    async def _reconnect(self):
+        """Re-establish the LISTEN connection after it was lost."""
+        try:
+            while self.should_listen and not self.db_conn:
+                await asyncio.sleep(1)
+                try:
+                    await self._init_db_connection()
+                except Exception as e:
+                    logger.error(f"Failed to reconnect to database: {e}")
+        finally:
+            self._reconnect_task = None
 
-    async def poll_notifications(self):
-        """Poll database for notifications frequently."""
-        logger.info("Starting notification polling...")
+    async def dispatch_notifications(self):
+        """Deliver database notifications to connected clients in order."""
+        logger.info("Starting notification dispatcher...")
         while self.should_listen:
+            payload = await self._notifications.get()
             try:
-                # Process any pending notifications
-                if self.db_conn:
-                    self.db_conn.poll()
-                    while self.db_conn.notifies:
-                        notify = self.db_conn.notifies.pop()
-                        try:
-                            payload = json.loads(notify.payload)
-                            message = {
-                                "type": f"{payload['table'].upper()}_{payload['operation']}D",
-                                "data": payload['data']
-                            }
-                            await self.broadcast_to_user(payload['owner_id'], message)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Invalid notification payload: {e}")
-                        except Exception as e:
-                            logger.error(f"Error processing notification: {e}")
-
-                # Short sleep to prevent CPU overload
-                await asyncio.sleep(0.1)  # Poll every 100ms
+                await self._handle_notification(payload)
             except Exception as e:
-                logger.error(f"Error in notification polling: {e}")
-                # If database connection is lost, try to reconnect
-                if not self.db_conn:
-                    try:
-                        await self._init_db_connection()
-                    except Exception as e:
-                        logger.error(f"Failed to reconnect to database: {e}")
-                # Wait a bit longer before retrying after error
-                await asyncio.sleep(1)
+                logger.error(f"Error processing notification: {e}")
+
+    async def _handle_notification(self, raw_payload: str):
+        try:
+            payload = json.loads(raw_payload)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid notification payload: {e}")
+            return
+        if payload.get('origin') == self.worker_id:
+            # Published by this worker and already delivered after commit
+            return
+        event_type = payload.get('type') or NOTIFY_EVENT_TYPES.get(
+            (payload.get('table'), payload.get('operation')))
+        if event_type is None:
+            logger.warning(
+                f"Ignoring notification for {payload.get('table')}/{payload.get('operation')}")
+            return
+        data = payload.get('data')
+        if payload.get('truncated'):
+            # Too large for NOTIFY; the published event is in the log
+            data = await self.event_log.load_data(payload['seq'])
+            if data is None:
+                logger.warning(
+                    f"Dropping event {payload['seq']}: pruned before it was loaded")
+                return
+        message = {
+            "type": event_type,
+            "seq": payload.get('seq'),
+            "data": data
+        }
+        # Trigger-sourced events carry no publish time and aren't timed
+        await self.deliver(
+            payload['owner_id'], message, PATH_NOTIFY, payload.get('published_at'))
+
+    async def prune_event_log(self):
+        """Periodically drop expired events from the realtime_events table."""
+        while self.should_listen:
+            await asyncio.sleep(EVENT_LOG_PRUNE_INTERVAL)
+            try:
+                pruned = await self.event_log.prune(EVENT_LOG_RETENTION)
+                if pruned:
+                    logger.info(f"Pruned {pruned} expired realtime events")
+            except Exception as e:
+                logger.error(f"Error pruning realtime events: {e}")
 
     async def heartbeat(self):
         """Send periodic heartbeat to keep connections alive."""
         logger.info("Starting heartbeat...")
         while self.should_listen:
             try:
-                await asyncio.sleep(30)  # Send heartbeat every 30 seconds
-
-                # Send heartbeat to all connections
-                for user_id, connections in list(self.active_connections.items()):
-                    dead_connections = []
-                    for connection in connections:
-                        try:
-                            await connection.send_json({"type": "HEARTBEAT"})
-                        except Exception as e:
-                            logger.error(
-                                f"Error sending heartbeat to user {user_id}: {e}")
-                            dead_connections.append(connection)
-
-                    # Clean up dead connections
-                    for dead_connection in dead_connections:
-                        connections.remove(dead_connection)
-
-                    if not connections:
-                        del self.active_connections[user_id]
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+                # Only queues the frame; each connection's writer sends it
+                for connections in list(self.active_connections.values()):
+                    for connection in list(connections.values()):
+                        connection.send_heartbeat()
             except Exception as e:
                 logger.error(f"Error in heartbeat: {e}")
                 await asyncio.sleep(5)  # Wait before retrying
 
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+
+    def send_queue_depths(self) -> List[int]:
+        return [
+            connection.queue.qsize()
+            for connections in self.active_connections.values()
+            for connection in connections.values()
+        ]
+
+    def notification_queue_depth(self) -> int:
+        return self._notifications.qsize() if self._notifications else 0
+
 
 manager = ConnectionManager()
+
+metrics.gauge(
+    "realtime_connections",
+    "Open WebSocket connections",
+    callback=manager.connection_count
+)
+metrics.gauge(
+    "realtime_send_queue_depth",
+    "Frames waiting in all per-socket send queues",
+    callback=lambda: sum(manager.send_queue_depths())
+)
+metrics.gauge(
+    "realtime_send_queue_max_depth",
+    "Frames waiting in the fullest per-socket send queue",
+    callback=lambda: max(manager.send_queue_depths(), default=0)
+)
+metrics.gauge(
+    "realtime_notification_queue_depth",
+    "NOTIFY payloads waiting to be dispatched",
+    callback=manager.notification_queue_depth
+)
+metrics.gauge(
+    "realtime_pending_deliveries",
+    "Batches of committed events waiting to be delivered",
+    callback=lambda: len(manager._delivery_tasks)
+)
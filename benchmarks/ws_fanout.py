@@ -0,0 +1,414 @@
+"""WebSocket fan-out benchmark.
+
+Connects simulated clients to /ws/{token} of a local app instance, drives
+weight create/update traffic through the REST API and reports delivery
+latency percentiles, throughput, server memory per connection and the
+cost of the heartbeat sweep. Everything runs locally: by default the app
+is spawned with uvicorn against the database configured in .env.
+
+    python -m benchmarks.ws_fanout --users 50 --sockets-per-user 20
+
+See benchmarks/README.md for the options and how to read the results.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WEIGHT_EVENTS = ("WEIGHT_CREATED", "WEIGHT_UPDATED")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# The spawned app's rate limits (app/middleware/rate_limit.py), lifted so
+# registering every account from one IP and the write traffic aren't
+# throttled; set RATE_LIMIT_<NAME> in the environment to measure with them
+RATE_LIMIT_POLICIES = ("login", "auth", "weight_import", "weight_export", "api")
+BENCHMARK_RATE_LIMIT = "1000000000/1"
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class ServerProcess:
+    """Reads memory and CPU usage of the app process from /proc."""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+
+    def rss_bytes(self) -> Optional[int]:
+        if self.pid is None:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def cpu_seconds(self) -> Optional[float]:
+        if self.pid is None:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                # Fields after the parenthesized command name; utime and
+                # stime are the 14th and 15th fields of the whole line
+                fields = stat.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            return None
+
+
+class Stats:
+    """What the simulated clients observed."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.event_frames = 0
+        self.heartbeats: List[float] = []
+        self.first_event_at: Optional[float] = None
+        self.last_event_at: Optional[float] = None
+        self.unmatched = 0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Start the app with a single uvicorn worker so /proc stats are its own."""
+    env = dict(os.environ)
+    # Registration tries to send a verification email; fail fast offline
+    env.setdefault("SMTP_HOST", "127.0.0.1")
+    env.setdefault("SMTP_PORT", "9")
+    for name in RATE_LIMIT_POLICIES:
+        env.setdefault(f"RATE_LIMIT_{name.upper()}", BENCHMARK_RATE_LIMIT)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("App did not come up in time")
+        await asyncio.sleep(0.5)
+
+
+async def create_account(client: httpx.AsyncClient, run_id: str, index: int) -> Dict[str, str]:
+    """Register a throwaway user with one animal."""
+    username = f"bench_{run_id}_{index}"
+    response = await client.post("/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "Benchmark123!"
+    })
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.post(
+        "/api/animals", json={"name": f"Bench animal {index}"}, headers=headers)
+    response.raise_for_status()
+    return {"token": token, "animal_id": response.json()["id"]}
+
+
+async def run_client(
+    ws_url: str,
+    token: str,
+    stats: Stats,
+    sent_at: Dict[int, float],
+    connected: asyncio.Event,
+    counter: List[int],
+    total: int,
+    stop: asyncio.Event
+) -> None:
+    # Protocol-level pings are off so only the app's own traffic is measured
+    async with websockets.connect(
+        f"{ws_url}/ws/{token}", ping_interval=None, max_size=None
+    ) as ws:
+        counter[0] += 1
+        if counter[0] == total:
+            connected.set()
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            except websockets.ConnectionClosed:
+                return
+            received_at = time.perf_counter()
+            message = json.loads(frame)
+            if message.get("type") == "HEARTBEAT":
+                stats.heartbeats.append(received_at)
+                continue
+            if message.get("type") not in WEIGHT_EVENTS:
+                continue
+
+            stats.event_frames += 1
+            if stats.first_event_at is None:
+                stats.first_event_at = received_at
+            stats.last_event_at = received_at
+            # The weight value carries the index of the request that caused it
+            key = round(float(message["data"]["weight"]) * 100)
+            started = sent_at.get(key)
+            if started is None:
+                stats.unmatched += 1
+            else:
+                stats.latencies.append(received_at - started)
+
+
+async def drive_traffic(
+    client: httpx.AsyncClient,
+    accounts: List[Dict[str, str]],
+    sent_at: Dict[int, float],
+    events: int,
+    rate: float,
+    concurrency: int,
+    update_ratio: float
+) -> int:
+    """Send weight writes at a fixed rate; return how many succeeded."""
+    semaphore = asyncio.Semaphore(concurrency)
+    created: Dict[str, List[str]] = {account["token"]: [] for account in accounts}
+    succeeded = 0
+    base_date = datetime.now(UTC) - timedelta(days=365)
+
+    async def write(index: int) -> None:
+        nonlocal succeeded
+        account = accounts[index % len(accounts)]
+        headers = {"Authorization": f"Bearer {account['token']}"}
+        weight = f"{1 + index / 100:.2f}"
+        date = (base_date + timedelta(minutes=index)).isoformat()
+        own = created[account["token"]]
+        async with semaphore:
+            sent_at[index + 100] = time.perf_counter()
+            if own and (index % 100) < update_ratio * 100:
+                response = await client.put(
+                    f"/api/weights/{own[index % len(own)]}",
+                    json={"weight": weight, "date": date},
+                    headers=headers
+                )
+            else:
+                response = await client.post("/api/weights/", json={
+                    "animal_id": account["animal_id"],
+                    "weight": weight,
+                    "date": date
+                }, headers=headers)
+                if response.status_code == 200:
+                    own.append(response.json()["id"])
+        if response.status_code == 200:
+            succeeded += 1
+
+    tasks = []
+    interval = 1 / rate if rate > 0 else 0
+    started = time.perf_counter()
+    for index in range(events):
+        # Open loop: requests go out on schedule whatever the latency
+        delay = started + index * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(write(index)))
+    await asyncio.gather(*tasks)
+    return succeeded
+
+
+def summarize(stats: Stats, expected: int, seconds: float) -> Dict[str, object]:
+    latencies = sorted(stats.latencies)
+    result: Dict[str, object] = {
+        "expected_deliveries": expected,
+        "received_events": stats.event_frames,
+        "unmatched_events": stats.unmatched,
+        "lost_events": max(expected - stats.event_frames, 0),
+        "latency_ms": {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p90", percentile(latencies, 90)),
+                ("p99", percentile(latencies, 99)),
+                ("p99.9", percentile(latencies, 99.9)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+    }
+    if stats.first_event_at is not None and stats.last_event_at > stats.first_event_at:
+        result["messages_per_second"] = round(
+            stats.event_frames / (stats.last_event_at - stats.first_event_at), 1)
+    result["load_seconds"] = round(seconds, 2)
+    return result
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, object]:
+    server = None
+    base_url = args.base_url
+    pid = args.server_pid
+    if base_url is None:
+        port = free_port()
+        server = spawn_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+        pid = server.pid
+    ws_url = base_url.replace("http", "ws", 1)
+    process = ServerProcess(pid)
+    run_id = uuid.uuid4().hex[:8]
+    results: Dict[str, object] = {
+        "users": args.users,
+        "sockets_per_user": args.sockets_per_user,
+        "connections": args.users * args.sockets_per_user,
+    }
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await wait_until_up(client)
+
+            print(f"Creating {args.users} users...", file=sys.stderr)
+            accounts = []
+            for start in range(0, args.users, args.concurrency):
+                accounts += await asyncio.gather(*(
+                    create_account(client, run_id, index)
+                    for index in range(start, min(start + args.concurrency, args.users))
+                ))
+
+            stats = Stats()
+            sent_at: Dict[int, float] = {}
+            stop = asyncio.Event()
+            connected = asyncio.Event()
+            counter = [0]
+            total = args.users * args.sockets_per_user
+
+            rss_before = process.rss_bytes()
+            print(f"Connecting {total} sockets...", file=sys.stderr)
+            connect_started = time.perf_counter()
+            clients = []
+            for account in accounts:
+                for _ in range(args.sockets_per_user):
+                    clients.append(asyncio.create_task(run_client(
+                        ws_url, account["token"], stats, sent_at,
+                        connected, counter, total, stop)))
+                    # Keep the accept backlog from overflowing
+                    if len(clients) % args.concurrency == 0:
+                        await asyncio.sleep(0.05)
+            try:
+                await asyncio.wait_for(connected.wait(), args.connect_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"Only {counter[0]} of {total} sockets connected")
+            results["connect_seconds"] = round(time.perf_counter() - connect_started, 2)
+            await asyncio.sleep(2)  # Let the server settle before sampling
+            rss_after = process.rss_bytes()
+            if rss_before is not None and rss_after is not None:
+                results["server_rss_mb"] = round(rss_after / 2**20, 1)
+                results["memory_per_connection_kb"] = round(
+                    (rss_after - rss_before) / total / 1024, 2)
+
+            if args.idle > 0:
+                print(f"Idling {args.idle}s to catch heartbeats...", file=sys.stderr)
+                cpu_before = process.cpu_seconds()
+                heartbeats_before = len(stats.heartbeats)
+                await asyncio.sleep(args.idle)
+                cpu_after = process.cpu_seconds()
+                arrivals = sorted(stats.heartbeats[heartbeats_before:])
+                heartbeat: Dict[str, object] = {"frames": len(arrivals)}
+                if arrivals:
+                    # Spread between the first and last socket of a sweep
+                    heartbeat["sweep_ms"] = round((arrivals[-1] - arrivals[0]) * 1000, 2)
+                if cpu_before is not None and cpu_after is not None:
+                    heartbeat["idle_cpu_seconds"] = round(cpu_after - cpu_before, 3)
+                    if arrivals:
+                        heartbeat["cpu_us_per_frame"] = round(
+                            (cpu_after - cpu_before) / len(arrivals) * 1e6, 2)
+                results["heartbeat"] = heartbeat
+
+            print(f"Sending {args.events} weight writes...", file=sys.stderr)
+            cpu_before = process.cpu_seconds()
+            load_started = time.perf_counter()
+            succeeded = await drive_traffic(
+                client, accounts, sent_at, args.events, args.rate,
+                args.concurrency, args.update_ratio)
+            expected = succeeded * args.sockets_per_user
+            deadline = time.perf_counter() + args.drain
+            while stats.event_frames < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+            load_seconds = time.perf_counter() - load_started
+            cpu_after = process.cpu_seconds()
+
+            stop.set()
+            await asyncio.gather(*clients, return_exceptions=True)
+
+            results["requests"] = {"sent": args.events, "succeeded": succeeded}
+            results.update(summarize(stats, expected, load_seconds))
+            if cpu_before is not None and cpu_after is not None:
+                results["load_cpu_seconds"] = round(cpu_after - cpu_before, 3)
+
+            # Deleting the animals removes their weights and events too
+            for account in accounts:
+                await client.delete(
+                    f"/api/animals/{account['animal_id']}",
+                    headers={"Authorization": f"Bearer {account['token']}"})
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", help="Use a running app instead of spawning one")
+    parser.add_argument("--server-pid", type=int,
+                        help="PID of the running app, for memory and CPU figures")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--sockets-per-user", type=int, default=10)
+    parser.add_argument("--events", type=int, default=1000,
+                        help="Weight writes to send")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="Writes per second (0 sends as fast as possible)")
+    parser.add_argument("--update-ratio", type=float, default=0.5,
+                        help="Share of writes that update an existing weight")
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="Concurrent HTTP requests and connection attempts")
+    parser.add_argument("--idle", type=float, default=35,
+                        help="Idle seconds for the heartbeat measurement (0 skips it)")
+    parser.add_argument("--drain", type=float, default=30,
+                        help="Seconds to wait for outstanding events")
+    parser.add_argument("--connect-timeout", type=float, default=120)
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    results = asyncio.run(benchmark(args))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.json:
+        args.json.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
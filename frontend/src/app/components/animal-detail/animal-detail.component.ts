@@ -20,6 +20,9 @@ interface EditingWeight {
   date: string;
 }
 
+// Histories longer than this are plotted from the downsampled chart API
+const CHART_POINTS = 500;
+
 @Component({
   selector: 'app-animal-detail',
   standalone: true,
@@ -329,6 +332,7 @@ export class AnimalDetailComponent implements OnInit, OnDestroy {
   }
 
   ngOnDestroy() {
+    this.webSocketService.unsubscribeFromAnimal(this.animalId);
     this.destroy$.next();
     this.destroy$.complete();
   }
@@ -365,6 +369,14 @@ export class AnimalDetailComponent implements OnInit, OnDestroy {
 
   private setupWebSocket() {
     this.webSocketService.connect();
+    // Only this animal's events are needed while the page is open
+    this.webSocketService.subscribeToAnimal(this.animalId);
+
+    // Missed events could not be replayed, fall back to a full reload
+    this.webSocketService
+      .getResyncRequests()
+      .pipe(takeUntil(this.destroy$))
+      .subscribe(() => this.loadAnimal());
 
     // Handle weight updates
     this.webSocketService
@@ -393,6 +405,16 @@ export class AnimalDetailComponent implements OnInit, OnDestroy {
         }
       });
 
+    // Bulk imports are announced once; reload instead of patching
+    this.webSocketService
+      .getWeightImports()
+      .pipe(takeUntil(this.destroy$))
+      .subscribe((animalIds) => {
+        if (animalIds === null || animalIds.includes(this.animalId)) {
+          this.loadAnimal();
+        }
+      });
+
     // Handle weight deletions
     this.webSocketService
       .getWeightDeletions()
@@ -470,15 +492,26 @@ export class AnimalDetailComponent implements OnInit, OnDestroy {
   private updateChart() {
     if (!this.animal) return;
 
+    // Long histories are downsampled by the API instead of plotting
+    // every reading
+    if (this.animal.weights.length > CHART_POINTS) {
+      this.apiService
+        .getWeightChart(this.animal.id, CHART_POINTS)
+        .pipe(takeUntil(this.destroy$))
+        .subscribe((chart) => this.renderChart(chart.points));
+      return;
+    }
+
     // Sort chronologically for chart (oldest first)
     const sortedWeights = [...this.animal.weights].sort(
       (a, b) => new Date(a.date).getTime() - new Date(b.date).getTime()
     );
+    this.renderChart(sortedWeights);
+  }
 
-    const dates = sortedWeights.map((w) =>
-      new Date(w.date).toLocaleDateString()
-    );
-    const weights = sortedWeights.map((w) => w.weight);
+  private renderChart(points: { date: string; weight: number }[]) {
+    const dates = points.map((w) => new Date(w.date).toLocaleDateString());
+    const weights = points.map((w) => w.weight);
 
     this.weightChart = {
       data: {
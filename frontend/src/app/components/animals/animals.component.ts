@@ -9,6 +9,9 @@ import { Animal, AnimalWithWeights } from '../../models/animal.model';
 import { WeightEntry } from '../../models/weight.model';
 import { AddAnimalDialogComponent } from '../add-animal-dialog/add-animal-dialog.component';
 
+// Recent readings loaded per animal; the list only shows the latest weight
+const DASHBOARD_WEIGHT_LIMIT = 30;
+
 @Component({
   selector: 'app-animals',
   standalone: true,
@@ -194,6 +197,12 @@ export class AnimalsComponent implements OnInit, OnDestroy {
   private setupWebSocket() {
     this.webSocketService.connect();
 
+    // Missed events could not be replayed, fall back to a full reload
+    this.webSocketService
+      .getResyncRequests()
+      .pipe(takeUntil(this.destroy$))
+      .subscribe(() => this.loadAnimals());
+
     // Handle animal updates
     this.webSocketService
       .getAnimalUpdates()
@@ -265,6 +274,19 @@ export class AnimalsComponent implements OnInit, OnDestroy {
         }
       });
 
+    // Bulk imports are announced once; reload instead of patching
+    this.webSocketService
+      .getWeightImports()
+      .pipe(takeUntil(this.destroy$))
+      .subscribe((animalIds) => {
+        if (
+          animalIds === null ||
+          this.animals.some((a) => animalIds.includes(a.id))
+        ) {
+          this.loadAnimals();
+        }
+      });
+
     // Handle weight deletions
     this.webSocketService
       .getWeightDeletions()
@@ -293,21 +315,25 @@ export class AnimalsComponent implements OnInit, OnDestroy {
           lastWeight: null,
         }));
 
-        // Load weights for each animal
-        this.animals.forEach((animal) => {
-          this.apiService.getWeights(animal.id).subscribe({
-            next: (weights) => {
-              animal.weights = weights;
-              this.updateAnimalWeightHistory(animal);
+        // Load the recent weights of all animals in one request
+        this.apiService
+          .getWeightsBatch({ limit: DASHBOARD_WEIGHT_LIMIT })
+          .subscribe({
+            next: (series) => {
+              for (const { animal_id, weights } of series) {
+                const animal = this.animals.find((a) => a.id === animal_id);
+                if (animal) {
+                  animal.weights = weights;
+                  this.updateAnimalWeightHistory(animal);
+                }
+              }
+              // Create a new array reference to trigger change detection
+              this.animals = [...this.animals];
             },
             error: (error) => {
-              console.error(
-                `Error loading weights for animal ${animal.id}:`,
-                error
-              );
+              console.error('Error loading weights:', error);
             },
           });
-        });
 
         this.isLoading = false;
       },
@@ -1,4 +1,5 @@
 import {
+  HttpClient,
   HttpInterceptorFn,
   HttpRequest,
   HttpHandlerFn,
@@ -6,31 +7,67 @@ import {
 } from '@angular/common/http';
 import { inject } from '@angular/core';
 import { Router } from '@angular/router';
-import { catchError, throwError } from 'rxjs';
+import { catchError, switchMap, throwError } from 'rxjs';
+import { environment } from '../../environments/environment';
 
-export const authInterceptor: HttpInterceptorFn = (
-  request: HttpRequest<unknown>,
-  next: HttpHandlerFn
-) => {
-  const router = inject(Router);
+interface RefreshResponse {
+  access_token: string;
+  refresh_token: string;
+}
+
+function withToken(request: HttpRequest<unknown>): HttpRequest<unknown> {
   const token = localStorage.getItem('token');
 
   // Clone the request and add the authorization header if token exists
   if (token) {
-    request = request.clone({
+    return request.clone({
       setHeaders: {
         Authorization: `Bearer ${token}`,
       },
     });
   }
+  return request;
+}
+
+export const authInterceptor: HttpInterceptorFn = (
+  request: HttpRequest<unknown>,
+  next: HttpHandlerFn
+) => {
+  const router = inject(Router);
+  const http = inject(HttpClient);
+
+  const signOut = () => {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    router.navigate(['/login']);
+  };
 
-  return next(request).pipe(
+  return next(withToken(request)).pipe(
     catchError((error: HttpErrorResponse) => {
-      if (error.status === 401) {
-        localStorage.removeItem('token');
-        router.navigate(['/login']);
+      if (error.status !== 401) {
+        return throwError(() => error);
+      }
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken || request.url.includes('/auth/')) {
+        signOut();
+        return throwError(() => error);
       }
-      return throwError(() => error);
+      // The access token expired: renew it once and retry
+      return http
+        .post<RefreshResponse>(`${environment.apiUrl}/auth/refresh`, {
+          refresh_token: refreshToken,
+        })
+        .pipe(
+          catchError(() => {
+            signOut();
+            return throwError(() => error);
+          }),
+          switchMap((response) => {
+            localStorage.setItem('token', response.access_token);
+            localStorage.setItem('refresh_token', response.refresh_token);
+            return next(withToken(request));
+          })
+        );
     })
   );
 };
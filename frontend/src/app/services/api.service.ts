@@ -1,12 +1,34 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { HttpClient, HttpParams } from '@angular/common/http';
+import { EMPTY, Observable, expand, map, reduce } from 'rxjs';
 import { environment } from '../../environments/environment';
 import { Animal, AnimalCreate, AnimalUpdate } from '../models/animal.model';
 import { WeightEntry, WeightUpdate } from '../models/weight.model';
 import { MediaResponse } from '../models/media.model';
 import { User, UserProfileUpdate, PasswordUpdate } from '../models/user.model';
 
+export interface WeightRange {
+  from?: string;
+  to?: string;
+}
+
+export interface WeightChart {
+  total: number;
+  points: { date: string; weight: number }[];
+}
+
+export interface WeightPage {
+  weights: WeightEntry[];
+  nextCursor: string | null;
+}
+
+export interface AnimalWeights {
+  animal_id: string;
+  // The latest readings in the range, oldest first
+  weights: WeightEntry[];
+  has_more: boolean;
+}
+
 @Injectable({
   providedIn: 'root',
 })
@@ -77,12 +99,97 @@ export class ApiService {
   }
 
   // Weight endpoints
-  getWeights(animalId: string): Observable<WeightEntry[]> {
-    return this.http.get<WeightEntry[]>(
-      `${this.baseUrl}/api/weights/animal/${animalId}`
+  // All weights of an animal, following the pages in date order
+  getWeights(
+    animalId: string,
+    range: WeightRange = {}
+  ): Observable<WeightEntry[]> {
+    return this.getWeightsPage(animalId, { ...range, limit: 5000 }).pipe(
+      expand((page) =>
+        page.nextCursor
+          ? this.getWeightsPage(animalId, {
+              ...range,
+              limit: 5000,
+              cursor: page.nextCursor,
+            })
+          : EMPTY
+      ),
+      reduce((weights, page) => weights.concat(page.weights), [] as WeightEntry[])
+    );
+  }
+
+  // Latest weights of several animals (all of the user's by default) in
+  // one request; at most `limit` readings per animal
+  getWeightsBatch(
+    options: WeightRange & { animalIds?: string[]; limit?: number } = {}
+  ): Observable<AnimalWeights[]> {
+    let params = new HttpParams();
+    for (const animalId of options.animalIds ?? []) {
+      params = params.append('animal_id', animalId);
+    }
+    if (options.from) params = params.set('from', options.from);
+    if (options.to) params = params.set('to', options.to);
+    if (options.limit) params = params.set('limit', options.limit);
+    return this.http.get<AnimalWeights[]>(`${this.baseUrl}/api/weights/batch`, {
+      params,
+    });
+  }
+
+  // Full weight history of some or all animals as a CSV or NDJSON file
+  exportWeights(
+    format: 'csv' | 'ndjson',
+    options: WeightRange & { animalIds?: string[] } = {}
+  ): Observable<Blob> {
+    let params = new HttpParams().set('format', format);
+    for (const animalId of options.animalIds ?? []) {
+      params = params.append('animal_id', animalId);
+    }
+    if (options.from) params = params.set('from', options.from);
+    if (options.to) params = params.set('to', options.to);
+    return this.http.get(`${this.baseUrl}/api/weights/export`, {
+      params,
+      responseType: 'blob',
+    });
+  }
+
+  // Weight series downsampled server-side to at most `points` points
+  getWeightChart(
+    animalId: string,
+    points: number,
+    range: WeightRange = {}
+  ): Observable<WeightChart> {
+    let params = new HttpParams().set('points', points);
+    if (range.from) params = params.set('from', range.from);
+    if (range.to) params = params.set('to', range.to);
+    return this.http.get<WeightChart>(
+      `${this.baseUrl}/api/weights/animal/${animalId}/chart`,
+      { params }
     );
   }
 
+  // One page of weights in date order; from is inclusive, to exclusive
+  getWeightsPage(
+    animalId: string,
+    options: WeightRange & { limit?: number; cursor?: string } = {}
+  ): Observable<WeightPage> {
+    let params = new HttpParams();
+    if (options.from) params = params.set('from', options.from);
+    if (options.to) params = params.set('to', options.to);
+    if (options.limit) params = params.set('limit', options.limit);
+    if (options.cursor) params = params.set('cursor', options.cursor);
+    return this.http
+      .get<WeightEntry[]>(`${this.baseUrl}/api/weights/animal/${animalId}`, {
+        params,
+        observe: 'response',
+      })
+      .pipe(
+        map((response) => ({
+          weights: response.body ?? [],
+          nextCursor: response.headers.get('X-Next-Cursor'),
+        }))
+      );
+  }
+
   addWeightEntry(
     animalId: string,
     weight: number,
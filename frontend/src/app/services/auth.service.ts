@@ -10,6 +10,7 @@ interface AuthResponse {
   access_token: string;
   token_type: string;
   expires_in: number;
+  refresh_token?: string;
 }
 
 @Injectable({
@@ -31,7 +32,14 @@ export class AuthService {
     const token = localStorage.getItem('token');
     if (token) {
       this.isAuthenticatedSubject.next(true);
-      this.loadUserData().catch(() => this.logout());
+      // The access token may have expired while the app was closed
+      this.loadUserData()
+        .catch(async () => {
+          await this.handleAuthResponse(
+            await firstValueFrom(this.refreshToken())
+          );
+        })
+        .catch(() => this.logout());
     }
   }
 
@@ -125,7 +133,15 @@ export class AuthService {
   }
 
   async logout(): Promise<void> {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      // Best effort; the tokens are forgotten either way
+      this.http
+        .post(`${this.API_URL}/logout`, { refresh_token: refreshToken })
+        .subscribe({ error: () => {} });
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     this.currentUserSubject.next(null);
     this.isAuthenticatedSubject.next(false);
     if (this.tokenRefreshTimer) {
@@ -144,6 +160,9 @@ export class AuthService {
 
   private async handleAuthResponse(response: AuthResponse): Promise<void> {
     localStorage.setItem('token', response.access_token);
+    if (response.refresh_token) {
+      localStorage.setItem('refresh_token', response.refresh_token);
+    }
     this.isAuthenticatedSubject.next(true);
     await this.loadUserData();
     this.scheduleTokenRefresh(response.expires_in);
@@ -173,6 +192,13 @@ export class AuthService {
   }
 
   refreshToken(): Observable<AuthResponse> {
+    // Read when the refresh fires: another tab may have rotated it since
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      return this.http.post<AuthResponse>(`${this.API_URL}/refresh`, {
+        refresh_token: refreshToken,
+      });
+    }
     return this.http.post<AuthResponse>(`${this.API_URL}/refresh-token`, {});
   }
 
@@ -5,8 +5,6 @@ import {
   Observable,
   Subject,
   timer,
-  retryWhen,
-  delay,
   takeUntil,
   filter,
   map,
@@ -18,10 +16,17 @@ export type WebSocketMessageType =
   | 'WEIGHT_CREATED'
   | 'WEIGHT_UPDATED'
   | 'WEIGHT_DELETED'
+  | 'WEIGHTS_IMPORTED'
   | 'ANIMAL_CREATED'
   | 'ANIMAL_UPDATED'
   | 'ANIMAL_DELETED'
-  | 'HEARTBEAT';
+  | 'USER_UPDATED'
+  | 'RESYNC_REQUIRED'
+  | 'HEARTBEAT'
+  | 'SUBSCRIBE'
+  | 'UNSUBSCRIBE'
+  | 'PING'
+  | 'PONG';
 
 interface WebSocketMessageData {
   id?: string;
@@ -29,13 +34,17 @@ interface WebSocketMessageData {
   weight?: number;
   date?: string;
   animal?: Animal;
+  animal_ids?: string[];
+  truncated?: boolean;
   created_at?: string;
   updated_at?: string;
 }
 
 export interface WebSocketMessage {
   type: WebSocketMessageType;
+  seq?: number;
   data: WebSocketMessageData;
+  animal_ids?: string[];
 }
 
 @Injectable({
@@ -46,6 +55,13 @@ export class WebSocketService {
   private messageSubject = new Subject<WebSocketMessage>();
   private heartbeatInterval = 30000; // 30 seconds
   private destroy$ = new Subject<void>();
+  // Highest event sequence seen, sent on reconnect to replay missed events
+  private lastSeq: number | null = null;
+  private reconnectDelay = 1000;
+  private closedByClient = false;
+  // Animals the open views listen to, with a count per view; re-sent on
+  // every (re)connect. No subscriptions means all events of the user.
+  private animalSubscriptions = new Map<string, number>();
 
   constructor() {}
 
@@ -56,33 +72,53 @@ export class WebSocketService {
         console.error('No token available for WebSocket connection');
         return;
       }
+      this.closedByClient = false;
+      const query = this.lastSeq !== null ? `?last_seq=${this.lastSeq}` : '';
 
       this.socket = webSocket<WebSocketMessage>({
-        url: `${environment.wsUrl}/${token}`,
+        url: `${environment.wsUrl}/${token}${query}`,
         openObserver: {
           next: () => {
             console.log('WebSocket connected');
             this.startHeartbeat();
+            if (this.animalSubscriptions.size > 0) {
+              this.send({
+                type: 'SUBSCRIBE',
+                data: {},
+                animal_ids: [...this.animalSubscriptions.keys()],
+              });
+            }
           },
         },
         closeObserver: {
           next: () => {
             console.log('WebSocket disconnected');
             this.socket = null;
+            this.scheduleReconnect();
           },
         },
       });
 
-      this.socket
-        .pipe(
-          retryWhen((errors) => errors.pipe(delay(1000))),
-          takeUntil(this.destroy$)
-        )
-        .subscribe({
-          next: (message) => this.messageSubject.next(message),
-          error: (error) => console.error('WebSocket error:', error),
-        });
+      this.socket.pipe(takeUntil(this.destroy$)).subscribe({
+        next: (message) => {
+          if (message.seq != null && message.seq > (this.lastSeq ?? -1)) {
+            this.lastSeq = message.seq;
+          }
+          this.messageSubject.next(message);
+        },
+        error: (error) => console.error('WebSocket error:', error),
+      });
+    }
+  }
+
+  // Reconnect with a fresh URL so the server can replay from lastSeq
+  private scheduleReconnect() {
+    if (this.closedByClient) {
+      return;
     }
+    timer(this.reconnectDelay)
+      .pipe(takeUntil(this.destroy$))
+      .subscribe(() => this.connect());
   }
 
   private startHeartbeat() {
@@ -95,7 +131,33 @@ export class WebSocketService {
       });
   }
 
+  // Only receive events about this animal until unsubscribeFromAnimal()
+  public subscribeToAnimal(animalId: string) {
+    const count = this.animalSubscriptions.get(animalId) ?? 0;
+    this.animalSubscriptions.set(animalId, count + 1);
+    if (count === 0) {
+      this.send({ type: 'SUBSCRIBE', data: {}, animal_ids: [animalId] });
+    }
+  }
+
+  public unsubscribeFromAnimal(animalId: string) {
+    const count = this.animalSubscriptions.get(animalId) ?? 0;
+    if (count > 1) {
+      this.animalSubscriptions.set(animalId, count - 1);
+    } else if (count === 1) {
+      this.animalSubscriptions.delete(animalId);
+      this.send({ type: 'UNSUBSCRIBE', data: {}, animal_ids: [animalId] });
+    }
+  }
+
+  private send(message: WebSocketMessage) {
+    if (this.socket && !this.socket.closed) {
+      this.socket.next(message);
+    }
+  }
+
   public disconnect() {
+    this.closedByClient = true;
     this.destroy$.next();
     this.destroy$.complete();
     if (this.socket) {
@@ -104,6 +166,14 @@ export class WebSocketService {
     }
   }
 
+  // Emits when missed events can no longer be replayed; reload from the API
+  public getResyncRequests(): Observable<void> {
+    return this.messageSubject.pipe(
+      filter((msg) => msg.type === 'RESYNC_REQUIRED'),
+      map(() => undefined)
+    );
+  }
+
   public getAnimalUpdates(): Observable<Animal> {
     return this.messageSubject.pipe(
       filter(
@@ -136,6 +206,15 @@ export class WebSocketService {
     );
   }
 
+  // Animals that received a bulk import; reload their weights. null when
+  // the import touched too many animals to list them all: reload everything
+  public getWeightImports(): Observable<string[] | null> {
+    return this.messageSubject.pipe(
+      filter((msg) => msg.type === 'WEIGHTS_IMPORTED'),
+      map((msg) => (msg.data.truncated ? null : msg.data.animal_ids ?? []))
+    );
+  }
+
   public getWeightDeletions(): Observable<{ id: string; animal_id: string }> {
     return this.messageSubject.pipe(
       filter((msg) => msg.type === 'WEIGHT_DELETED'),